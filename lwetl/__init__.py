@@ -22,11 +22,26 @@ from .input import InputParser
 from .config_parser import print_info
 
 # output formatters
+from .script_writer import ScriptWriter
 from .formatter import TextFormatter, CsvFormatter, XmlFormatter, XlsxFormatter, SqlFormatter, prettify_excel
 
 # uploading data
 from .uploader import UPLOAD_MODE_DRYRUN, UPLOAD_MODE_ROLLBACK, UPLOAD_MODE_COMMIT, UPLOAD_MODE_PIPE, \
-    NativeUploader, ParameterUploader, MultiParameterUploader
+    NativeUploader, ParameterUploader, MultiParameterUploader, MultiRowUploader, \
+    BulkUploader, UpsertUploader, WriteBehindUploader
+from .reject_writer import RejectWriter
+
+# adaptive batch and commit sizes
+from .adaptive import AdaptiveController
+
+# disable indexes and constraints during bulk loads
+from .bulk_mode import BulkLoadMode
+
+# key allocation for integer primary keys
+from .key_allocator import MaxKeyAllocator, HiLoAllocator, SequenceAllocator
+
+# incremental extraction on a watermark column
+from .incremental import IncrementalExtractor
 
 # table imports
 from .table_import import CsvImport, LdifImport, XlsxImport
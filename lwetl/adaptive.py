@@ -0,0 +1,174 @@
+"""
+    Adaptive sizing of upload batches and commits
+
+    The controller measures the throughput of each flush of a batched uploader and tunes the batch size
+    by hill-climbing: the size keeps moving in the same direction while the throughput improves, reverses
+    if it degrades, and grows if there is no significant change. Errors and lock waits halve the batch size.
+    Commits are due on a number of rows, on elapsed time, or on the volume of uncommitted data.
+"""
+
+import re
+
+from datetime import datetime
+
+DEFAULT_MIN_BATCH_SIZE = 10
+DEFAULT_MAX_BATCH_SIZE = 50000
+DEFAULT_STEP = 1.5
+
+# default commit limits
+DEFAULT_BATCHES_PER_COMMIT = 10
+DEFAULT_MAX_COMMIT_ROWS = 500000
+DEFAULT_COMMIT_SECONDS = 10.0
+DEFAULT_COMMIT_BYTES = 64 * 1024 * 1024
+
+# relative change in throughput, which is considered significant
+DEFAULT_TOLERANCE = 0.05
+
+# error messages, which indicate a lock wait or a deadlock
+RE_LOCK_ERROR = re.compile(r'lock|deadlock|timeout|timed out|ORA-00054|ORA-00060|ORA-30006|SQLITE_BUSY',
+                           re.IGNORECASE)
+
+
+def is_lock_error(error) -> bool:
+    """
+    @param error: Exception or str - the error of the database driver
+    @return: bool - True if the error indicates a lock wait or deadlock
+    """
+    return RE_LOCK_ERROR.search(str(error)) is not None
+
+
+class AdaptiveController:
+    """
+    Tunes the batch size of an uploader on the measured throughput, and decides when to commit.
+    """
+
+    def __init__(self, batch_size: int = 1000, min_batch_size: int = DEFAULT_MIN_BATCH_SIZE,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE, step: float = DEFAULT_STEP,
+                 batches_per_commit: int = DEFAULT_BATCHES_PER_COMMIT, max_commit_rows: int = DEFAULT_MAX_COMMIT_ROWS,
+                 commit_seconds: float = DEFAULT_COMMIT_SECONDS, commit_bytes: int = DEFAULT_COMMIT_BYTES,
+                 tolerance: float = DEFAULT_TOLERANCE):
+        """
+        @param batch_size: int - initial batch size
+        @param min_batch_size: int - lower bound of the batch size
+        @param max_batch_size: int - upper bound of the batch size
+        @param step: float - factor by which the batch size is increased or decreased
+        @param batches_per_commit: int - commit after this number of batches of the current size
+        @param max_commit_rows: int - upper bound of the number of rows per commit
+        @param commit_seconds: float - commit when the last commit is older than this number of seconds.
+            Zero or negative: no limit
+        @param commit_bytes: int - commit when the uncommitted data exceeds this number of bytes.
+            Zero or negative: no limit
+        @param tolerance: float - relative change in throughput, which is considered significant
+        """
+        if not (0 < min_batch_size <= max_batch_size):
+            raise ValueError('Illegal batch size bounds: {} - {}'.format(min_batch_size, max_batch_size))
+        if step <= 1.0:
+            raise ValueError('The step must be larger than 1. Found: {}'.format(step))
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.batch_size = self._bounded(batch_size)
+        self.step = step
+        self.batches_per_commit = max(1, batches_per_commit)
+        self.max_commit_rows = max_commit_rows
+        self.commit_seconds = commit_seconds
+        self.commit_bytes = commit_bytes
+        self.tolerance = tolerance
+
+        # +1: increase the batch size, -1: decrease the batch size
+        self.direction = 1
+        self.last_throughput = None
+        self.last_commit = datetime.now()
+
+        # statistics
+        self.flush_count = 0
+        self.error_count = 0
+        self.total_rows = 0
+        self.total_bytes = 0
+        self.total_seconds = 0.0
+
+    def _bounded(self, batch_size) -> int:
+        return int(max(self.min_batch_size, min(self.max_batch_size, batch_size)))
+
+    @property
+    def commit_rows(self) -> int:
+        """
+        @return: int - number of rows per commit
+        """
+        return min(self.batch_size * self.batches_per_commit, max(self.max_commit_rows, self.batch_size))
+
+    def record_flush(self, rows: int, n_bytes: int, seconds: float, error=None, partial: bool = False):
+        """
+        Record the result of a flush and adapt the batch size
+        @param rows: int - number of rows in the flush
+        @param n_bytes: int - (estimated) number of bytes in the flush
+        @param seconds: float - duration of the flush
+        @param error: Exception or None - the error raised by the flush, if any
+        @param partial: bool - the flush was forced before the buffer was full (e.g., by a commit).
+            Partial flushes are not used to tune the batch size
+        """
+        self.flush_count += 1
+        if error is not None:
+            self.error_count += 1
+            self.direction = -1
+            self.last_throughput = None
+            self.batch_size = self._bounded(self.batch_size // 2)
+            return
+
+        self.total_rows += rows
+        self.total_bytes += n_bytes
+        self.total_seconds += seconds
+        if partial or (rows <= 0) or (seconds <= 0.0):
+            return
+
+        throughput = rows / seconds
+        if self.last_throughput is not None:
+            if throughput < self.last_throughput * (1.0 - self.tolerance):
+                self.direction = -self.direction
+            elif throughput < self.last_throughput * (1.0 + self.tolerance):
+                # no significant change: prefer larger batches (less overhead per round-trip)
+                self.direction = 1
+        self.last_throughput = throughput
+        if self.direction > 0:
+            self.batch_size = self._bounded(self.batch_size * self.step)
+        else:
+            self.batch_size = self._bounded(self.batch_size / self.step)
+
+    def record_error(self, error):
+        """
+        Record an error outside a flush (e.g., a commit error). Lock waits and deadlocks halve the batch size
+        @param error: Exception
+        """
+        self.error_count += 1
+        if is_lock_error(error):
+            self.direction = -1
+            self.last_throughput = None
+            self.batch_size = self._bounded(self.batch_size // 2)
+
+    def commit_is_due(self, rows: int, n_bytes: int = 0) -> bool:
+        """
+        @param rows: int - number of uncommitted rows
+        @param n_bytes: int - (estimated) number of uncommitted bytes
+        @return: bool - True if a commit is due
+        """
+        if rows <= 0:
+            return False
+        if rows >= self.commit_rows:
+            return True
+        if (self.commit_bytes > 0) and (n_bytes >= self.commit_bytes):
+            return True
+        return (self.commit_seconds > 0) and \
+            ((datetime.now() - self.last_commit).total_seconds() >= self.commit_seconds)
+
+    def record_commit(self):
+        """
+        Restart the commit timer
+        """
+        self.last_commit = datetime.now()
+
+    def statistics(self) -> str:
+        """
+        @return: str - a summary of the measured throughput
+        """
+        rate = (self.total_rows / self.total_seconds) if self.total_seconds > 0 else 0.0
+        return 'batch size: {}, commit rows: {}, flushes: {}, errors: {}, {:.0f} rows/s'.format(
+            self.batch_size, self.commit_rows, self.flush_count, self.error_count, rate)
@@ -0,0 +1,281 @@
+"""
+    Bulk-load mode: disable non-unique indexes and foreign key constraints during a load
+
+    Before the load the indexes and constraints of the tables are recorded, the statements to restore them
+    are written to a restore script, and they are disabled (or dropped) with dialect-specific DDL:
+    - oracle:     ALTER TABLE ... DISABLE CONSTRAINT, ALTER INDEX ... UNUSABLE
+    - sqlserver:  ALTER TABLE ... NOCHECK CONSTRAINT, ALTER INDEX ... DISABLE
+    - postgresql: the constraints and indexes are dropped and re-created from their definitions
+    - mysql:      foreign_key_checks and unique_checks are switched off for the session
+    - sqlite:     the indexes are dropped and re-created from their definitions
+    Afterwards the indexes are rebuilt (in parallel on separate connections), followed by the constraints.
+    Restored constraints are validated against the loaded data, except for mysql.
+"""
+import logging
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .exceptions import SQLExecuteException, CommitException
+from .jdbc import Jdbc
+from .script_writer import ScriptWriter
+
+# define a logger
+LOGGER = logging.getLogger(os.path.basename(__file__).split('.')[0])
+
+# default number of connections used to rebuild indexes
+DEFAULT_REBUILD_JOBS = 4
+
+KIND_SESSION = 'session'
+KIND_INDEX = 'index'
+KIND_CONSTRAINT = 'constraint'
+
+# queries for the non-unique indexes: (name, table, definition). @TABLES@ is replaced with the parameter list.
+INDEX_QUERIES = {
+    'oracle': '''
+SELECT i.INDEX_NAME, i.TABLE_NAME, NULL
+FROM USER_INDEXES i
+WHERE i.UNIQUENESS = 'NONUNIQUE' AND i.STATUS = 'VALID'
+    AND i.INDEX_TYPE IN ('NORMAL', 'BITMAP', 'FUNCTION-BASED NORMAL')
+    AND NOT EXISTS (SELECT 1 FROM USER_CONSTRAINTS c WHERE c.INDEX_NAME = i.INDEX_NAME)
+    AND UPPER(i.TABLE_NAME) IN (@TABLES@)''',
+    'sqlserver': '''
+SELECT QUOTENAME(i.name), QUOTENAME(OBJECT_NAME(i.object_id)), NULL
+FROM sys.indexes i
+WHERE i.is_unique = 0 AND i.is_disabled = 0 AND i.type = 2 AND i.is_primary_key = 0
+    AND UPPER(OBJECT_NAME(i.object_id)) IN (@TABLES@)''',
+    'postgresql': '''
+SELECT quote_ident(i.relname), quote_ident(t.relname), pg_get_indexdef(i.oid)
+FROM pg_index x
+    INNER JOIN pg_class i ON i.oid = x.indexrelid
+    INNER JOIN pg_class t ON t.oid = x.indrelid
+    INNER JOIN pg_namespace n ON n.oid = t.relnamespace
+WHERE NOT x.indisunique AND NOT x.indisprimary AND n.nspname = current_schema()
+    AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)
+    AND UPPER(t.relname) IN (@TABLES@)''',
+    'sqlite': '''
+SELECT name, tbl_name, sql
+FROM sqlite_master
+WHERE type = 'index' AND sql IS NOT NULL AND UPPER(sql) NOT LIKE 'CREATE UNIQUE%'
+    AND UPPER(tbl_name) IN (@TABLES@)'''
+}
+
+# queries for the enabled foreign key constraints of the tables: (name, table, definition)
+CONSTRAINT_QUERIES = {
+    'oracle': '''
+SELECT CONSTRAINT_NAME, TABLE_NAME, NULL
+FROM USER_CONSTRAINTS
+WHERE CONSTRAINT_TYPE = 'R' AND STATUS = 'ENABLED' AND UPPER(TABLE_NAME) IN (@TABLES@)''',
+    'sqlserver': '''
+SELECT QUOTENAME(fk.name), QUOTENAME(OBJECT_NAME(fk.parent_object_id)), NULL
+FROM sys.foreign_keys fk
+WHERE fk.is_disabled = 0 AND UPPER(OBJECT_NAME(fk.parent_object_id)) IN (@TABLES@)''',
+    'postgresql': '''
+SELECT quote_ident(c.conname), quote_ident(t.relname), pg_get_constraintdef(c.oid)
+FROM pg_constraint c
+    INNER JOIN pg_class t ON t.oid = c.conrelid
+    INNER JOIN pg_namespace n ON n.oid = t.relnamespace
+WHERE c.contype = 'f' AND n.nspname = current_schema() AND UPPER(t.relname) IN (@TABLES@)'''
+}
+
+# statements (disable, restore) of an index: name, table, definition
+INDEX_STATEMENTS = {
+    'oracle': ('ALTER INDEX {0} UNUSABLE', 'ALTER INDEX {0} REBUILD'),
+    'sqlserver': ('ALTER INDEX {0} ON {1} DISABLE', 'ALTER INDEX {0} ON {1} REBUILD'),
+    'postgresql': ('DROP INDEX {0}', '{2}'),
+    'sqlite': ('DROP INDEX {0}', '{2}')
+}
+
+# statements (disable, restore) of a foreign key constraint: name, table, definition
+CONSTRAINT_STATEMENTS = {
+    'oracle': ('ALTER TABLE {1} DISABLE CONSTRAINT {0}', 'ALTER TABLE {1} ENABLE CONSTRAINT {0}'),
+    'sqlserver': ('ALTER TABLE {1} NOCHECK CONSTRAINT {0}', 'ALTER TABLE {1} WITH CHECK CHECK CONSTRAINT {0}'),
+    'postgresql': ('ALTER TABLE {1} DROP CONSTRAINT {0}', 'ALTER TABLE {1} ADD CONSTRAINT {0} {2}')
+}
+
+# session settings (disable, restore)
+SESSION_STATEMENTS = {
+    'mysql': [('SET foreign_key_checks = 0', 'SET foreign_key_checks = 1'),
+              ('SET unique_checks = 0', 'SET unique_checks = 1')]
+}
+
+
+class BulkLoadMode:
+    """
+    Disables the non-unique indexes and the foreign key constraints of a set of tables during a bulk load.
+    Use as a context manager, or call disable() and restore() in a try-finally block.
+    The tables must not be modified by other processes during the load.
+    """
+
+    def __init__(self, jdbc: Jdbc, tables: (str, list), restore_file: str = None, jobs: int = DEFAULT_REBUILD_JOBS):
+        """
+        @param jdbc: Jdbc - connection used for the load. Session settings (mysql) only apply to this connection
+        @param tables: str or list - (comma-separated) names of the tables
+        @param restore_file: str - file for the restore statements. Written before the first index or constraint
+            is disabled, and removed after a successful restore. If the restore fails, it holds the failed
+            statements.
+        @param jobs: int - number of connections used to rebuild the indexes
+        """
+        if isinstance(tables, str):
+            tables = [t.strip() for t in tables.split(',') if len(t.strip()) > 0]
+        self.jdbc = jdbc
+        self.tables = [t.upper() for t in tables]
+        self.restore_file = restore_file
+        self.jobs = max(1, jobs)
+        # tuples (kind, disable sql, restore sql) of the disabled items
+        self.disabled = []
+
+    def __enter__(self):
+        self.disable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.restore()
+        except SQLExecuteException as restore_error:
+            if exc_type is None:
+                raise
+            LOGGER.error(restore_error)
+
+    def _query(self, queries: dict) -> list:
+        sql = queries.get(self.jdbc.type, None)
+        if (sql is None) or (len(self.tables) == 0):
+            return []
+        sql = sql.replace('@TABLES@', ','.join(['?'] * len(self.tables)))
+        return [tuple(r) for r in self.jdbc.query(sql, self.tables)]
+
+    def items(self) -> list:
+        """
+        @return: list of tuples (kind, disable sql, restore sql) of the session settings, indexes, and
+            foreign key constraints, which are disabled by this class
+        """
+        db_type = self.jdbc.type
+        items = [(KIND_SESSION, d, r) for d, r in SESSION_STATEMENTS.get(db_type, [])]
+        for kind, queries, statements in [(KIND_INDEX, INDEX_QUERIES, INDEX_STATEMENTS),
+                                          (KIND_CONSTRAINT, CONSTRAINT_QUERIES, CONSTRAINT_STATEMENTS)]:
+            for name, table, definition in self._query(queries):
+                disable_sql, restore_sql = statements[db_type]
+                items.append((kind, disable_sql.format(name, table, definition),
+                              restore_sql.format(name, table, definition)))
+        return items
+
+    def apply_session(self, jdbc: Jdbc):
+        """
+        Apply the disabled session settings (mysql) to another connection of the load
+        @param jdbc: Jdbc - the connection
+        """
+        for item in [item for item in self.disabled if item[0] == KIND_SESSION]:
+            jdbc.execute(item[1], cursor=None)
+        jdbc.commit()
+
+    def _write_restore_file(self, items: list):
+        if self.restore_file is None:
+            return
+        if len(items) == 0:
+            if os.path.isfile(self.restore_file):
+                os.remove(self.restore_file)
+            return
+        with ScriptWriter(self.restore_file) as writer:
+            # session settings are lost with the connection
+            writer.write_statements([item[2] for item in items if item[0] != KIND_SESSION])
+
+    def disable(self):
+        """
+        Record and disable the indexes and constraints. Commits the current transaction.
+        If disabling fails, the items disabled so far are restored.
+        @raise SQLExecuteException: on failure
+        """
+        self.jdbc.commit()
+        items = self.items()
+        self._write_restore_file(items + self.disabled)
+        try:
+            for item in items:
+                self.jdbc.execute(item[1], cursor=None)
+                self.disabled.append(item)
+                LOGGER.info(item[1])
+            self.jdbc.commit()
+        except (SQLExecuteException, CommitException) as disable_error:
+            self.jdbc.rollback()
+            LOGGER.error(disable_error)
+            self.restore()
+            raise SQLExecuteException('Bulk mode failed: {}'.format(disable_error))
+
+    def _execute(self, jdbc: Jdbc, sql: str):
+        """
+        @return: str - the error message, or None on success
+        """
+        try:
+            jdbc.execute(sql, cursor=None)
+            jdbc.commit()
+            LOGGER.info(sql)
+            return None
+        except (SQLExecuteException, CommitException) as restore_error:
+            jdbc.rollback()
+            return '{}: {}'.format(sql, restore_error)
+
+    def _rebuild(self, statements: list) -> list:
+        """
+        Rebuild indexes on separate connections. Statements of a connection, which cannot be opened,
+        are executed on the main connection.
+        @param statements: list of str - the restore statements
+        @return: list of (statement, error message) of the failed statements
+        """
+        def rebuild(part: list) -> tuple:
+            try:
+                con = Jdbc(self.jdbc.login)
+            except Exception as connect_error:
+                LOGGER.warning(connect_error)
+                return part, []
+            try:
+                return [], [(sql, error) for sql, error in [(sql, self._execute(con, sql)) for sql in part]
+                            if error is not None]
+            finally:
+                con.close()
+
+        jobs = min(self.jobs, len(statements))
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(rebuild, [statements[x::jobs] for x in range(jobs)]))
+
+        failures = []
+        for pending, failed in results:
+            failures += failed
+            for sql in pending:
+                error = self._execute(self.jdbc, sql)
+                if error is not None:
+                    failures.append((sql, error))
+        return failures
+
+    def restore(self):
+        """
+        Restore the disabled items: session settings, then indexes (in parallel), then constraints.
+        All items are attempted, also if some fail.
+        @raise SQLExecuteException: if one or more items could not be restored. The failed statements
+            remain in the restore file.
+        """
+        if len(self.disabled) == 0:
+            return
+        # pending changes of the load
+        self.jdbc.commit()
+
+        failures = []
+        for kind in [KIND_SESSION, KIND_INDEX, KIND_CONSTRAINT]:
+            statements = [item[2] for item in self.disabled if item[0] == kind]
+            if (kind == KIND_INDEX) and (self.jobs > 1) and (len(statements) > 1):
+                failures += self._rebuild(statements)
+                continue
+            for sql in statements:
+                error = self._execute(self.jdbc, sql)
+                if error is not None:
+                    failures.append((sql, error))
+
+        failed = [sql for sql, _ in failures]
+        self.disabled = [item for item in self.disabled if item[2] in failed]
+        self._write_restore_file(self.disabled)
+        if len(failures) > 0:
+            for _, error in failures:
+                LOGGER.error(error)
+            msg = 'Failed to restore {} indexes or constraints: {}'.format(
+                len(failures), '; '.join([error for _, error in failures]))
+            if self.restore_file is not None:
+                msg += '. See: ' + self.restore_file
+            raise SQLExecuteException(msg)
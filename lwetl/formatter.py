@@ -21,6 +21,7 @@ from openpyxl.styles import NamedStyle, Font, Border, Side, Alignment
 from openpyxl.styles.fills import PatternFill
 
 from .jdbc import Jdbc, DummyJdbc, PARENT_CONNECTION, COLUMN_TYPE_DATE, get_columns_of_cursor
+from .script_writer import ScriptWriter
 from .uploader import NativeUploader, UPLOAD_MODE_PIPE
 from .utils import *
 
@@ -536,6 +537,11 @@ class SqlFormatter(Formatter):
         self.columns = kwargs.get('columns', None)
         self.database_type = kwargs.get('type', None)
 
+        # options of the ScriptWriter for file output
+        self.compression = kwargs.get('compression', None)
+        self.max_bytes = kwargs.get('max_bytes', 0)
+        self.max_statements = kwargs.get('max_statements', 0)
+
         self.uploader = None
 
     def __call__(self, *args, **kwargs):
@@ -550,7 +556,23 @@ class SqlFormatter(Formatter):
     def open(self, *args, **kwargs):
         target_columns = kwargs.get('columns', self.columns)
         db_type = kwargs.get('type', self.database_type)
+
+        # file output is handled by a ScriptWriter (buffered, optionally compressed and rotated)
+        filename_or_stream = kwargs.get('filename_or_stream', self.filename_or_stream)
+        if filename_or_stream is None:
+            filename_or_stream = self.fname
+        fname = parse_output_selector(filename_or_stream)[1]
+        if fname is not None:
+            kwargs['filename_or_stream'] = sys.stdout
         super(SqlFormatter, self).open(*args, **kwargs)
+        if fname is None:
+            self.fstream = ScriptWriter(self.fstream)
+        else:
+            self.fname = fname
+            self.fstream = ScriptWriter(fname, compression=kwargs.get('compression', self.compression),
+                                        max_bytes=kwargs.get('max_bytes', self.max_bytes),
+                                        max_statements=kwargs.get('max_statements', self.max_statements),
+                                        append=verified_boolean(kwargs.get('append', self.append)))
 
         connection = kwargs.get('connection', self.jdbc)
         if not isinstance(connection, Jdbc):
@@ -567,13 +589,20 @@ class SqlFormatter(Formatter):
         if db_type is None:
             db_type = connection.type
 
-        self.uploader = NativeUploader(connection, t_name, fstream=None, commit_mode=UPLOAD_MODE_PIPE,
+        # the uploader streams each statement to the ScriptWriter
+        self.uploader = NativeUploader(connection, t_name, fstream=self.fstream, commit_mode=UPLOAD_MODE_PIPE,
                                        columns=target_columns, type=db_type)
         return self
 
     def close(self):
         self.uploader = None
+        script_writer = self.fstream
+        if isinstance(script_writer, ScriptWriter):
+            script_writer.flush()
         super(SqlFormatter, self).close()
+        if isinstance(script_writer, ScriptWriter) and (self.fname is None):
+            # keep the wrapped stream for a re-open
+            self.fstream = script_writer.stream
 
     def header(self):
         pass
@@ -589,6 +618,3 @@ class SqlFormatter(Formatter):
             if not is_empty(value):
                 dd[column_name] = value
         self.uploader.insert(dd)
-        sql_list = self.uploader.commit()
-        if self.fstream is not None:
-            print(';\n'.join(sql_list) + ';', file=self.fstream)
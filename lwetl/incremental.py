@@ -0,0 +1,199 @@
+"""
+    Incremental extraction of the rows of a table, which were inserted or changed since the previous run
+
+    Rows are selected on a monotonic watermark column (a timestamp or a sequence number). The highest
+    watermark of each job is kept in a local state file (JSON). An overlap window re-reads the rows just below
+    the watermark, to catch rows of transactions, which committed late. Rows of the overlap window, which
+    were extracted before without changes, are skipped.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+from collections import OrderedDict, deque
+from datetime import date, datetime, timedelta
+
+from .jdbc import Jdbc
+from .utils import value_to_json, json_to_value
+
+# define a logger
+LOGGER = logging.getLogger(os.path.basename(__file__).split('.')[0])
+
+DEFAULT_STATE_FILE = 'lwetl-incremental.json'
+
+
+def _fingerprint(values) -> str:
+    return hashlib.md5(json.dumps(list(values), default=str).encode('utf-8')).hexdigest()
+
+
+class IncrementalExtractor:
+    """
+    Extracts the new and changed rows of a table since the previous run of the same job.
+    Usage:
+        extractor = IncrementalExtractor(jdbc, 'ORDERS', 'UPDATED_AT', overlap=60)
+        cursor = extractor.execute()
+        for row in extractor.get_data(cursor):
+            ... (write to a formatter, or upload)
+        extractor.save()
+    The watermark is only stored by save(): a failed run is repeated in full by the next run.
+    """
+
+    def __init__(self, jdbc: Jdbc, table: str, watermark_column: str, state_file: str = DEFAULT_STATE_FILE,
+                 job: str = None, overlap=0, columns=None, where: str = None):
+        """
+        @param jdbc: Jdbc - database connection
+        @param table: str - name of the table
+        @param watermark_column: str - a column, which increases on every insert or update
+            (e.g., a modification timestamp or a sequence number)
+        @param state_file: str - the JSON file with the watermarks of the jobs. Shared by multiple jobs
+        @param job: str - name of the job in the state file. Defaults to <table>.<watermark_column>
+        @param overlap: int, float or timedelta - the overlap window below the watermark. Seconds for
+            timestamp columns, the units of the column otherwise. Defaults to 0 (no overlap)
+        @param columns: list or comma-separated str of the extracted columns. Defaults to all columns
+        @param where: str - an additional condition on the rows (without WHERE)
+        """
+        if not isinstance(jdbc, Jdbc):
+            raise ValueError('Jdbc connection of wrong type. Expected Jdbc, found: ' + type(jdbc).__name__)
+        self.jdbc = jdbc
+        self.table = table
+        self.watermark_column = watermark_column
+        self.state_file = state_file
+        self.job = job if job is not None else '{}.{}'.format(table, watermark_column).lower()
+        self.overlap = overlap
+        if isinstance(columns, (list, tuple)):
+            columns = ', '.join(columns)
+        self.columns = columns if columns else '*'
+        self.where = where
+
+        # state of the previous run
+        self.watermark = None
+        self.seen = set()
+        self.load()
+
+        # state of the current run
+        self.new_watermark = self.watermark
+        self.window = deque()
+        self.row_count = 0
+        self.skip_count = 0
+
+    def load(self):
+        """
+        Read the state of the job from the state file
+        """
+        state = self._read_states().get(self.job, dict())
+        self.watermark = json_to_value(state.get('watermark', dict()))
+        self.seen = set(state.get('seen', []))
+        if self.watermark is not None:
+            LOGGER.info('Job {}: watermark {} = {}'.format(self.job, self.watermark_column, self.watermark))
+
+    def _read_states(self) -> dict:
+        if (self.state_file is None) or (not os.path.isfile(self.state_file)):
+            return dict()
+        with open(self.state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self):
+        """
+        Store the watermark of the extracted rows in the state file. Call after the rows are processed
+        """
+        self.watermark = self.new_watermark
+        self.seen = set([fingerprint for _, fingerprint in self.window])
+        if self.state_file is None:
+            return
+        states = self._read_states()
+        states[self.job] = {
+            'table': self.table,
+            'column': self.watermark_column,
+            'watermark': value_to_json(self.watermark),
+            'seen': sorted(self.seen),
+            'saved': datetime.now().isoformat()
+        }
+        # replace the file in a single step: a crash does not leave a truncated state file
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(states, f, indent=2)
+        os.replace(tmp_file, self.state_file)
+
+    def lower_bound(self, watermark=None):
+        """
+        @param watermark: the watermark. Defaults to the watermark of the previous run
+        @return: the watermark minus the overlap window, or None if there is no watermark
+        """
+        if watermark is None:
+            watermark = self.watermark
+        if (watermark is None) or (not self.overlap):
+            return watermark
+        overlap = self.overlap
+        if isinstance(watermark, (datetime, date)) and (not isinstance(overlap, timedelta)):
+            overlap = timedelta(seconds=overlap)
+        return watermark - overlap
+
+    def sql(self) -> (str, list):
+        """
+        @return: tuple (str - the query of the new and changed rows, list - the parameters)
+        """
+        conditions = []
+        parameters = []
+        low = self.lower_bound()
+        if low is not None:
+            conditions.append('{} > ?'.format(self.watermark_column))
+            parameters.append(low)
+        if self.where:
+            conditions.append('(' + self.where + ')')
+        sql = 'SELECT {} FROM {}'.format(self.columns, self.table)
+        if len(conditions) > 0:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        return sql + ' ORDER BY ' + self.watermark_column, parameters if len(parameters) > 0 else None
+
+    def execute(self):
+        """
+        Query the new and changed rows
+        @return: Cursor - cursor of the query, see get_data()
+        """
+        sql, parameters = self.sql()
+        self.new_watermark = self.watermark
+        self.window = deque()
+        self.row_count = 0
+        self.skip_count = 0
+        return self.jdbc.execute(sql, parameters, cursor=None)
+
+    def get_data(self, cursor=None, return_type=tuple, array_size: int = 1000):
+        """
+        Iterate over the new and changed rows. Rows of the overlap window, which were extracted before,
+        are skipped.
+        @param cursor: Cursor - the cursor returned by execute(). Executes the query, if not specified
+        @param return_type: tuple (default), list, dict, or OrderedDict
+        @param array_size: int - the buffer size
+        @return: iterator of the rows
+        """
+        if return_type not in [tuple, list, dict, OrderedDict]:
+            raise ValueError('Return type not supported: {}'.format(return_type))
+        if cursor is None:
+            cursor = self.execute()
+        column = None
+        for row in self.jdbc.get_data(cursor, return_type=OrderedDict, include_none=True, array_size=array_size):
+            if column is None:
+                column = [c for c in row.keys() if c.upper() == self.watermark_column.upper()]
+                if len(column) == 0:
+                    raise ValueError('Watermark column {} not found in the extracted columns.'.format(
+                        self.watermark_column))
+                column = column[0]
+            watermark = row[column]
+            fingerprint = _fingerprint(row.values())
+            if watermark is not None:
+                if (self.new_watermark is None) or (watermark > self.new_watermark):
+                    self.new_watermark = watermark
+                    low = self.lower_bound(watermark)
+                    while (len(self.window) > 0) and (self.window[0][0] <= low):
+                        self.window.popleft()
+                self.window.append((watermark, fingerprint))
+            if fingerprint in self.seen:
+                self.skip_count += 1
+                continue
+            self.row_count += 1
+            if return_type in [dict, OrderedDict]:
+                yield row if return_type == OrderedDict else dict(row)
+            else:
+                yield return_type(row.values())
@@ -8,7 +8,7 @@ import os
 from collections import OrderedDict
 from decimal import Decimal, InvalidOperation
 
-from jpype import JPackage
+from jpype import JPackage, JArray, JString
 from jaydebeapi import Cursor, Error, DatabaseError, connect
 
 from typing import List, Union
@@ -16,6 +16,7 @@ from typing import List, Union
 from .config_parser import JDBC_DRIVERS, JAR_FILES, parse_login, parse_dummy_login
 from .exceptions import DriverNotFoundException, SQLExecuteException, CommitException
 from .runtime_statistics import RuntimeStatistics
+from .temporal import TemporalConverter, ZONE_LOCAL, check_zone
 from .utils import *
 
 # define a logger
@@ -24,6 +25,12 @@ LOGGER = logging.getLogger(os.path.basename(__file__).split('.')[0])
 # marker (attribute) to trace chained connections
 PARENT_CONNECTION = '_lwetl_jdbc'
 
+# attribute of the cursor with the update count of each row of the last executemany
+UPDATE_COUNTS = '_lwetl_update_counts'
+
+# attribute of the cursor with the keys generated by the last execution, see Jdbc.execute(key_columns=...)
+GENERATED_KEYS = '_lwetl_generated_keys'
+
 # Handled column types
 COLUMN_TYPE_NUMBER = 'number'
 COLUMN_TYPE_FLOAT = 'float'
@@ -120,6 +127,40 @@ def get_columns_of_cursor(cursor: Cursor) -> OrderedDict:
     return columns
 
 
+# noinspection PyProtectedMember
+def execute_many(cursor: Cursor, sql: str, seq_of_parameters, key_columns: list = None) -> list:
+    """
+    Variant of Cursor.executemany, which preserves the update count of each parameter row
+    @param cursor: Cursor - the cursor to execute on
+    @param sql: str - parameterized sql
+    @param seq_of_parameters: iterable of parameter rows
+    @param key_columns: list - names of the columns with generated keys (identity columns). If specified,
+        the generated (integer) keys are stored in the cursor attribute GENERATED_KEYS
+    @return: list of int - the update count per row. Drivers, which execute successfully but cannot
+        report the count, return a negative number (java.sql.Statement.SUCCESS_NO_INFO)
+    """
+    cursor._close_last()
+    if key_columns:
+        cursor._prep = cursor._connection.jconn.prepareStatement(sql, JArray(JString)(key_columns))
+    else:
+        cursor._prep = cursor._connection.jconn.prepareStatement(sql)
+    for parameters in seq_of_parameters:
+        cursor._set_stmt_parms(cursor._prep, parameters)
+        cursor._prep.addBatch()
+    update_counts = [int(n) for n in cursor._prep.executeBatch()]
+    cursor.rowcount = sum([(n if n >= 0 else 1) for n in update_counts])
+    generated_keys = None
+    if key_columns:
+        generated_keys = []
+        rs = cursor._prep.getGeneratedKeys()
+        while rs.next():
+            generated_keys.append(int(rs.getLong(1)))
+        rs.close()
+    setattr(cursor, GENERATED_KEYS, generated_keys)
+    cursor._close_last()
+    return update_counts
+
+
 class DataTransformer:
     """
         Row types returned by jaydebeapi are not always of a python compatible type.
@@ -128,7 +169,7 @@ class DataTransformer:
 
     # noinspection PyProtectedMember
     def __init__(self, cursor: Cursor, return_type=tuple, upper_case: bool = True, include_none: bool = False,
-                 database_type: Union[str, None] = None):
+                 database_type: Union[str, None] = None, zone: str = ZONE_LOCAL):
         """
         Instantiate a DataTransformer
 
@@ -140,6 +181,7 @@ class DataTransformer:
         @param include_none: bool - include None values in dictionary return types. Defaults to False
         @param database_type: str - indicating the database type (oracle, mysql, sqlite). Used to bypass
             non-default behaviour of jdbc drivers.
+        @param zone: str - zone policy for java timestamps, see lwetl.temporal. Defaults to local
         @return DataTransformer
 
         @raise ValueError if the cursor has no data
@@ -152,10 +194,15 @@ class DataTransformer:
         elif cursor.description is None:
             raise ValueError('Cannot create a DataTransformer on a cursor without data.')
 
+        self.temporal = TemporalConverter(zone)
         self.standard_transformers = {
             'oracle.sql.BLOB': self.oracle_lob_to_bytes,
             'oracle.sql.CLOB': self.oracle_clob,
             'java.lang.Integer': (lambda v: int(v.toString())),
+            'java.sql.Timestamp': self.temporal.from_java,
+            'java.sql.Date': self.temporal.from_java,
+            'java.time.LocalDateTime': self.temporal.from_java,
+            'java.time.LocalDate': self.temporal.from_java,
             'byte[]': self.byte_array_to_bytes
         }
 
@@ -255,9 +302,8 @@ class DataTransformer:
     @staticmethod
     def parse_date(date):
         try:
-            d = dt_parse(date)
-            return d
-        except ValueError:
+            return parse_datetime(date)
+        except (ValueError, OverflowError):
             pass
         return date
 
@@ -374,15 +420,25 @@ class DummyJdbc:
     Only stores configuration parameters of the connection, there is no real connection
     """
 
-    def __init__(self, login_or_driver_type: str, upper_case=True):
+    def __init__(self, login_or_driver_type: str, upper_case=True, zone: str = ZONE_LOCAL):
         self.login = 'nobody'
         self.upper_case = upper_case
+        self.zone = check_zone(zone)
         self.type, self.always_escape = parse_dummy_login(login_or_driver_type)
 
     def commit(self):
         pass
 
-    def rollback(self):
+    # noinspection PyUnusedLocal
+    def rollback(self, savepoint=None):
+        pass
+
+    # noinspection PyMethodMayBeStatic
+    def set_savepoint(self):
+        return None
+
+    # noinspection PyUnusedLocal
+    def release_savepoint(self, savepoint):
         pass
 
     # noinspection PyUnusedLocal,PyMethodMayBeStatic
@@ -402,18 +458,21 @@ class Jdbc:
 
     """
 
-    def __init__(self, login: str, auto_commit=False, upper_case=True):
+    def __init__(self, login: str, auto_commit=False, upper_case=True, zone: str = ZONE_LOCAL):
         """
         Init the jdbc connection.
         @param login: str - login credentials or alias as defined in config.yml
         @param auto_commit: bool - auto-commit each sql statement. Defaults to False
                                    (changes are only committed with the jdbc.commit() command)
         @param upper_case: bool
+        @param zone: str - zone policy of the timestamps in query results, and the default of the uploaders:
+                           'local' (default) or 'utc', see lwetl.temporal
         @raises (ConnectionError,DriverNotFoundException) if het connection could not be established
         """
         self.login = login
         self.auto_commit = verified_boolean(auto_commit)
         self.upper_case = verified_boolean(upper_case)
+        self.zone = check_zone(zone)
         self.connection = None
 
         self.credentials, self.type, self.schema, self.url, self.always_escape = parse_login(login)
@@ -508,7 +567,7 @@ class Jdbc:
     def execute(self, sql: str, parameters: Union[list, tuple] = None,
                 cursor: Union[Cursor, None] = None,
                 use_current_cursor: bool = True, keep_cursor: bool = False,
-                strip_semi_colon: bool = True) -> Cursor:
+                strip_semi_colon: bool = True, key_columns: list = None) -> Cursor:
         """
         Execute a query
         @param sql: str query to execute
@@ -518,6 +577,9 @@ class Jdbc:
         @param use_current_cursor: if set to False, a None cursor will trigger the creation of a new cursor.
             Otherwise, the default cursor will be used, if present.
         @param keep_cursor: if set to true, the cursor will not be closed upon a commit or rollback.
+        @param strip_semi_colon: remove trailing semi-colons from the sql (default)
+        @param key_columns: list of the (identity) columns, which are generated on insert. If specified, the generated
+            keys are stored in the cursor attribute GENERATED_KEYS
         @return: Cursor of the execution
 
         @raise SQLExecutionException on an execution exception
@@ -576,9 +638,17 @@ class Jdbc:
                 if isinstance(parameters, (list, tuple)) and (len(parameters) > 0) and (
                         isinstance(parameters[0], (list, tuple, dict))):
                     stt.add_exec_count(len(parameters))
-                    cursor.executemany(sql, [string2java_string(p) for p in parameters])
+                    # generator: do not copy the (possibly large) parameter buffer
+                    setattr(cursor, UPDATE_COUNTS,
+                            execute_many(cursor, sql, (string2java_string(p) for p in parameters), key_columns))
+                elif key_columns:
+                    stt.add_exec_count()
+                    execute_many(cursor, sql, [string2java_string(parameters or [])], key_columns)
+                    setattr(cursor, UPDATE_COUNTS, None)
                 else:
                     stt.add_exec_count()
+                    setattr(cursor, UPDATE_COUNTS, None)
+                    setattr(cursor, GENERATED_KEYS, None)
                     if parameters is None:
                         cursor.execute(string2java_string(sql), None)
                     else:
@@ -645,7 +715,7 @@ class Jdbc:
         row_count = 0
         transformer = DataTransformer(
             cursor, return_type=return_type, upper_case=self.upper_case, include_none=include_none,
-            database_type=self.type)
+            database_type=self.type, zone=self.zone)
         while True:
             batch_nr += 1
             fetch_error = None
@@ -691,16 +761,42 @@ class Jdbc:
         if commit_error is not None:
             raise CommitException(str(commit_error))
 
-    def rollback(self):
+    def rollback(self, savepoint=None):
         """
         Roll-back the current transaction. This will affect all open cursors.
         All open cursors are closed (also in auto-commit mode)
+        @param savepoint: java.sql.Savepoint - only roll back the changes after this savepoint,
+            see set_savepoint(). The transaction and the cursors remain open.
         """
 
+        if savepoint is not None:
+            self.connection.jconn.rollback(savepoint)
+            return
         if not self.auto_commit:
             self.connection.rollback()
         self.close_all_cursors()
 
+    def set_savepoint(self):
+        """
+        Set a savepoint in the current transaction
+        @return: java.sql.Savepoint, or None in auto-commit mode
+        """
+        if self.auto_commit:
+            return None
+        return self.connection.jconn.setSavepoint()
+
+    def release_savepoint(self, savepoint):
+        """
+        Release a savepoint. Ignored if not supported by the driver (e.g., oracle)
+        @param savepoint: java.sql.Savepoint or None
+        """
+        if (savepoint is None) or (self.type == 'oracle'):
+            return
+        try:
+            self.connection.jconn.releaseSavepoint(savepoint)
+        except Exception as release_error:
+            LOGGER.debug(release_error)
+
     def query(self, sql: str, parameters=None, return_type=tuple, max_rows=0, array_size=1000, include_none=False):
         """
         Send an SQL to the database and return rows of results
@@ -0,0 +1,267 @@
+"""
+    Allocation of integer primary keys for uploads
+
+    Keys are reserved on the database in blocks and handed out from memory. All allocators are thread-safe.
+    The HiLoAllocator and the SequenceAllocator are also safe for concurrent uploads from different processes.
+"""
+import logging
+import os
+import threading
+
+from abc import ABC, abstractmethod
+from collections import deque
+
+from .exceptions import SQLExecuteException
+from .jdbc import Jdbc, DummyJdbc
+
+# define a logger
+LOGGER = logging.getLogger(os.path.basename(__file__).split('.')[0])
+
+# default number of keys reserved per database round-trip
+DEFAULT_BLOCK_SIZE = 100
+
+# name of the table with the next free key of each table and column, see HiLoAllocator
+ALLOCATION_TABLE = 'LWETL_KEY_ALLOCATION'
+
+# type of the key column in the allocation table
+ALLOCATION_KEY_TYPE = {
+    'oracle': 'NUMBER(19)',
+    'sqlite': 'INTEGER'
+}
+DEFAULT_ALLOCATION_KEY_TYPE = 'BIGINT'
+
+# queries to retrieve a number of sequence values in a single round-trip, see sequence_query()
+# sqlserver does not allow NEXT VALUE FOR with TOP or ORDER BY: the rows are generated from digit tables
+SEQUENCE_QUERIES = {
+    'oracle': 'SELECT {0}.NEXTVAL FROM dual CONNECT BY LEVEL <= {1}',
+    'postgresql': "SELECT nextval('{0}') FROM generate_series(1, {1})",
+    'sqlserver': 'SELECT NEXT VALUE FOR {0} FROM {2} WHERE {3} < {1}'
+}
+DIGIT_TABLE = '(VALUES (0),(1),(2),(3),(4),(5),(6),(7),(8),(9)) D{0}(N)'
+
+# MaxKeyAllocator instances shared by all uploaders of this process
+# Structure:
+# login->table->column_name
+KEY_ALLOCATORS = dict()
+KEY_ALLOCATORS_LOCK = threading.Lock()
+
+
+def sequence_query(db_type: str, sequence: str, n: int) -> str:
+    """
+    @param db_type: str - the database type, see SEQUENCE_QUERIES
+    @param sequence: str - name of the sequence
+    @param n: int - number of sequence values
+    @return: str - the query of n values of the sequence
+    """
+    digits = range(len(str(max(1, n - 1))))
+    tables = ' CROSS JOIN '.join([DIGIT_TABLE.format(x) for x in digits])
+    number = ' + '.join(['D{}.N'.format(x) if x == 0 else '{} * D{}.N'.format(10 ** x, x) for x in digits])
+    return SEQUENCE_QUERIES[db_type].format(sequence, n, tables, number)
+
+
+class KeyAllocator(ABC):
+    """
+    Base class of the key allocators. Sub-classes implement _reserve()
+    """
+
+    def __init__(self, block_size: int = DEFAULT_BLOCK_SIZE):
+        """
+        @param block_size: int - number of keys reserved per round-trip to the database
+        """
+        if (not isinstance(block_size, int)) or (block_size < 1):
+            raise ValueError('block_size must be a positive integer. Found: {}'.format(block_size))
+        self.block_size = block_size
+        self.keys = deque()
+        self.lock = threading.Lock()
+        # number of reservations on the database
+        self.round_trips = 0
+        # the last key handed out
+        self.current_key = None
+
+    @abstractmethod
+    def _reserve(self, n: int):
+        """
+        Reserve keys on the database
+        @param n: int - the requested number of keys
+        @return: iterable of int - the reserved keys in ascending order
+        """
+        pass
+
+    def next_key(self) -> int:
+        """
+        @return: int - the next free key
+        """
+        with self.lock:
+            if len(self.keys) == 0:
+                self.keys.extend(self._reserve(self.block_size))
+                self.round_trips += 1
+            self.current_key = self.keys.popleft()
+            return self.current_key
+
+    def current(self):
+        """
+        Peek at the allocator without a reservation
+        @return: int - the last key handed out by next_key(), or None before the first key
+        """
+        with self.lock:
+            return self.current_key
+
+
+class MaxKeyAllocator(KeyAllocator):
+    """
+    Queries the maximum value of the column once, then increments in memory.
+    Thread-safe, but not safe for concurrent uploads from other processes.
+    """
+
+    def __init__(self, jdbc: (Jdbc, DummyJdbc), table: str, column: str, block_size: int = 1000):
+        super(MaxKeyAllocator, self).__init__(block_size)
+        self.jdbc = jdbc
+        self.table = table
+        self.column = column
+        self.last_key = None
+
+    def _reserve(self, n: int):
+        if self.last_key is None:
+            self.last_key = self.jdbc.get_int('SELECT MAX({}) FROM {}'.format(self.column, self.table))
+        first = self.last_key + 1
+        self.last_key += n
+        return range(first, self.last_key + 1)
+
+    def current(self) -> int:
+        """
+        Peek at the allocator without a reservation
+        @return: int - the last key handed out by next_key(), or the maximum of the column before the first key
+        """
+        with self.lock:
+            if self.current_key is not None:
+                return self.current_key
+            if self.last_key is None:
+                self.last_key = self.jdbc.get_int('SELECT MAX({}) FROM {}'.format(self.column, self.table))
+            return self.last_key
+
+
+class HiLoAllocator(KeyAllocator):
+    """
+    Reserves blocks of keys in an allocation table (LWETL_KEY_ALLOCATION) with one row per table and column.
+    The row is locked by an UPDATE and committed on a separate connection, so concurrent processes
+    never receive the same block. The allocation table is created if it does not exist.
+    All processes that insert into the table must use the same allocation table.
+    """
+
+    def __init__(self, jdbc: Jdbc, table: str, column: str, block_size: int = DEFAULT_BLOCK_SIZE,
+                 allocation_table: str = ALLOCATION_TABLE):
+        """
+        @param jdbc: Jdbc - connection of the upload. The allocator opens its own connection with the same login
+        @param table: str - name of the table
+        @param column: str - name of the key column
+        @param block_size: int - number of keys reserved per round-trip
+        @param allocation_table: str - name of the allocation table
+        """
+        super(HiLoAllocator, self).__init__(block_size)
+        self.login = jdbc.login
+        self.table = table.upper()
+        self.column = column.upper()
+        self.allocation_table = allocation_table
+        self.connection = None
+
+    def _connect(self) -> Jdbc:
+        if self.connection is None:
+            con = Jdbc(self.login)
+            try:
+                con.execute('SELECT COUNT(*) FROM {} WHERE 1=0'.format(self.allocation_table))
+            except SQLExecuteException:
+                con.rollback()
+                key_type = ALLOCATION_KEY_TYPE.get(con.type, DEFAULT_ALLOCATION_KEY_TYPE)
+                try:
+                    con.execute(('CREATE TABLE {0} (TABLE_NAME VARCHAR(128) NOT NULL, '
+                                 'COLUMN_NAME VARCHAR(128) NOT NULL, NEXT_KEY {1} NOT NULL, '
+                                 'PRIMARY KEY (TABLE_NAME, COLUMN_NAME))').format(self.allocation_table, key_type))
+                    LOGGER.info('Created allocation table ' + self.allocation_table)
+                except SQLExecuteException as create_error:
+                    # may have been created concurrently by another process
+                    LOGGER.warning(str(create_error))
+            con.commit()
+            self.connection = con
+        return self.connection
+
+    def _reserve(self, n: int):
+        con = self._connect()
+        parameters = [self.table, self.column]
+        where = 'WHERE TABLE_NAME = ? AND COLUMN_NAME = ?'
+        for attempt in range(2):
+            try:
+                cursor = con.execute('UPDATE {} SET NEXT_KEY = NEXT_KEY + {} {}'.format(
+                    self.allocation_table, n, where), parameters, cursor=None)
+                updated = cursor.rowcount
+                con.close(cursor)
+                if updated > 0:
+                    next_key = con.get_int('SELECT NEXT_KEY FROM {} {}'.format(self.allocation_table, where),
+                                           parameters)
+                    con.commit()
+                    return range(next_key - n, next_key)
+
+                # first allocation for this column
+                first = con.get_int('SELECT MAX({}) FROM {}'.format(self.column, self.table)) + 1
+                con.execute('INSERT INTO {} (TABLE_NAME, COLUMN_NAME, NEXT_KEY) VALUES (?, ?, ?)'.format(
+                    self.allocation_table), parameters + [first + n], cursor=None)
+                con.commit()
+                return range(first, first + n)
+            except SQLExecuteException:
+                con.rollback()
+                # the insert fails if another process added the row concurrently: retry the update
+                if attempt > 0:
+                    raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class SequenceAllocator(KeyAllocator):
+    """
+    Retrieves keys from a database sequence (oracle, postgresql, sqlserver).
+    If the sequence increments by more than 1, each value reserves the block [value, value + increment - 1].
+    Otherwise the values of block_size calls to the sequence are retrieved in a single query.
+    """
+
+    def __init__(self, jdbc: Jdbc, sequence: str, block_size: int = DEFAULT_BLOCK_SIZE, increment: int = 1):
+        """
+        @param jdbc: Jdbc - database connection
+        @param sequence: str - name of the sequence
+        @param block_size: int - number of keys retrieved per round-trip. Ignored if increment > 1
+        @param increment: int - the increment of the sequence.
+        """
+        if jdbc.type not in SEQUENCE_QUERIES:
+            raise ValueError('Sequences not supported for database type: ' + jdbc.type)
+        if (not isinstance(increment, int)) or (increment < 1):
+            raise ValueError('increment must be a positive integer. Found: {}'.format(increment))
+        super(SequenceAllocator, self).__init__(increment if increment > 1 else block_size)
+        self.jdbc = jdbc
+        self.sequence = sequence
+        self.increment = increment
+
+    def _reserve(self, n: int):
+        if self.increment > 1:
+            first = self.jdbc.get_int(sequence_query(self.jdbc.type, self.sequence, 1))
+            return range(first, first + self.increment)
+        else:
+            sql = sequence_query(self.jdbc.type, self.sequence, n)
+            return sorted([int(r[0]) for r in self.jdbc.query(sql)])
+
+
+def get_key_allocator(jdbc: (Jdbc, DummyJdbc), table_name: str, column_name: str) -> MaxKeyAllocator:
+    """
+    Internal factory to share the MaxKeyAllocator of a table column over multiple uploaders and Jdbc instances
+
+    @param jdbc: Jdbc - database connection, defines the database scheme
+    @param table_name: str - name of the table
+    @param column_name: str - name of the PK column
+    @return: MaxKeyAllocator
+    """
+    with KEY_ALLOCATORS_LOCK:
+        tables = KEY_ALLOCATORS.setdefault(jdbc.login, dict())
+        columns = tables.setdefault(table_name, dict())
+        if column_name not in columns:
+            columns[column_name] = MaxKeyAllocator(jdbc, table_name, column_name)
+        return columns[column_name]
@@ -0,0 +1,192 @@
+"""
+Checksum sync for db-copy: both databases compute a hash of the rows in a range of the primary key.
+Ranges with a different hash are divided into smaller ranges, until the ranges are small enough to
+compare the hashes of the individual rows. Ranges without key boundaries (e.g., keys, which are not numeric,
+without NTILE) are divided into buckets of a hash of the key, computed by the database.
+Only the rows, which differ, are transferred.
+The hash functions are database specific: source and target must be of the same database type.
+"""
+from lwetl.jdbc import Jdbc
+from lwetl.programs.db_copy.split import key_boundaries, key_ranges, range_condition
+
+# hash of a row: (expression, expression of a column, separator of the columns)
+# The concatenated columns are prefixed with their length, and NULL is a value without a length:
+# NULL, an empty string, and values containing the separator give different hashes.
+# The ROW() text of postgresql and BINARY_CHECKSUM of sqlserver already distinguish NULL values.
+ROW_HASHES = {
+    'mysql': ('CRC32(CONCAT({}))',
+              "COALESCE(CONCAT(CHAR_LENGTH(CAST({0} AS CHAR)), ':', CAST({0} AS CHAR)), '-')", ', '),
+    'oracle': ('ORA_HASH({})', "NVL2({0}, LENGTH(TO_CHAR({0})) || ':' || TO_CHAR({0}), '-')", ' || '),
+    'postgresql': ('md5(CAST(ROW({}) AS text))', '{0}', ', '),
+    'sqlserver': ('BINARY_CHECKSUM({})', '{0}', ', ')
+}
+
+# aggregate of the row hashes in a range of keys
+RANGE_HASHES = {
+    'mysql': 'BIT_XOR({hash})',
+    'oracle': 'SUM({hash})',
+    'postgresql': "md5(string_agg({hash}, '' ORDER BY {key}))",
+    'sqlserver': 'CHECKSUM_AGG({hash})'
+}
+
+# bucket of a key: the remainder of a hash of the key, divided by the number of buckets {n}
+# The remainders of {n} and of multiples of {n} are consistent: buckets are divided into sub-buckets.
+KEY_BUCKETS = {
+    'mysql': 'MOD(CRC32({key}), {n})',
+    'oracle': 'MOD(ORA_HASH({key}), {n})',
+    'postgresql': 'ABS(MOD(hashtext(CAST({key} AS text)), {n}))',
+    'sqlserver': 'ABS(CHECKSUM({key}) % {n})'
+}
+
+# buckets are not divided beyond this number of buckets: the rows are compared
+MAX_BUCKETS = 2 ** 20
+
+# number of sub-ranges of a range with different hashes
+DEFAULT_FANOUT = 16
+
+# ranges with at most this number of rows compare the hashes of the rows
+DEFAULT_LEAF_SIZE = 1000
+
+
+def row_hash(db_type: str, columns: list) -> str:
+    """
+    @param db_type: str - the database type, see ROW_HASHES
+    @param columns: list - the hashed columns
+    @return: str - the expression of the hash of a row
+    """
+    expression, column_expression, separator = ROW_HASHES[db_type]
+    return expression.format(separator.join([column_expression.format(c) for c in columns]))
+
+
+def supports_checksum(source: Jdbc, target: Jdbc) -> bool:
+    """
+    @param source: Jdbc - connection to the source database
+    @param target: Jdbc - connection to the target database
+    @return: bool - True if the checksums of the two databases can be compared
+    """
+    return (source.type == target.type) and (source.type in ROW_HASHES)
+
+
+class ChecksumSync:
+    """
+    Finds the rows, which differ between the source and the target table, by comparing hashes of key ranges
+    """
+
+    def __init__(self, source: Jdbc, target: Jdbc, table: str, key_column: str, columns: list,
+                 fanout: int = DEFAULT_FANOUT, leaf_size: int = DEFAULT_LEAF_SIZE):
+        """
+        @param source: Jdbc - connection to the source database
+        @param target: Jdbc - connection to the target database, of the same type
+        @param table: str - name of the table
+        @param key_column: str - primary key column
+        @param columns: list - the compared columns. Must exist in both tables
+        @param fanout: int - number of sub-ranges of a range with different hashes
+        @param leaf_size: int - ranges with at most this number of rows compare the hashes of the rows
+        """
+        if not supports_checksum(source, target):
+            raise ValueError('Checksum sync not supported from {} to {}.'.format(source.type, target.type))
+        self.source = source
+        self.target = target
+        self.table = table
+        self.key_column = key_column
+        self.fanout = max(2, fanout)
+        self.leaf_size = max(1, leaf_size)
+
+        self.row_hash = row_hash(source.type, columns)
+        self.range_hash = RANGE_HASHES[source.type].format(hash=self.row_hash, key=key_column)
+
+        # statistics
+        self.ranges_compared = 0
+        self.ranges_differing = 0
+        self.rows_compared = 0
+
+    def _where(self, key_range: tuple, bucket: tuple = None) -> (str, list):
+        condition, parameters = range_condition(self.key_column, key_range)
+        conditions = [condition] if condition else []
+        parameters = list(parameters or [])
+        if bucket is not None:
+            n, remainder = bucket
+            conditions.append(KEY_BUCKETS[self.source.type].format(key=self.key_column, n=n) + ' = ?')
+            parameters.append(remainder)
+        if len(conditions) == 0:
+            return '', None
+        return 'WHERE ' + ' AND '.join(conditions), parameters
+
+    def summary(self, jdbc: Jdbc, key_range: tuple, bucket: tuple = None) -> tuple:
+        """
+        @param jdbc: Jdbc - the source or the target connection
+        @param key_range: tuple (lower bound (exclusive), upper bound (inclusive)). None for an open end
+        @param bucket: tuple (number of buckets, remainder) of the hash of the keys, see KEY_BUCKETS. Optional
+        @return: tuple (int - number of rows, hash of the rows) in the key range
+        """
+        where, parameters = self._where(key_range, bucket)
+        row = jdbc.query_single('SELECT COUNT(*), {} FROM {} {}'.format(self.range_hash, self.table, where),
+                                parameters)
+        return int(row[0]), row[1]
+
+    def row_hashes(self, jdbc: Jdbc, key_range: tuple, bucket: tuple = None) -> dict:
+        """
+        @param jdbc: Jdbc - the source or the target connection
+        @param key_range: tuple - the key range, see summary()
+        @param bucket: tuple - the bucket of the keys, see summary()
+        @return: dict key -> hash of the row
+        """
+        where, parameters = self._where(key_range, bucket)
+        sql = 'SELECT {}, {} FROM {} {}'.format(self.key_column, self.row_hash, self.table, where)
+        return dict([(r[0], r[1]) for r in jdbc.query(sql, parameters)])
+
+    def _compare_rows(self, key_range: tuple, bucket: tuple = None) -> tuple:
+        src = self.row_hashes(self.source, key_range, bucket)
+        trg = self.row_hashes(self.target, key_range, bucket)
+        self.rows_compared += len(src)
+        missing = sorted([k for k in src if k not in trg])
+        changed = sorted([k for k, h in src.items() if (k in trg) and (trg[k] != h)])
+        obsolete = sorted([k for k in trg if k not in src])
+        return key_range, missing, changed, obsolete
+
+    def compare(self, key_range: tuple = (None, None), bucket: tuple = None):
+        """
+        Compare the source and the target table in a range of keys
+        @param key_range: tuple - the key range, see summary(). Defaults to the whole table
+        @param bucket: tuple - the bucket of the keys in the range, see summary(). Defaults to all keys
+        @return: iterator of tuples (key range, missing keys, changed keys, obsolete keys) of the smallest
+            ranges with differences. Missing keys are only found in the source, obsolete keys only in the target
+        """
+        self.ranges_compared += 1
+        src = self.summary(self.source, key_range, bucket)
+        trg = self.summary(self.target, key_range, bucket)
+        if src == trg:
+            return
+        self.ranges_differing += 1
+        if max(src[0], trg[0]) <= self.leaf_size:
+            yield self._compare_rows(key_range, bucket)
+            return
+
+        if bucket is None:
+            # divide on the keys of the larger side
+            jdbc = self.source if src[0] >= trg[0] else self.target
+            condition, parameters = range_condition(self.key_column, key_range)
+            boundaries = key_boundaries(jdbc, self.table, self.key_column, self.fanout, condition, parameters)
+            if len(boundaries) > 0:
+                sub_ranges = key_ranges(boundaries)
+                sub_ranges[0] = (key_range[0], sub_ranges[0][1])
+                sub_ranges[-1] = (sub_ranges[-1][0], key_range[1])
+                for sub_range in sub_ranges:
+                    yield from self.compare(sub_range)
+                return
+            # no key boundaries: divide on the hash of the keys
+            bucket = (1, 0)
+
+        n, remainder = bucket
+        if n * self.fanout > MAX_BUCKETS:
+            yield self._compare_rows(key_range, bucket)
+            return
+        for x in range(self.fanout):
+            yield from self.compare(key_range, (n * self.fanout, remainder + n * x))
+
+    def statistics(self) -> str:
+        """
+        @return: str - the number of compared ranges and rows
+        """
+        return '{} ranges compared, {} with differences, {} rows compared'.format(
+            self.ranges_compared, self.ranges_differing, self.rows_compared)
@@ -10,11 +10,17 @@ from collections import OrderedDict
 DRIVER_NATIVE = 'native'
 DRIVER_SINGLE = 'single'
 DRIVER_MULTI = 'multi'
+DRIVER_VALUES = 'values'
+DRIVER_BULK = 'bulk'
+DRIVER_UPSERT = 'upsert'
 
 UPLOAD_TYPES = OrderedDict()
 UPLOAD_TYPES[DRIVER_NATIVE] = lwetl.NativeUploader
 UPLOAD_TYPES[DRIVER_SINGLE] = lwetl.ParameterUploader
 UPLOAD_TYPES[DRIVER_MULTI] = lwetl.MultiParameterUploader
+UPLOAD_TYPES[DRIVER_VALUES] = lwetl.MultiRowUploader
+UPLOAD_TYPES[DRIVER_BULK] = lwetl.BulkUploader
+UPLOAD_TYPES[DRIVER_UPSERT] = lwetl.UpsertUploader
 
 COPY_EMPTY = 'empty'
 COPY_NEW = 'new'
@@ -27,6 +33,10 @@ COPY_MODE[COPY_NEW] = 'only copy records, which do not exist in the target table
 COPY_MODE[COPY_AND_UPDATE] = 'like new. Then update existing records with the contents found in the source table.'
 COPY_MODE[COPY_AND_SYNC] = 'additionally remove records that where deleted in the source table.'
 
+# subset (--subset) of the foreign key references
+SUBSET_PARENTS = 'parents'
+SUBSET_CHILDREN = 'children'
+
 # noinspection PyTypeChecker
 parser = argparse.ArgumentParser(
     prog='db-copy',
@@ -70,6 +80,13 @@ Useful for copying live databases where reference tables are updated during the
 A negative number implies no fail limit. Defaults to 0 (no failure allowed).
 For ignoring commit errors, also add the --ignore flag. This may result in undesired behaviour.''')
 
+parser.add_argument(
+    '-j', '--jobs', action='store', type=int,
+    default=1,
+    help='''Number of tables copied in parallel. Defaults to 1.
+Each worker opens its own source and target connection. A table is started once the tables it refers to
+(FK references on the target) are copied, the largest tables first.''')
+
 parser.add_argument(
     '-l', '--list', action='store_true',
     help='Only list the commit tables and exit.')
@@ -106,8 +123,124 @@ parser.add_argument(
     help='''Specify the upload mode:
 - native: use native SQL (does not permit transfer of binary data)
 - single: parse single parameterized SQLs to the target server (DEFAULT).
-- multi:  parse an sql with multiple parameter rows in a single commit 
-          (not compatible with update mode 'update' and 'sync').''')
+- multi:  parse an sql with multiple parameter rows in a single commit.
+          Updates with the same set of columns are grouped in a single batch.
+- values: like multi, but packs the inserted rows into multi-row INSERT ... VALUES statements.
+          Faster for drivers with a poor batch implementation (mysql, sqlserver).
+- bulk:   like multi, but inserts use the native bulk interface of the target database
+          (postgresql COPY, sqlserver bulk copy, mysql LOAD DATA LOCAL INFILE).
+- upsert: send batches of MERGE / INSERT ... ON CONFLICT / ON DUPLICATE KEY statements on the primary key.
+          Skips the scan of the existing target keys in the modes 'new' and 'update'.
+          Inserted and updated rows are both reported as new.''')
+
+parser.add_argument(
+    '--adaptive', action='store_true',
+    help='''Tune the batch size of the drivers multi, values, bulk, and upsert on the measured throughput,
+and commit on rows, elapsed time (10 s), or data volume (64 MB). The -n option sets the initial batch size.''')
+
+parser.add_argument(
+    '--pipeline', action='store_true',
+    help='''Fetch and convert the source rows in background threads, while the target is written.
+The stages are joined by bounded queues. Reports the busy and stall times of each stage per table.''')
+
+parser.add_argument(
+    '--bulk-mode', action='store_true',
+    dest='bulk_mode',
+    help='''Disable the non-unique indexes and foreign key constraints of the copied tables on the target
+during the copy, and rebuild them afterwards (also on failure). Requires the -a option.
+The restore statements are kept in db-copy-restore.sql until the restore succeeded.''')
+
+parser.add_argument(
+    '--reject', action='store', default=None,
+    dest='reject_file',
+    help='''Write rows rejected by the target database to this CSV file (table, operation, error, data).
+With the drivers multi, values, bulk, and upsert a failed batch is rolled back to a savepoint and split
+until the failing rows are isolated: the other rows are kept and rejected rows do not count as fails.
+With the drivers native and single the failing rows are written to the file and counted as fails.''')
+
+parser.add_argument(
+    '--checksum', action='store_true',
+    help='''Compare hashes of primary key ranges computed on both databases, divide the ranges with
+differences, and only transfer the rows, which are missing or changed (modes 'update' and 'sync'),
+and delete the obsolete rows (mode 'sync'). Requires source and target of the same database type
+(mysql, oracle, postgresql, sqlserver). Ignored in the mode 'empty'.''')
+
+parser.add_argument(
+    '--estimate', action='store_true',
+    help='''Plan the copy on the row counts of the catalog statistics, instead of counting all rows of
+every table on both databases (which runs in parallel with -j). Empty tables are detected with EXISTS,
+and only tables without statistics are counted. Implied by the -l option.''')
+
+parser.add_argument(
+    '--resume', action='store_true',
+    help='''Resume an interrupted copy from the journal (see --journal): skip the tables finished by the
+previous run, and continue the tables in progress after the last committed primary key.
+Tables in progress are restarted in the mode 'sync' and in descending order (--reverse, --fast).''')
+
+parser.add_argument(
+    '--journal', action='store', default='db-copy-journal.json',
+    dest='journal_file',
+    help='''The checkpoint journal with the finished tables and the last committed key of the tables in
+progress. Written with the -a option, and removed after a copy without errors. Defaults to db-copy-journal.json''')
+
+parser.add_argument(
+    '--split', action='store', type=int,
+    default=1,
+    help='''Split large tables (10000 rows or more) into N ranges of the primary key with about the same
+number of rows (NTILE), and copy the ranges in N separate processes, each with its own source and target
+connection. Finished ranges are recorded next to the journal (<journal>.split, with the -a option):
+resume an interrupted copy with --resume to skip them. With --reject each range writes its own file (<file>.<range>).
+The fail limit applies per range. Ignored with --staging. Defaults to 1 (no split).''')
+
+parser.add_argument(
+    '--server-side', action='store', nargs='?', type=int, const=1, default=None,
+    dest='server_side',
+    help='''Copy with set-based INSERT ... SELECT (UPDATE, DELETE in the modes 'update' and 'sync') on the
+target database, if it can read the source table itself: schemas of the same oracle instance, databases of
+the same mysql or sqlserver server, or through --link. With N > 1 the statements run per range of the
+primary key (N ranges), each with its own commit. Other tables are copied through the client.
+Rows are not rejected individually: an error fails the table (range). Ignored with the -r option.''')
+
+parser.add_argument(
+    '--link', action='store', default=None,
+    help='''A database link (oracle), linked server (sqlserver), or schema of foreign tables (postgresql),
+defined on the target, to read the source tables. Implies --server-side. Tables are referred to as
+<table>@<link> (oracle) or <link>.<table>, or use a template with {table}, e.g., 'SRV.scott.dbo.{table}'.''')
+
+parser.add_argument(
+    '--where', action='append', default=None, metavar='TABLE:CONDITION',
+    help='''Copy only the rows of a table, which match a condition: <table>:<condition>, e.g.,
+'ORDERS:ORDER_DATE >= CURRENT_DATE - 30'. May be repeated. The condition is applied to the source rows,
+and to the existing target rows (modes 'update' and 'sync'). Filtered tables are copied through the client
+(no --server-side, --staging, or --checksum).''')
+
+parser.add_argument(
+    '--subset', action='store', nargs='?', const=SUBSET_PARENTS, default=None,
+    choices=[SUBSET_PARENTS, SUBSET_CHILDREN],
+    help='''Copy a subset, which is consistent with the foreign keys, starting from the tables with a --where
+condition (the roots). The rows referenced by the selected rows are added (parents, default). With 'children',
+the rows referring to the roots are selected first, table by table down the foreign keys. Tables outside the
+subset are ignored. The selection is resolved with nested sub-queries on the source. Not in the mode
+'sync'.''')
+
+parser.add_argument(
+    '--key-tables', action='store_true',
+    dest='key_tables',
+    help='''Store the key set of each table of a --subset in a key table (LWK_<table>) on the source, so the
+sub-queries are not nested. The key tables are dropped at the end. Requires write access to the source.
+Ignored without the -a option, and with --list.''')
+
+parser.add_argument(
+    '--staging', action='store_true',
+    help='''Load the source rows into a staging table on the target (LWS_<table>) and merge
+them into the target table with a few set-based SQL statements.
+Avoids the scan of the existing target keys. Ignored in the mode 'empty', and without the -a option.''')
+
+parser.add_argument(
+    '--update-all', action='store_true',
+    dest='update_all',
+    help='''In the modes 'update' and 'sync', update all existing rows. By default, the columns of the
+existing target rows are read along with the keys, and only changed columns of changed rows are updated.''')
 
 parser.add_argument(
     '--ignore', action='store_true',
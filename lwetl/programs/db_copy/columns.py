@@ -0,0 +1,133 @@
+"""
+Column mapping of a copied table: only the source columns, which exist on the target, are selected. The rows
+are transferred as tuples in the order of the mapped columns.
+"""
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+from lwetl.jdbc import Jdbc
+from lwetl.uploader import escape_column_names
+
+
+def table_columns(jdbc: Jdbc, table: str) -> OrderedDict:
+    """
+    @param jdbc: Jdbc - database connection
+    @param table: str - name of the table
+    @return: OrderedDict of the columns of the table (name: type), see Jdbc.get_columns()
+    """
+    cursor = jdbc.execute('SELECT * FROM {} WHERE 1=0'.format(table), cursor=None)
+    columns = jdbc.get_columns(cursor)
+    jdbc.close(cursor)
+    return columns
+
+
+def normalise(value):
+    """
+    Normalise a value for the comparison of a source and a target row. Different drivers may return the same
+    value in different types (e.g., int, float, or Decimal; date or datetime; bool or int)
+    @param value: the value
+    @return: the normalised value. Empty strings are None, as the uploaders store them as NULL
+    """
+    if value is None:
+        return None
+    elif isinstance(value, bool):
+        return int(value)
+    elif isinstance(value, float):
+        return Decimal(repr(value))
+    elif isinstance(value, (int, Decimal)):
+        return Decimal(value)
+    elif isinstance(value, datetime):
+        return value
+    elif isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    elif isinstance(value, bytearray):
+        return bytes(value)
+    elif isinstance(value, str) and (len(value) == 0):
+        return None
+    return value
+
+
+class ColumnMapping:
+    """
+    The columns copied from a source table to a target table
+    """
+
+    def __init__(self, source: Jdbc, target: Jdbc, table: str, key_column: str = None):
+        """
+        @param source: Jdbc - connection to the source database
+        @param target: Jdbc - connection to the target database
+        @param table: str - name of the table
+        @param key_column: str - primary key column. Must exist in both tables, if specified
+        @raise SQLExecuteException: if the columns cannot be retrieved
+        @raise ValueError: if the key column is not found in the mapped columns
+        """
+        self.source = source
+        self.table = table
+        source_columns = table_columns(source, table)
+        # column types of the target are passed to the uploader, see target_columns
+        self.target_columns = table_columns(target, table)
+        # in the order of the source columns
+        self.columns = tuple([c for c in source_columns if c in self.target_columns])
+        self.dropped = [c for c in source_columns if c not in self.target_columns]
+
+        self.key_column = key_column
+        self.key_position = None
+        if key_column is not None:
+            if key_column not in self.columns:
+                raise ValueError('Key column {} of {} not found in source and target.'.format(key_column, table))
+            self.key_position = self.columns.index(key_column)
+        self.update_positions = [(x, c) for x, c in enumerate(self.columns) if c != key_column]
+
+    def select(self, condition: str = '', order: str = None) -> str:
+        """
+        @param condition: str - the condition on the rows (without WHERE)
+        @param order: str - the ORDER BY clause (without ORDER BY)
+        @return: str - the query of the mapped columns of the source table
+        """
+        sql = 'SELECT {} FROM {}'.format(', '.join(escape_column_names(self.source, list(self.columns))), self.table)
+        if condition:
+            sql += ' WHERE ' + condition
+        if order:
+            sql += ' ORDER BY ' + order
+        return sql
+
+    def key(self, row: tuple):
+        """
+        @param row: tuple of the values of the mapped columns
+        @return: the value of the key column
+        """
+        return row[self.key_position]
+
+    def update_data(self, row: tuple) -> OrderedDict:
+        """
+        @param row: tuple of the values of the mapped columns
+        @return: OrderedDict of the values of the columns without the key column, including None values
+        """
+        return OrderedDict([(c, row[x]) for x, c in self.update_positions])
+
+    def update_columns(self) -> list:
+        """
+        @return: list of the mapped columns without the key column, in the order of update_data()
+        """
+        return [c for _, c in self.update_positions]
+
+    def changes(self, row: tuple, target_values: tuple) -> OrderedDict:
+        """
+        @param row: tuple of the values of the mapped columns
+        @param target_values: tuple of the values of the update columns in the target row, see update_columns()
+        @return: OrderedDict of the values of the columns, which differ from the target row. Empty if unchanged
+        """
+        changes = OrderedDict()
+        for (x, c), target_value in zip(self.update_positions, target_values):
+            value = row[x]
+            if (value != target_value) and (normalise(value) != normalise(target_value)):
+                changes[c] = value
+        return changes
+
+    def as_dict(self, row: tuple) -> OrderedDict:
+        """
+        @param row: tuple of the values of the mapped columns
+        @return: OrderedDict of the values of all mapped columns
+        """
+        return OrderedDict(zip(self.columns, row))
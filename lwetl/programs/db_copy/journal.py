@@ -0,0 +1,135 @@
+"""
+Checkpoint journal of db-copy: a local JSON file with the finished tables, and the last committed key of
+the tables in progress. A copy, which was interrupted, is resumed with the --resume option: finished
+tables are skipped, and tables in progress continue after the last committed key.
+"""
+import json
+import os
+import re
+import threading
+
+from datetime import datetime
+
+from lwetl.utils import value_to_json, json_to_value
+
+DEFAULT_JOURNAL_FILE = 'db-copy-journal.json'
+
+STATUS_DONE = 'done'
+STATUS_PARTIAL = 'partial'
+
+
+def login_identity(login: str) -> str:
+    """
+    @param login: str - login alias or credentials
+    @return: str - the login without the password
+    """
+    return re.sub(r'^([^/@]*)/[^@]*@', r'\1@', login)
+
+
+class CopyJournal:
+    """
+    Thread-safe checkpoint journal of a copy between a source and a target database
+    """
+
+    def __init__(self, file_name: str, source: str, target: str, resume: bool = False):
+        """
+        @param file_name: str - the journal file
+        @param source: str - login of the source database
+        @param target: str - login of the target database
+        @param resume: bool - continue the journal of a previous run. Otherwise, the journal starts empty
+        @raise ValueError: if the journal to resume belongs to other databases
+        """
+        self.file_name = file_name
+        self.lock = threading.Lock()
+        self.state = None
+        source = login_identity(source)
+        target = login_identity(target)
+        if resume and os.path.isfile(file_name):
+            with open(file_name, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+            if (self.state.get('source') != source) or (self.state.get('target') != target):
+                raise ValueError('Journal {} belongs to the copy from {} to {}.'.format(
+                    file_name, self.state.get('source'), self.state.get('target')))
+        if self.state is None:
+            self.state = {
+                'source': source,
+                'target': target,
+                'started': datetime.now().isoformat(),
+                'tables': dict()
+            }
+
+    def _table(self, table: str) -> dict:
+        return self.state['tables'].get(table, dict())
+
+    def is_done(self, table: str) -> bool:
+        """
+        @param table: str - name of the table
+        @return: bool - True if the table was finished
+        """
+        with self.lock:
+            return self._table(table).get('status') == STATUS_DONE
+
+    def counts(self, table: str):
+        """
+        @param table: str - name of the table
+        @return: tuple (source, target) of the row counts of a finished table, or None
+        """
+        with self.lock:
+            counts = self._table(table).get('counts')
+        return None if counts is None else tuple(counts)
+
+    def last_key(self, table: str):
+        """
+        @param table: str - name of the table
+        @return: the last committed key of a table in progress, or None
+        """
+        with self.lock:
+            info = self._table(table)
+            if info.get('status') != STATUS_PARTIAL:
+                return None
+            return json_to_value(info.get('last_key', dict()))
+
+    def checkpoint(self, table: str, last_key, rows: int):
+        """
+        Record the progress of a table. Call after a commit
+        @param table: str - name of the table
+        @param last_key: the last committed key
+        @param rows: int - number of rows processed by the current run
+        """
+        with self.lock:
+            self.state['tables'][table] = {
+                'status': STATUS_PARTIAL,
+                'last_key': value_to_json(last_key),
+                'rows': rows,
+                'updated': datetime.now().isoformat()
+            }
+            self._write()
+
+    def finish(self, table: str, counts: tuple):
+        """
+        Record a finished table
+        @param table: str - name of the table
+        @param counts: tuple (source, target) of the row counts before the copy
+        """
+        with self.lock:
+            self.state['tables'][table] = {
+                'status': STATUS_DONE,
+                'counts': list(counts),
+                'updated': datetime.now().isoformat()
+            }
+            self._write()
+
+    def _write(self):
+        # replace the file in a single step: a crash does not leave a truncated journal
+        tmp_file = self.file_name + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2, default=str)
+        os.replace(tmp_file, self.file_name)
+
+    def remove(self):
+        """
+        Remove the journal file, e.g., after a successful copy
+        """
+        with self.lock:
+            if os.path.isfile(self.file_name):
+                os.remove(self.file_name)
@@ -1,17 +1,36 @@
 """
 Utility: copy tables between database instances
 """
+import copy
 import lwetl
+import multiprocessing
 import os
 import sys
+import threading
 
 from collections import OrderedDict
 from datetime import datetime
+from functools import partial
 
 from lwetl.programs.db_copy.cmdline import \
-    DRIVER_SINGLE, DRIVER_MULTI, UPLOAD_TYPES, \
-    COPY_EMPTY, COPY_AND_UPDATE, COPY_AND_SYNC, parser
+    DRIVER_UPSERT, UPLOAD_TYPES, \
+    COPY_EMPTY, COPY_AND_UPDATE, COPY_AND_SYNC, SUBSET_CHILDREN, parser
+from lwetl.programs.db_copy.checksum import ChecksumSync, supports_checksum
+from lwetl.programs.db_copy.columns import ColumnMapping
+from lwetl.uploader import escape_column_names
+from lwetl.programs.db_copy.journal import CopyJournal
+from lwetl.programs.db_copy.merge_join import MergeJoin, KeyLookup, KeyOrderError
+from lwetl.programs.db_copy.pipeline import CopyPipeline
+from lwetl.programs.db_copy.row_counts import table_counts
+from lwetl.programs.db_copy.scheduler import TableScheduler, dependency_graph
+from lwetl.programs.db_copy.split import SPLIT_MIN_ROWS, SplitCheckpoint, checkpoint_directory, \
+    key_boundaries, key_ranges, range_condition, remove_checkpoints
+from lwetl.programs.db_copy.subset import KeySets, and_conditions, count_rows, parse_conditions, \
+    subset_conditions
+from lwetl.programs.db_copy.staging import StagingTable, SourceTable, source_reference, \
+    STAGING_DELETE, STAGING_UPDATE, STAGING_INSERT
 
+from lwetl.bulk_mode import SESSION_STATEMENTS
 from lwetl.version import __version__
 from lwetl.queries import content_queries
 from lwetl.runtime_statistics import timedelta_to_string, tag_connection, get_execution_statistics
@@ -21,10 +40,18 @@ SRC = "src"
 TRG = "trg"
 
 # find common tables
-COMMON, EMPTY, IGNORED, MISSING, NO_SOURCE = 'common', 'empty', 'ignored', 'missing', 'no_source'
+COMMON, EMPTY, IGNORED, MISSING, NO_SOURCE, FINISHED = 'common', 'empty', 'ignored', 'missing', 'no_source', 'finished'
 
 CNT_COPIED_TABLES = 'copied tables'
 CNT_FAIL = 'fails'
+CNT_NEW = 'new rows'
+CNT_UPDATED = 'updated rows'
+
+# guards the counters in parallel copies
+COUNTER_LOCK = threading.Lock()
+
+# restore script of the indexes and constraints disabled in bulk mode
+BULK_MODE_RESTORE_FILE = 'db-copy-restore.sql'
 
 
 def referring_tables(table_list: list, table_dict: dict, excluded=None):
@@ -90,6 +117,8 @@ def estimate_remaining(t0, rc, n):
 
 
 def clean_exit(jdbc_connections, args, exit_code):
+    if getattr(args, 'key_sets', None) is not None:
+        args.key_sets.drop()
     if args.statistics:
         print(get_execution_statistics())
     jdbc_connections[SRC].close()
@@ -101,6 +130,822 @@ class TooMayErrorsException(Exception):
     pass
 
 
+def new_counters() -> dict:
+    """
+    @return: dict with the copy statistics, all zero
+    """
+    return dict([(key, 0) for key in [CNT_COPIED_TABLES, CNT_FAIL, CNT_NEW, CNT_UPDATED]])
+
+
+def add_count(counters: dict, key: str, n: int = 1):
+    """
+    Add to a count of the copy statistics (thread-safe)
+    @param counters: dict with the copy statistics
+    @param key: str - the count
+    @param n: int - the increment
+    """
+    with COUNTER_LOCK:
+        counters[key] += n
+
+
+def add_failures(counters: dict, n: int = 1):
+    """
+    Add to the failure count (thread-safe)
+    @param counters: dict with the copy statistics
+    @param n: int - number of failures
+    """
+    add_count(counters, CNT_FAIL, n)
+
+
+def report(*args, **kwargs):
+    """
+    Print a message. In parallel copies the message is prefixed with the name of the worker
+    """
+    thread = threading.current_thread()
+    process = multiprocessing.current_process()
+    if thread is not threading.main_thread():
+        print('[{}]'.format(thread.name), *args, **kwargs)
+    elif process.name != 'MainProcess':
+        print('[{}]'.format(process.name), *args, **kwargs, flush=True)
+    else:
+        print(*args, **kwargs)
+
+
+def adaptive_kwargs(args) -> dict:
+    """
+    @param args: parsed command line arguments
+    @return: dict - the uploader arguments for the adaptive mode, if specified
+    """
+    if args.adaptive:
+        return {'controller': lwetl.AdaptiveController(batch_size=args.commit_nr)}
+    else:
+        return dict()
+
+
+def batch_kwargs(args, reject_writer) -> dict:
+    """
+    @param args: parsed command line arguments
+    @param reject_writer: RejectWriter or None
+    @return: dict - the arguments of the batch uploaders (multi, values, bulk, upsert)
+    """
+    kwargs = adaptive_kwargs(args)
+    if reject_writer is not None:
+        kwargs['reject'] = reject_writer
+    return kwargs
+
+
+def commit_is_due(uploader, args) -> bool:
+    """
+    @param uploader: the uploader of the current table
+    @param args: parsed command line arguments
+    @return: bool - True if the uploader should commit
+    """
+    if args.adaptive and (uploader.controller is not None):
+        return uploader.commit_is_due()
+    else:
+        # the drivers single and native are not adaptive
+        return uploader.row_count >= args.commit_nr
+
+
+def source_rows(jdbc: dict, cursor, args, return_type=tuple, include_none: bool = False):
+    """
+    @param jdbc: dict of the source and target connections
+    @param cursor: cursor of the source query
+    @param args: parsed command line arguments
+    @param return_type: the type of the rows, see Jdbc.get_data(). Defaults to tuple
+    @param include_none: bool - include None values in dictionaries
+    @return: iterator over the source rows. A CopyPipeline, if specified
+    """
+    if args.pipeline:
+        return CopyPipeline(jdbc[SRC], cursor, return_type=return_type, include_none=include_none)
+    else:
+        return jdbc[SRC].get_data(cursor=cursor, return_type=return_type, include_none=include_none)
+
+
+def print_pipeline_statistics(table: str, rows):
+    if isinstance(rows, CopyPipeline):
+        print('Pipeline of {}: {}'.format(table, rows.statistics()))
+
+
+def staging_copy(jdbc: dict, table: str, n: int, pk: str, args, commit_mode: str, counters: dict,
+                 reject_writer=None) -> bool:
+    """
+    Copy a table through a staging table on the target database
+    @param jdbc: dict of the source and target connections
+    @param table: str - name of the table to copy
+    @param n: int - number of rows in the source table
+    @param pk: str - primary key column of the target table
+    @param args: parsed command line arguments
+    @param commit_mode: str - commit mode of the target table
+    @param counters: dict with the copy statistics. Updated on failures
+    @param reject_writer: RejectWriter for rows, which cannot be loaded into the staging table
+    @return: bool - True if the number of failures exceeds the limit
+    """
+    staging = StagingTable(jdbc[TRG], table, pk)
+    t0_table = datetime.now()
+    row_count = 0
+    too_many_errors = False
+    rows = None
+    try:
+        staging.create()
+        mapping = ColumnMapping(jdbc[SRC], jdbc[TRG], table)
+        columns = list(mapping.columns)
+        cursor = jdbc[SRC].execute(mapping.select(), cursor=None)
+
+        # the staging table is private: always commit (staging requires the -a option)
+        with lwetl.BulkUploader(jdbc[TRG], staging.name.lower(), commit_mode=lwetl.UPLOAD_MODE_COMMIT,
+                                **batch_kwargs(args, reject_writer)) as uploader:
+            rows = source_rows(jdbc, cursor, args)
+            for row in rows:
+                row_count += 1
+                uploader.insert_row(mapping.columns, row)
+                if commit_is_due(uploader, args):
+                    uploader.commit()
+                    report('{:8}. {:5.1f} % of {} records staged. {}. Est. remaining time: {}'.format(
+                        row_count, (100.0 * row_count / n), n, table, estimate_remaining(t0_table, row_count, n)))
+                if (args.max_rows > 0) and (row_count >= args.max_rows):
+                    report('Terminating after {} uploads on user request.'.format(row_count))
+                    break
+            uploader.commit()
+            if uploader.reject_count > 0:
+                report('{:8}. rows of {} rejected, see: {}'.format(uploader.reject_count, table, args.reject_file))
+            print_pipeline_statistics(table, rows)
+
+        staging.create_index()
+        counts = staging.reconcile(columns, update=args.mode in [COPY_AND_UPDATE, COPY_AND_SYNC],
+                                   delete=(args.mode == COPY_AND_SYNC) and (args.max_rows <= 0))
+        if commit_mode == lwetl.UPLOAD_MODE_COMMIT:
+            jdbc[TRG].commit()
+        else:
+            jdbc[TRG].rollback()
+        report('{:8}. staged records of {}. {}. Used time: {}'.format(
+            row_count, table, ', '.join(['{}: {}'.format(k, v) for k, v in counts.items()]),
+            timedelta_to_string(datetime.now() - t0_table)))
+    except (lwetl.SQLExecuteException, lwetl.CommitException) as staging_error:
+        jdbc[TRG].rollback()
+        add_failures(counters)
+        report('Staging error ({}) in table {}: {}'.format(counters[CNT_FAIL], table, str(staging_error)),
+               file=sys.stderr)
+        if (args.max_fail >= 0) and (counters[CNT_FAIL] > args.max_fail):
+            report('Too many errors: terminating.')
+            too_many_errors = True
+    finally:
+        if isinstance(rows, CopyPipeline):
+            rows.close()
+        staging.drop()
+    return too_many_errors
+
+
+def server_source(jdbc: dict, t: str, pk: str, args):
+    """
+    @param jdbc: dict of the source and target connections
+    @param t: str - name of the table
+    @param pk: str - primary key column of the target table
+    @param args: parsed command line arguments
+    @return: SourceTable - the source table as read by the target database, or None if not accessible
+    """
+    reference = source_reference(jdbc[SRC], jdbc[TRG], t, args.link)
+    if reference is None:
+        report('Table {} copied through the client: the target cannot read the source (see --link).'.format(t))
+        return None
+    source = SourceTable(jdbc[TRG], t, pk, reference)
+    if not source.is_accessible():
+        report('Table {} copied through the client: {} cannot be read on the target.'.format(t, reference))
+        return None
+    return source
+
+
+def server_side_copy(jdbc: dict, t: str, source: SourceTable, args, commit_mode: str, counters: dict,
+                     key_range: tuple = None, journal: CopyJournal = None) -> bool:
+    """
+    Copy a table with set-based SQL statements on the target database, which reads the source table itself.
+    With args.server_side > 1, the statements run per range of the primary key, each with its own commit.
+    @param jdbc: dict of the source and target connections
+    @param t: str - name of the table
+    @param source: SourceTable - the source table, see server_source()
+    @param args: parsed command line arguments
+    @param commit_mode: str - commit mode of the target table
+    @param counters: dict with the copy statistics. Updated with the failures and the uploaded rows
+    @param key_range: tuple (lower, upper) - copy only this range of the primary key
+    @param journal: CopyJournal - records the last committed key of the ranges
+    @return: bool - True if the number of failures exceeds the limit
+    """
+    pk = source.key_column
+    t0_table = datetime.now()
+    totals = OrderedDict([(STAGING_DELETE, 0), (STAGING_UPDATE, 0), (STAGING_INSERT, 0)])
+    too_many_errors = False
+    try:
+        columns = list(ColumnMapping(jdbc[SRC], jdbc[TRG], t).columns)
+        ranges = [key_range if key_range is not None else (None, None)]
+        if args.server_side > 1:
+            condition, parameters = range_condition(pk, ranges[0])
+            boundaries = key_boundaries(jdbc[SRC], t, pk, args.server_side, condition, parameters)
+            if len(boundaries) > 0:
+                ranges = key_ranges(boundaries)
+                if key_range is not None:
+                    ranges[0] = key_range[0], ranges[0][1]
+                    ranges[-1] = ranges[-1][0], key_range[1]
+        report('Server-side copy of {} from {} in {} range(s).'.format(t, source.name, len(ranges)))
+        for nr, chunk in enumerate(ranges, 1):
+            condition, parameters = range_condition(pk, chunk)
+            counts = source.reconcile(columns, update=args.mode in [COPY_AND_UPDATE, COPY_AND_SYNC],
+                                      delete=(args.mode == COPY_AND_SYNC), condition=condition,
+                                      parameters=parameters)
+            for label, n in counts.items():
+                totals[label] += n
+            if commit_mode == lwetl.UPLOAD_MODE_COMMIT:
+                jdbc[TRG].commit()
+                if (journal is not None) and (nr < len(ranges)):
+                    journal.checkpoint(t, chunk[1], sum(totals.values()))
+            if len(ranges) > 1:
+                report('Range {}/{} of {}: {}'.format(
+                    nr, len(ranges), t, ', '.join(['{}: {}'.format(k, v) for k, v in counts.items()])))
+        if commit_mode != lwetl.UPLOAD_MODE_COMMIT:
+            jdbc[TRG].rollback()
+    except (lwetl.SQLExecuteException, lwetl.CommitException) as server_error:
+        jdbc[TRG].rollback()
+        add_failures(counters)
+        report('Server-side copy error ({}) in table {}: {}'.format(counters[CNT_FAIL], t, server_error),
+               file=sys.stderr)
+        too_many_errors = (args.max_fail >= 0) and (counters[CNT_FAIL] > args.max_fail)
+    finally:
+        add_count(counters, CNT_NEW, totals[STAGING_INSERT])
+        add_count(counters, CNT_UPDATED, totals[STAGING_UPDATE])
+    report('{:8}. server-side records of {}. {}. Used time: {}'.format(
+        sum(totals.values()), t, ', '.join(['{}: {}'.format(k, v) for k, v in totals.items()]),
+        timedelta_to_string(datetime.now() - t0_table)))
+    return too_many_errors
+
+
+def delete_obsolete(jdbc: dict, t: str, pk: str, keys: list, args, counters: dict):
+    """
+    Delete obsolete rows from the target table (mode sync)
+    @param jdbc: dict of the source and target connections
+    @param t: str - name of the table
+    @param pk: str - the primary key column of the target table
+    @param keys: list of the keys (tuples) of the obsolete rows, see MergeJoin
+    @param args: parsed command line arguments
+    @param counters: dict with the copy statistics. Updated with the failures
+    @raise TooMayErrorsException: if the number of failures exceeds the limit
+    """
+    delete_list = [key[0] for key in keys]
+    sql = 'DELETE FROM {0} WHERE {1} IN ({2})'.format(t, pk, ','.join(['?'] * len(delete_list)))
+    try:
+        jdbc[TRG].execute(sql, delete_list, cursor=None)
+    except lwetl.SQLExecuteException as delete_exception:
+        add_failures(counters, len(delete_list))
+        report(delete_exception)
+        report('Delete error ({}) in table {} on rows {}'.format(
+            counters[CNT_FAIL], t, ', '.join([str(key) for key in delete_list])))
+        if (args.max_fail >= 0) and (counters[CNT_FAIL] > args.max_fail):
+            report('Too many errors: terminating.')
+            raise TooMayErrorsException('Insert, Update, and Delete failed {} times'.format(counters[CNT_FAIL]))
+
+
+def fetch_rows(jdbc: lwetl.Jdbc, mapping: ColumnMapping, keys: list, chunk_size: int = 500):
+    """
+    @param jdbc: Jdbc - connection to the source database
+    @param mapping: ColumnMapping - the columns copied from the source table, with the key column
+    @param keys: list - the keys of the rows
+    @param chunk_size: int - number of keys per query
+    @return: iterator of the rows as dictionaries of the mapped columns, None values included
+    """
+    for offset in range(0, len(keys), chunk_size):
+        chunk = keys[offset:offset + chunk_size]
+        sql = mapping.select('{} IN ({})'.format(mapping.key_column, ','.join(['?'] * len(chunk))))
+        for row in jdbc.query(sql, chunk):
+            yield dict(zip(mapping.columns, row))
+
+
+def checksum_copy(jdbc: dict, t: str, pk_info: dict, args, commit_mode: str, counters: dict,
+                  reject_writer=None, key_range: tuple = None) -> bool:
+    """
+    Synchronize a table by comparing hashes of key ranges, and only transfer the rows, which differ
+    For the parameters see copy_table()
+    @return: bool - True if the number of failures exceeds the limit
+    """
+    pk = pk_info[TRG][t]
+    mapping = ColumnMapping(jdbc[SRC], jdbc[TRG], t, pk)
+    sync = ChecksumSync(jdbc[SRC], jdbc[TRG], t, pk, escape_column_names(jdbc[SRC], list(mapping.columns)))
+
+    is_update = args.mode in [COPY_AND_UPDATE, COPY_AND_SYNC]
+    is_batch = issubclass(UPLOAD_TYPES[args.driver], lwetl.MultiParameterUploader)
+    uploader_kwargs = batch_kwargs(args, reject_writer) if is_batch else dict()
+    if args.driver == DRIVER_UPSERT:
+        uploader_kwargs['key_columns'] = pk
+    too_many_errors = False
+    new_count, upd_count, del_count = 0, 0, 0
+    t0_table = datetime.now()
+    try:
+        with UPLOAD_TYPES[args.driver](jdbc[TRG], t.lower(), commit_mode=commit_mode,
+                                       **uploader_kwargs) as uploader:
+            for _, missing, changed, obsolete in sync.compare((None, None) if key_range is None else key_range):
+                changed = set(changed) if is_update else set()
+                for d in fetch_rows(jdbc[SRC], mapping, missing + sorted(changed)):
+                    key = d[pk]
+                    try:
+                        if key in changed:
+                            del d[pk]
+                            uploader.update(d, {pk: key})
+                            upd_count += 1
+                        else:
+                            uploader.insert(dict([(c, v) for c, v in d.items() if v is not None]))
+                            new_count += 1
+                    except lwetl.SQLExecuteException as upload_exception:
+                        if reject_writer is not None:
+                            reject_writer.write(t.lower(), 'update' if key in changed else 'insert',
+                                                dict(d, **{pk: key}), upload_exception)
+                        add_failures(counters)
+                        report('Upload error ({}) on key {}: {}'.format(counters[CNT_FAIL], key, upload_exception))
+                if args.mode == COPY_AND_SYNC:
+                    for key in obsolete:
+                        uploader.delete({pk: key})
+                        del_count += 1
+                if (args.max_fail >= 0) and (counters[CNT_FAIL] > args.max_fail):
+                    raise TooMayErrorsException('Checksum sync failed {} times'.format(counters[CNT_FAIL]))
+                if commit_is_due(uploader, args):
+                    uploader.commit()
+                    report('{:8}. new, {:8} updated, {:8} deleted records in {}. {}'.format(
+                        new_count, upd_count, del_count, t, sync.statistics()))
+                if (args.max_rows > 0) and ((new_count + upd_count) > args.max_rows):
+                    report('Terminating after {} uploads on user request.'.format(new_count + upd_count))
+                    break
+            uploader.commit()
+    except (lwetl.SQLExecuteException, lwetl.CommitException) as sync_error:
+        add_failures(counters)
+        report('Checksum sync error ({}) in table {}: {}'.format(counters[CNT_FAIL], t, sync_error),
+               file=sys.stderr)
+        too_many_errors = (args.max_fail >= 0) and (counters[CNT_FAIL] > args.max_fail)
+    except TooMayErrorsException as tee:
+        report('Too many errors: terminating. {}'.format(tee), file=sys.stderr)
+        too_many_errors = True
+    finally:
+        add_count(counters, CNT_NEW, new_count)
+        add_count(counters, CNT_UPDATED, upd_count)
+    report('{:8}. new, {:8} updated, {:8} deleted records in {}. {}. Used time: {}'.format(
+        new_count, upd_count, del_count, t, sync.statistics(), timedelta_to_string(datetime.now() - t0_table)))
+    return too_many_errors
+
+
+def copy_table(jdbc: dict, t: str, table_count: dict, pk_info: dict, args, commit_mode: str,
+               counters: dict, reject_writer=None, key_range: tuple = None, journal: CopyJournal = None,
+               key_lookup: bool = False) -> bool:
+    """
+    Copy a table from the source to the target database
+    @param jdbc: dict of the source and target connections
+    @param t: str - name of the table
+    @param table_count: dict of the row counts (source, target) of each table
+    @param pk_info: dict of the primary key column of each table of the source and the target
+    @param args: parsed command line arguments
+    @param commit_mode: str - commit mode of the target tables
+    @param counters: dict with the copy statistics. Updated with the failures and the uploaded rows
+    @param reject_writer: RejectWriter or None
+    @param key_range: tuple (lower, upper) - copy only this range of the primary key, see split_copy()
+    @param journal: CopyJournal - records the last committed key. A table in progress is resumed after this key
+    @param key_lookup: bool - classify the source keys with the target keys in memory, instead of the merge join.
+        Used if the database orders the keys differently than python
+    @return: bool - True if the number of failures exceeds the limit
+    """
+    too_many_errors = False
+    is_update = args.mode in [COPY_AND_UPDATE, COPY_AND_SYNC]
+    # the upsert driver decides on the server whether to insert or update
+    is_upsert = args.driver == DRIVER_UPSERT
+    n, n2 = table_count[t]
+    # filtered tables (--where, --subset) are read through the client
+    condition = args.conditions.get(t, '')
+
+    # target primary key
+    pk_trg = pk_info[TRG][t]
+    source = None
+    if (args.server_side is not None) and (args.max_rows <= 0) and (not condition):
+        source = server_source(jdbc, t, pk_trg, args)
+    if args.staging and (args.mode != COPY_EMPTY) and (source is None) and (not condition):
+        return staging_copy(jdbc, t, n, pk_trg, args, commit_mode, counters, reject_writer)
+
+    if args.reverse_insert or args.update_fast:
+        pk_order = 'DESC'
+    else:
+        pk_order = 'ASC'
+    last_key = journal.last_key(t) if (journal is not None) and (key_range is None) else None
+    if last_key is not None:
+        if (pk_order == 'DESC') or (args.mode == COPY_AND_SYNC):
+            report('Table {} was in progress: restarted (no resume in descending order or sync mode).'.format(t))
+        else:
+            report('Resuming {} after {} = {}'.format(t, pk_trg, last_key))
+            key_range = (last_key, None)
+
+    if source is not None:
+        return server_side_copy(jdbc, t, source, args, commit_mode, counters, key_range, journal)
+    if (key_range is None) and (args.split > 1) and (n >= SPLIT_MIN_ROWS):
+        return split_copy(jdbc, t, table_count, pk_info, args, commit_mode, counters, reject_writer)
+    if args.checksum and (args.mode != COPY_EMPTY) and (n2 > 0) and (not condition):
+        if supports_checksum(jdbc[SRC], jdbc[TRG]):
+            return checksum_copy(jdbc, t, pk_info, args, commit_mode, counters, reject_writer, key_range)
+        report('Checksum sync of {} not supported from {} to {}: rows are compared one by one.'.format(
+            t, jdbc[SRC].type, jdbc[TRG].type))
+
+    src_condition, src_parameters = '', None
+    trg_condition, trg_parameters = '', None
+    if key_range is not None:
+        src_condition, src_parameters = range_condition(pk_info[SRC][t], key_range)
+        trg_condition, trg_parameters = range_condition(pk_trg, key_range)
+    if condition:
+        src_condition = and_conditions(src_condition, condition)
+        if t in args.target_conditions:
+            trg_condition = and_conditions(trg_condition, condition)
+
+    try:
+        mapping = ColumnMapping(jdbc[SRC], jdbc[TRG], t, pk_trg)
+        cursor = jdbc[SRC].execute(mapping.select(src_condition, '{} {}'.format(pk_info[SRC][t], pk_order)),
+                                   src_parameters, cursor=None)
+    except (lwetl.SQLExecuteException, ValueError) as exec_error:
+        report('ERROR: table {} skipped on SQL retrieve error: {}'.format(t, str(exec_error)))
+        return True
+    if len(mapping.dropped) > 0:
+        report('Columns of {} not defined on target (not copied): {}'.format(t, ', '.join(mapping.dropped)))
+
+    # the target keys are streamed in the order of the source rows
+    merge = None
+    is_compare = False
+    if (n2 > 0) and (args.mode != COPY_EMPTY) and ((not is_upsert) or (args.mode == COPY_AND_SYNC)):
+        # existing rows are compared with the target values: only changed columns are updated
+        is_compare = is_update and (not is_upsert) and (not args.update_all)
+        # in the mode sync, obsolete target rows are deleted in chunks, as soon as they are found
+        is_sync = args.mode == COPY_AND_SYNC
+        merge_kwargs = {
+            'where': trg_condition,
+            'parameters': trg_parameters,
+            'value_columns': mapping.update_columns() if is_compare else None,
+            'collect_obsolete': is_sync,
+            'on_obsolete': partial(delete_obsolete, jdbc, t, pk_trg, args=args, counters=counters) if is_sync else None
+        }
+        if key_lookup:
+            merge = KeyLookup(jdbc[TRG], t, [pk_trg], **merge_kwargs)
+        else:
+            merge = MergeJoin(jdbc[TRG], t, [pk_trg], descending=(pk_order == 'DESC'), **merge_kwargs)
+
+    row_count = 0
+    skp_count = 0
+    upd_count = 0
+    new_count = 0
+    unchanged_count = 0
+    is_complete = True
+    t0_table = datetime.now()
+    rows = None
+    try:
+        is_batch = issubclass(UPLOAD_TYPES[args.driver], lwetl.MultiParameterUploader)
+        uploader_kwargs = batch_kwargs(args, reject_writer) if is_batch else dict()
+        uploader_kwargs['columns'] = mapping.target_columns
+        if is_upsert:
+            uploader_kwargs['key_columns'] = pk_trg
+            if not is_update:
+                uploader_kwargs['update_columns'] = []
+        with UPLOAD_TYPES[args.driver](jdbc[TRG], t.lower(), commit_mode=commit_mode,
+                                       **uploader_kwargs) as uploader:
+            rows = source_rows(jdbc, cursor, args)
+            for row in rows:
+                row_count += 1
+
+                pk = mapping.key(row)
+                in_target = (merge is not None) and merge.exists(pk)
+                record_exists = in_target and (not is_upsert)
+                changes = None
+                if record_exists and is_compare:
+                    changes = mapping.changes(row, merge.values)
+                if record_exists and (not is_update):
+                    skp_count += 1
+                    if args.update_fast:
+                        report('Heuristic fast update of {}. Skipping at rowcount {}'.format(t, row_count))
+                        is_complete = False
+                        break
+                elif (changes is not None) and (len(changes) == 0):
+                    skp_count += 1
+                    unchanged_count += 1
+                else:
+                    try:
+                        if record_exists:
+                            uploader.update(mapping.update_data(row) if changes is None else changes, {pk_trg: pk})
+                            upd_count += 1
+                        else:
+                            uploader.insert_row(mapping.columns, row)
+                            new_count += 1
+                    except lwetl.SQLExecuteException as insert_exception:
+                        if reject_writer is not None:
+                            reject_writer.write(t.lower(), 'update' if record_exists else 'insert',
+                                                mapping.as_dict(row), insert_exception)
+                        add_failures(counters)
+                        report('Insert error ({}) on row {}: {}'.format(
+                            counters[CNT_FAIL], row_count, str(insert_exception)))
+                        if (args.max_fail >= 0) and (counters[CNT_FAIL] > args.max_fail):
+                            report('Too many errors: terminating.')
+                            too_many_errors = True
+                    if too_many_errors:
+                        msg = 'Insert or Update failed {} times'.format(counters[CNT_FAIL])
+                        raise TooMayErrorsException(msg)
+
+                has_commit = False
+                if commit_is_due(uploader, args):
+                    uploader.commit()
+                    has_commit = True
+                    if (journal is not None) and (commit_mode == lwetl.UPLOAD_MODE_COMMIT) and (pk_order == 'ASC'):
+                        journal.checkpoint(t, pk, row_count)
+                if has_commit or ((row_count % args.commit_nr) == 0):
+                    report(
+                        ('{:8}. {:5.1f} % of {} records, new: {:8}, upd: {:8}, ign: {:8}. {}. ' 
+                         'Est. remaining time: {}').format(
+                            row_count, (100.0 * row_count / n), n, new_count, upd_count, skp_count, t,
+                            estimate_remaining(t0_table, row_count, n)))
+                if (args.max_rows > 0) and ((new_count + upd_count) > args.max_rows):
+                    report('Terminating after {} uploads on user request.'.format(row_count))
+                    is_complete = False
+                    break
+            if uploader.row_count > 0:
+                uploader.commit()
+                report(
+                    '{:8}. {:5.1f} % of {} records, new: {:8}, upd: {:8}, ign: {:8}. {}. finished'.format(
+                        row_count, (100.0 * row_count / n), n, new_count, upd_count, skp_count, t))
+            else:
+                report('Update of {} finished, No further commits. rc = {}'.format(t, row_count))
+            if uploader.controller is not None:
+                report('Adaptive upload of {}: {}'.format(t, uploader.controller.statistics()))
+            if is_batch and (uploader.reject_count > 0):
+                report('{:8}. rows of {} rejected, see: {}'.format(uploader.reject_count, t, args.reject_file))
+            print_pipeline_statistics(t, rows)
+
+            if (new_count + upd_count) > 0:
+                dt = datetime.now() - t0_table
+                dt_sec = dt.total_seconds()
+                if dt_sec > 0:
+                    rec_per_sec = int(round(1.0 * n / dt_sec))
+                else:
+                    rec_per_sec = 0
+                report(
+                    ('{:8}. {:5.1f} % of {} records, new: {:8}, '
+                     'upd: {:8}, ign: {:8}. {}. Used time: {} ({} rec/s)').format(
+                        row_count, (100.0 * row_count / n), n, new_count, upd_count, skp_count, t,
+                        timedelta_to_string(dt), rec_per_sec))
+
+        if merge is not None:
+            # target keys after the last source row are only obsolete if all source rows were read
+            if is_complete:
+                merge.finish()
+            else:
+                merge.flush_obsolete()
+            report('Found {} existing records of {} ({} key queries)'.format(merge.existing_count, t, merge.queries))
+            if is_compare:
+                report('Skipped {} unchanged records of {}'.format(unchanged_count, t))
+            if is_sync and (merge.obsolete_count > 0):
+                report('Sync: removed {} obsolete records in {} (target)'.format(merge.obsolete_count, t))
+                if commit_mode == lwetl.UPLOAD_MODE_COMMIT:
+                    jdbc[TRG].commit()
+                else:
+                    jdbc[TRG].rollback()
+
+    except lwetl.CommitException as ce:
+        add_failures(counters)
+        if not (args.ignore_commit_errors and (args.max_fail > 0) and (counters[CNT_FAIL] <= args.max_fail)):
+            report(('Upload encountered a commit exception row {}. '
+                   'Further processing ignored: {}').format(row_count, str(ce)), file=sys.stderr)
+            too_many_errors = True
+    except KeyOrderError as order_error:
+        # e.g., a case-insensitive collation: the rows processed so far are committed by the uploader.
+        # The copy is repeated: existing rows are found by the lookup, rows deleted by mistake are restored
+        report('Keys of {} not in the order of the merge ({}). Copied again with a lookup of the target keys.'.format(
+            t, order_error))
+        key_lookup = True
+    except TooMayErrorsException as tee:
+        report('Upload encountered on row {}. Further processing ignored: {}'.format(row_count, str(tee)),
+               file=sys.stderr)
+        too_many_errors = True
+    finally:
+        if isinstance(rows, CopyPipeline):
+            rows.close()
+        add_count(counters, CNT_NEW, new_count)
+        add_count(counters, CNT_UPDATED, upd_count)
+    if key_lookup and isinstance(merge, MergeJoin):
+        return copy_table(jdbc, t, table_count, pk_info, args, commit_mode, counters, reject_writer, key_range,
+                          journal, key_lookup=True)
+    return too_many_errors
+
+
+def copy_range(args, t: str, table_count: dict, pk_info: dict, commit_mode: str, key_range: tuple,
+               nr: int, n_ranges: int) -> (bool, dict):
+    """
+    Copy a key range of a table on a private pair of connections. Runs in a separate process, see split_copy()
+    @param nr: int - number of the range
+    @param n_ranges: int - the number of ranges of the table
+    For the other parameters see copy_table()
+    @return: tuple (bool - True if the number of failures exceeds the limit, dict - the copy statistics)
+    """
+    multiprocessing.current_process().name = '{} {}/{}'.format(t, nr, n_ranges)
+    counters = new_counters()
+    n, n2 = table_count[t]
+    range_count = {t: (max(1, n // n_ranges), n2)}
+    jdbc = dict()
+    reject_writer = None
+    try:
+        jdbc[SRC] = lwetl.Jdbc(args.login_source)
+        jdbc[TRG] = lwetl.Jdbc(args.login_target)
+        if args.bulk_mode and (commit_mode == lwetl.UPLOAD_MODE_COMMIT):
+            for disable_sql, _ in SESSION_STATEMENTS.get(jdbc[TRG].type, []):
+                jdbc[TRG].execute(disable_sql, cursor=None)
+        if args.reject_file is not None:
+            args.reject_file = '{}.{}'.format(args.reject_file, nr)
+            reject_writer = lwetl.RejectWriter(args.reject_file)
+        too_many_errors = copy_table(jdbc, t, range_count, pk_info, args, commit_mode, counters, reject_writer,
+                                     key_range)
+        if (not too_many_errors) and (commit_mode == lwetl.UPLOAD_MODE_COMMIT) and (args.max_rows <= 0):
+            SplitCheckpoint(t, n_ranges, checkpoint_directory(args.journal_file)).mark_done(nr, key_range, counters)
+    finally:
+        if reject_writer is not None:
+            reject_writer.close()
+        for con in jdbc.values():
+            con.close()
+    return too_many_errors, counters
+
+
+def split_copy(jdbc: dict, t: str, table_count: dict, pk_info: dict, args, commit_mode: str, counters: dict,
+               reject_writer=None) -> bool:
+    """
+    Copy a table in ranges of the primary key with about the same number of rows. Each range is copied in
+    a separate process. Ranges, which were finished by an earlier run, are skipped.
+    For the parameters see copy_table()
+    @return: bool - True if the number of failures exceeds the limit
+    """
+    pk = pk_info[SRC][t]
+    try:
+        boundaries = key_boundaries(jdbc[SRC], t, pk, args.split)
+    except lwetl.SQLExecuteException as split_error:
+        report('Cannot split table {}: {}'.format(t, split_error))
+        boundaries = []
+    ranges = key_ranges(boundaries)
+    if len(ranges) < 2:
+        report('Table {} cannot be split on {}: copied in one range.'.format(t, pk))
+        return copy_table(jdbc, t, table_count, pk_info, args, commit_mode, counters, reject_writer,
+                          (None, None))
+
+    # the processes of the ranges only use the conditions on the key tables, not their connection
+    range_args = copy.copy(args)
+    range_args.key_sets = None
+
+    checkpoint = SplitCheckpoint(t, len(ranges), checkpoint_directory(args.journal_file))
+    tasks = []
+    for nr, key_range in enumerate(ranges, 1):
+        # the checkpoints of an earlier run only count on resume
+        if args.resume and checkpoint.is_done(nr, key_range):
+            report('Range {}/{} of {} ({} < {} <= {}) finished before: skipped.'.format(
+                nr, len(ranges), t, key_range[0], pk, key_range[1]))
+        else:
+            tasks.append((range_args, t, table_count, pk_info, commit_mode, key_range, nr, len(ranges)))
+    report('Copy {} in {} ranges of {}: {} processes.'.format(t, len(ranges), pk, len(tasks)))
+
+    t0 = datetime.now()
+    totals = new_counters()
+    too_many_errors = False
+    if len(tasks) > 0:
+        # the JVM of the parent cannot be forked: start fresh processes
+        with multiprocessing.get_context('spawn').Pool(len(tasks)) as pool:
+            results = [(task[6], pool.apply_async(copy_range, task)) for task in tasks]
+            for nr, result in results:
+                try:
+                    range_errors, range_counters = result.get()
+                except Exception as range_error:
+                    report('ERROR in range {}/{} of {}: {}'.format(nr, len(ranges), t, range_error),
+                           file=sys.stderr)
+                    range_errors, range_counters = True, new_counters()
+                    range_counters[CNT_FAIL] = 1
+                too_many_errors = too_many_errors or range_errors
+                for key in [CNT_FAIL, CNT_NEW, CNT_UPDATED]:
+                    totals[key] += range_counters[key]
+                    add_count(counters, key, range_counters[key])
+    if (args.max_fail >= 0) and (counters[CNT_FAIL] > args.max_fail):
+        too_many_errors = True
+    if not too_many_errors:
+        checkpoint.clear()
+    report('{}: {} ranges, new: {:8}, upd: {:8}, fails: {}. Used time: {}'.format(
+        t, len(tasks), totals[CNT_NEW], totals[CNT_UPDATED], totals[CNT_FAIL],
+        timedelta_to_string(datetime.now() - t0)))
+    return too_many_errors
+
+
+def run_table(jdbc: dict, t: str, table_count: dict, pk_info: dict, args, commit_mode: str, counters: dict,
+              reject_writer=None, journal: CopyJournal = None) -> bool:
+    """
+    Copy a table, and record it in the journal as finished, if the number of failures is within the limit
+    For the parameters see copy_table()
+    @return: bool - True if the number of failures exceeds the limit
+    """
+    too_many_errors = copy_table(jdbc, t, table_count, pk_info, args, commit_mode, counters, reject_writer,
+                                 journal=journal)
+    if (journal is not None) and (not too_many_errors):
+        journal.finish(t, table_count[t])
+    return too_many_errors
+
+
+def start_table(t: str, copy_list: list, table_count: dict, pk_info: dict, counters: dict):
+    with COUNTER_LOCK:
+        counters[CNT_COPIED_TABLES] += 1
+        nr = counters[CNT_COPIED_TABLES]
+    report("CC {:3}. of {}: copy {:<30} n = {:6} values (PK = {}) .......".format(
+        nr, len(copy_list), t, table_count[t][0], pk_info[SRC][t]))
+
+
+def copy_worker(scheduler: TableScheduler, copy_list: list, table_count: dict, pk_info: dict, args,
+                commit_mode: str, counters: dict, reject_writer, bulk_mode, journal, results: dict):
+    """
+    Copy the tables handed out by the scheduler on a private pair of connections
+    @param scheduler: TableScheduler
+    @param results: dict - the worker stores its result (too many errors, or an exception) under its name
+    For the other parameters see copy_tables()
+    """
+    name = threading.current_thread().name
+    jdbc = dict()
+    t0 = datetime.now()
+    n_tables = 0
+    results[name] = False
+    try:
+        jdbc[SRC] = lwetl.Jdbc(args.login_source)
+        jdbc[TRG] = lwetl.Jdbc(args.login_target)
+        tag_connection('{}-{}'.format(SRC, name), jdbc[SRC])
+        tag_connection('{}-{}'.format(TRG, name), jdbc[TRG])
+        if bulk_mode is not None:
+            bulk_mode.apply_session(jdbc[TRG])
+        while True:
+            t = scheduler.next_table()
+            if t is None:
+                break
+            n_tables += 1
+            start_table(t, copy_list, table_count, pk_info, counters)
+            try:
+                too_many_errors = run_table(jdbc, t, table_count, pk_info, args, commit_mode, counters,
+                                            reject_writer, journal)
+            finally:
+                scheduler.done(t)
+            if too_many_errors:
+                results[name] = True
+                scheduler.stop()
+    except Exception as worker_error:
+        report('ERROR: {}'.format(worker_error), file=sys.stderr)
+        results[name] = worker_error
+        scheduler.stop()
+    finally:
+        for con in jdbc.values():
+            con.close()
+        report('finished {} tables. Used time: {}'.format(n_tables, timedelta_to_string(datetime.now() - t0)))
+
+
+def copy_tables(jdbc: dict, copy_list: list, table_count: dict, pk_info: dict, args, commit_mode: str,
+                counters: dict, reject_writer=None, table_info: dict = None, bulk_mode=None,
+                journal: CopyJournal = None) -> bool:
+    """
+    Copy the tables from the source to the target database
+    @param jdbc: dict of the source and target connections
+    @param copy_list: list of the tables to copy, in order
+    @param table_count: dict of the row counts (source, target) of each table
+    @param pk_info: dict of the primary key column of each table of the source and the target
+    @param args: parsed command line arguments
+    @param commit_mode: str - commit mode of the target tables
+    @param counters: dict with the copy statistics
+    @param reject_writer: RejectWriter or None
+    @param table_info: dict with the FK reference info of the target tables. Required for parallel copies
+    @param bulk_mode: BulkLoadMode or None - session settings are applied to the connections of the workers
+    @param journal: CopyJournal or None - the checkpoint journal
+    @return: bool - True if the copy was terminated on errors
+    """
+    too_many_errors = False
+    if args.jobs <= 1:
+        for t in copy_list:
+            start_table(t, copy_list, table_count, pk_info, counters)
+            too_many_errors = run_table(jdbc, t, table_count, pk_info, args, commit_mode, counters, reject_writer,
+                                        journal)
+            if too_many_errors:
+                break
+        return too_many_errors
+
+    # parallel copy: tables are started once the tables they refer to are finished, the largest first
+    scheduler = TableScheduler(copy_list, dependency_graph(copy_list, table_info),
+                               dict([(t, table_count[t][0]) for t in copy_list]))
+    results = dict()
+    workers = []
+    for x in range(min(args.jobs, len(copy_list))):
+        worker = threading.Thread(
+            target=copy_worker, name='W{}'.format(x + 1),
+            args=(scheduler, copy_list, table_count, pk_info, args, commit_mode, counters, reject_writer,
+                  bulk_mode, journal, results))
+        worker.start()
+        workers.append(worker)
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        scheduler.stop()
+        print('Interrupted: waiting for the running tables to finish.', file=sys.stderr)
+        for worker in workers:
+            worker.join()
+        raise
+    return any([result is not False for result in results.values()])
+
+
 def main():
     if (len(sys.argv) > 1) and (sys.argv[1].lower() == '--version'):
         print('{}, version: {}'.format(os.path.basename(sys.argv[0]), __version__))
@@ -111,6 +956,8 @@ def main():
     if args.version:
         print('{}, version: {}'.format(os.path.basename(sys.argv[0]), __version__))
         sys.exit(0)
+    if args.link and (args.server_side is None):
+        args.server_side = 1
 
     included_tables = []
     if args.tables is not None:
@@ -129,6 +976,19 @@ def main():
                 if (len(t) > 0) and (t not in excluded_tables):
                     excluded_tables.append(t)
 
+    journal = None
+    if args.activate:
+        try:
+            journal = CopyJournal(args.journal_file, args.login_source, args.login_target, resume=args.resume)
+            if not args.resume:
+                # a fresh start: the finished ranges of an earlier run do not apply
+                remove_checkpoints(checkpoint_directory(args.journal_file))
+        except (ValueError, OSError) as journal_error:
+            print('ERROR: cannot resume from {}: {}'.format(args.journal_file, journal_error))
+            sys.exit(1)
+    elif args.resume:
+        print('Resume ignored: requires the -a option.')
+
     jdbc = {
         SRC: args.login_source,
         TRG: args.login_target
@@ -171,36 +1031,97 @@ def main():
             if table_name not in tables:
                 tables[table_name] = dict()
             if not is_empty(d.get('FK_TABLE', None)):
-                tables[table_name][d['COLUMN_NAME'].upper()] = d['FK_TABLE'].upper(), d['CONSTRAINT_NAME'].upper()
+                tables[table_name][d['COLUMN_NAME'].upper()] = \
+                    d['FK_TABLE'].upper(), d['CONSTRAINT_NAME'].upper(), (d.get('FK_COLUMN', None) or '').upper()
             if d.get('KEY_TYPE', None) == 'PK':
                 pk_col[table_name] = d['COLUMN_NAME'].upper()
         table_info[key] = tables
         pk_info[key] = pk_col
 
     table_admin = dict()
-    for t in [COMMON, EMPTY, IGNORED, MISSING, NO_SOURCE]:
+    for t in [COMMON, EMPTY, IGNORED, MISSING, NO_SOURCE, FINISHED]:
         table_admin[t] = []
 
+    candidates = [t for t in sorted([k for k in table_info[SRC].keys() if k in table_info[TRG]])
+                  if (t not in excluded_tables) and ((len(included_tables) == 0) or (t in included_tables))]
+    try:
+        args.conditions = parse_conditions(args.where, candidates)
+    except ValueError as where_error:
+        print('ERROR: ' + str(where_error))
+        clean_exit(jdbc, args, 1)
+    # the conditions of --where also apply to the target rows (scan of the existing keys, obsolete rows)
+    args.target_conditions = list(args.conditions.keys())
+    if args.subset is not None:
+        if len(args.conditions) == 0:
+            print('ERROR: a subset requires the conditions of the root tables (--where).')
+            clean_exit(jdbc, args, 1)
+        elif args.mode == COPY_AND_SYNC:
+            print("ERROR: a subset cannot be copied in the mode 'sync'.")
+            clean_exit(jdbc, args, 1)
+        args.target_conditions = []
+        roots = sorted(args.conditions.keys())
+        materialize = None
+        if args.key_tables and args.activate and (not args.list):
+            # dropped by clean_exit()
+            args.key_sets = KeySets(jdbc[SRC], pk_info[SRC])
+            materialize = args.key_sets.materialize
+        elif args.key_tables:
+            print('WARNING: no key tables of the subset created without the -a option, or with --list.')
+        args.conditions, skipped_references = subset_conditions(candidates, table_info[SRC], pk_info[SRC],
+                                                                args.conditions, args.subset == SUBSET_CHILDREN,
+                                                                materialize=materialize)
+        for table, column in skipped_references:
+            print('WARNING: reference {}.{} in a cycle not followed: the subset may violate it.'.format(table, column))
+        print('Subset of {} tables from the roots: {}'.format(len(args.conditions), ', '.join(roots)))
+
     table_count = dict()
+    to_count = []
     for t in sorted([k for k in table_info[SRC].keys() if k in table_info[TRG]]):
-        sql = 'SELECT COUNT(*) FROM ' + t
-        n1 = jdbc[SRC].get_int(sql)
-        n2 = jdbc[TRG].get_int(sql)
-        table_count[t] = n1, n2
-        if (t not in excluded_tables) and \
-                ((len(included_tables) == 0) or (t in included_tables)):
-            if n1 == 0:
-                table_admin[EMPTY].append(t)
-            else:
-                if (n2 == 0) or (args.mode != COPY_EMPTY):
-                    table_admin[COMMON].append(t)
-                else:
-                    table_admin[IGNORED].append(t)
-        else:
+        if (t not in candidates) or ((args.subset is not None) and (t not in args.conditions)):
             table_admin[IGNORED].append(t)
+        elif (journal is not None) and journal.is_done(t):
+            # finished by the previous run: not counted again
+            table_count[t] = journal.counts(t)
+            table_admin[FINISHED].append(t)
+        else:
+            to_count.append(t)
+
+    t0_count = datetime.now()
+    try:
+        table_count.update(table_counts((jdbc[SRC], jdbc[TRG]), to_count, estimate=(args.estimate or args.list),
+                                        jobs=args.jobs))
+    except lwetl.SQLExecuteException as count_error:
+        print('ERROR: cannot count the rows of the tables: {}'.format(count_error))
+        clean_exit(jdbc, args, 1)
+    print('{} the rows of {} tables in {}.'.format('Estimated' if (args.estimate or args.list) else 'Counted',
+                                                     len(to_count), timedelta_to_string(datetime.now() - t0_count)))
+    filtered = [t for t in to_count if t in args.conditions]
+    if len(filtered) > 0:
+        t0_count = datetime.now()
+        try:
+            for t in filtered:
+                table_count[t] = count_rows(jdbc[SRC], t, args.conditions[t]), table_count[t][1]
+        except lwetl.SQLExecuteException as count_error:
+            print('ERROR: cannot count the selected rows: {}'.format(count_error))
+            clean_exit(jdbc, args, 1)
+        print('Counted the selected rows of {} tables in {}.'.format(
+            len(filtered), timedelta_to_string(datetime.now() - t0_count)))
+
+    for t in to_count:
+        n1, n2 = table_count[t]
+        if n1 == 0:
+            table_admin[EMPTY].append(t)
+        else:
+            is_partial = (journal is not None) and (journal.last_key(t) is not None)
+            if (n2 == 0) or (args.mode != COPY_EMPTY) or is_partial:
+                table_admin[COMMON].append(t)
+            else:
+                table_admin[IGNORED].append(t)
+    table_admin[IGNORED].sort()
 
     print_list('Tables to copy', table_admin[COMMON], table_count)
     print_list('Tables ignored (not empty or marked)', table_admin[IGNORED], table_count)
+    print_list('Tables finished by the previous run', table_admin[FINISHED], table_count)
     print_list('Empty source', table_admin[EMPTY], table_count)
 
     missing_tables = sorted([k for k in table_info[SRC].keys() if k not in table_info[TRG]])
@@ -240,171 +1161,54 @@ def main():
         print('Activating upload.')
         commit_mode = lwetl.UPLOAD_MODE_COMMIT
 
-    if (args.mode in [COPY_AND_UPDATE, COPY_AND_SYNC]) and (args.driver == DRIVER_MULTI):
-        print('WARNING: multi mode not supported for updates. Switching to single.')
-        args.mode = DRIVER_SINGLE
+    counters = new_counters()
 
-    counters = {
-        CNT_COPIED_TABLES: 0,
-        CNT_FAIL: 0
-    }
-
-    too_many_errors = False
-    is_update = args.mode in [COPY_AND_UPDATE, COPY_AND_SYNC]
-    for t in copy_list:
-        counters[CNT_COPIED_TABLES] += 1
-        n, n2 = table_count[t]
-        print("CC {:3}. of {}: copy {:<30} n = {:6} values (PK = {}) .......".format(
-            counters[CNT_COPIED_TABLES], len(copy_list), t, n, pk_info[SRC][t]))
-
-        existing_records = []
-        # target primary key
-        pk_trg = pk_info[TRG][t]
-        if (n2 > 0) and (args.mode != COPY_EMPTY):
-            for r in jdbc[TRG].query("SELECT {0} FROM {1} ORDER BY {0}".format(pk_trg, t)):
-                existing_records.append(r[0])
-            print('Found {} existing records from {} to {}'.format(
-                len(existing_records), min(existing_records), max(existing_records)))
-        existing_records = set(existing_records)
+    reject_writer = None
+    if args.reject_file is not None:
+        reject_writer = lwetl.RejectWriter(args.reject_file)
 
+    bulk_mode = None
+    if args.bulk_mode and (commit_mode == lwetl.UPLOAD_MODE_COMMIT):
+        bulk_mode = lwetl.BulkLoadMode(jdbc[TRG], copy_list, restore_file=BULK_MODE_RESTORE_FILE)
         try:
-            if args.reverse_insert or args.update_fast:
-                pk_order = 'DESC'
-            else:
-                pk_order = 'ASC'
-            cursor = jdbc[SRC].execute('SELECT * FROM {} ORDER BY {} {}'.format(
-                t, pk_info[SRC][t], pk_order), cursor=None)
-        except lwetl.SQLExecuteException as exec_error:
-            print('ERROR: table {} skipped on SQL retrieve error: {}'.format(t, str(exec_error)))
-            too_many_errors = True
-            cursor = None
-        if too_many_errors:
-            break
-
-        row_count = 0
-        skp_count = 0
-        upd_count = 0
-        new_count = 0
-        found_records = []
-        t0_table = datetime.now()
-        try:
-            with UPLOAD_TYPES[args.driver](jdbc[TRG], t.lower(), commit_mode=commit_mode) as uploader:
-                for d in jdbc[SRC].get_data(cursor=cursor, return_type=dict, include_none=is_update):
-                    row_count += 1
-
-                    pk = d[pk_trg]
-                    if args.mode == COPY_AND_SYNC:
-                        found_records.append(pk)
-                    record_exists = (pk in existing_records)
-                    if record_exists and (not is_update):
-                        skp_count += 1
-                        if args.update_fast:
-                            print('Heuristic fast update of {}. Skipping at rowcount {}'.format(t, row_count))
-                            break
-                    else:
-                        try:
-                            if record_exists:
-                                del d[pk_trg]
-                                uploader.update(d, {pk_trg: pk})
-                                upd_count += 1
-                            else:
-                                if is_update:
-                                    none_keys = [c for c, v in d.items() if v is None]
-                                    for k in none_keys:
-                                        del d[k]
-                                uploader.insert(d)
-                                new_count += 1
-                        except lwetl.SQLExecuteException as insert_exception:
-                            counters[CNT_FAIL] += 1
-                            print('Insert error ({}) on row {}: {}'.format(
-                                counters[CNT_FAIL], row_count, str(insert_exception)))
-                            if (args.max_fail >= 0) and (counters[CNT_FAIL] > args.max_fail):
-                                print('Too many errors: terminating.')
-                                too_many_errors = True
-                        if too_many_errors:
-                            msg = 'Insert or Update failed {} times'.format(counters[CNT_FAIL])
-                            raise TooMayErrorsException(msg)
-
-                    has_commit = False
-                    if uploader.row_count >= args.commit_nr:
-                        uploader.commit()
-                        has_commit = True
-                    if has_commit or ((row_count % args.commit_nr) == 0):
-                        print(
-                            ('{:8}. {:5.1f} % of {} records, new: {:8}, upd: {:8}, ign: {:8}. {}. ' 
-                             'Est. remaining time: {}').format(
-                                row_count, (100.0 * row_count / n), n, new_count, upd_count, skp_count, t,
-                                estimate_remaining(t0_table, row_count, n)))
-                    if (args.max_rows > 0) and ((new_count + upd_count) > args.max_rows):
-                        print('Terminating after {} uploads on user request.'.format(row_count))
-                        break
-                if uploader.row_count > 0:
-                    uploader.commit()
-                    print(
-                        '{:8}. {:5.1f} % of {} records, new: {:8}, upd: {:8}, ign: {:8}. {}. finished'.format(
-                            row_count, (100.0 * row_count / n), n, new_count, upd_count, skp_count, t))
-                else:
-                    print('Update of {} finished, No further commits. rc = {}'.format(t, row_count))
-
-                if (new_count + upd_count) > 0:
-                    dt = datetime.now() - t0_table
-                    dt_sec = dt.total_seconds()
-                    if dt_sec > 0:
-                        rec_per_sec = int(round(1.0 * n / dt_sec))
-                    else:
-                        rec_per_sec = 0
-                    print(
-                        ('{:8}. {:5.1f} % of {} records, new: {:8}, '
-                         'upd: {:8}, ign: {:8}. {}. Used time: {} ({} rec/s)').format(
-                            row_count, (100.0 * row_count / n), n, new_count, upd_count, skp_count, t,
-                            timedelta_to_string(dt), rec_per_sec))
-
-            if args.mode == COPY_AND_SYNC:
-                to_delete = list(existing_records - set(found_records))
-                if len(to_delete) > 0:
-                    print('Sync: removing {} obsolete records in {} (target)'.format(len(to_delete), t))
-                    while len(to_delete) > 0:
-                        if len(to_delete) > 500:
-                            delete_list = to_delete[0:500]
-                            to_delete = to_delete[500:]
-                        else:
-                            delete_list = [pk for pk in to_delete]
-                            to_delete = []
-                        par_list = ['?'] * len(delete_list)
-                        sql = 'DELETE FROM {0} WHERE {1} IN ({2})'.format(t, pk_trg, ','.join(par_list))
-                        try:
-                            jdbc[TRG].execute(sql, delete_list, cursor=None)
-                        except lwetl.SQLExecuteException as delete_exception:
-                            counters[CNT_FAIL] += len(delete_list)
-                            print(delete_exception)
-                            print('Delete error ({}) in table {} on rows {}'.format(
-                                counters[CNT_FAIL], t, ', '.join([str(pk) for pk in delete_list])))
-                            if (args.max_fail >= 0) and (counters[CNT_FAIL] > args.max_fail):
-                                print('Too many errors: terminating.')
-                                too_many_errors = True
-                            if too_many_errors:
-                                raise TooMayErrorsException(
-                                    'Insert, Update, and Delete failed {} times'.format(counters[CNT_FAIL]))
-                    if commit_mode == lwetl.UPLOAD_MODE_COMMIT:
-                        jdbc[TRG].commit()
-                    else:
-                        jdbc[TRG].rollback()
-
-        except lwetl.CommitException as ce:
-            counters[CNT_FAIL] += 1
-            if not (args.ignore_commit_errors and (args.max_fail > 0) and (counters[CNT_FAIL] <= args.max_fail)):
-                print(('Upload encountered a commit exception row {}. '
-                       'Further processing ignored: {}').format(row_count, str(ce)), file=sys.stderr)
+            bulk_mode.disable()
+            print('Bulk mode: disabled {} indexes and constraints. Restore script: {}'.format(
+                len(bulk_mode.disabled), BULK_MODE_RESTORE_FILE))
+        except lwetl.SQLExecuteException as bulk_mode_error:
+            print('ERROR: ' + str(bulk_mode_error), file=sys.stderr)
+            clean_exit(jdbc, args, 1)
+    elif args.bulk_mode:
+        print('Bulk mode ignored: requires the -a option.')
+    if args.staging and (commit_mode != lwetl.UPLOAD_MODE_COMMIT):
+        # the staging tables are created and loaded on the target with commits
+        print('Staging ignored: requires the -a option.')
+        args.staging = False
+
+    too_many_errors = False
+    try:
+        too_many_errors = copy_tables(jdbc, copy_list, table_count, pk_info, args, commit_mode, counters,
+                                      reject_writer, table_info[TRG], bulk_mode, journal)
+    finally:
+        if bulk_mode is not None:
+            print('Bulk mode: restoring {} indexes and constraints.'.format(len(bulk_mode.disabled)))
+            try:
+                bulk_mode.restore()
+            except lwetl.SQLExecuteException as restore_error:
+                print('ERROR: ' + str(restore_error), file=sys.stderr)
                 too_many_errors = True
-        except TooMayErrorsException as tee:
-            print('Upload encountered on row {}. Further processing ignored: {}'.format(row_count, str(tee)),
-                  file=sys.stderr)
-            too_many_errors = True
-        if too_many_errors:
-            break
 
+    if reject_writer is not None:
+        if reject_writer.count > 0:
+            print('WARNING: {} rows rejected, see: {}'.format(reject_writer.count, args.reject_file))
+        reject_writer.close()
     if counters[CNT_FAIL] > 0:
         print('WARNING: not all data has been transferred. Errors = {}'.format(counters[CNT_FAIL]))
+    if journal is not None:
+        if too_many_errors or (counters[CNT_FAIL] > 0):
+            print('Progress recorded in {}: use --resume to continue.'.format(args.journal_file))
+        else:
+            journal.remove()
+            remove_checkpoints(checkpoint_directory(args.journal_file))
     rc = 1 if too_many_errors else 0
     clean_exit(jdbc, args, rc)
 
@@ -0,0 +1,295 @@
+"""
+Streaming existence checks for db-copy: the primary keys of the target table are read in key order, in
+chunks, and merged with the (equally ordered) source rows. Each source key is classified as new or
+existing, and target keys without a source row as obsolete. Memory does not grow with the table size.
+Optionally, the values of other columns are read along with the keys, to compare existing rows.
+If the database orders the keys differently than python (e.g., a case-insensitive collation of a character key),
+the merge fails with a KeyOrderError. The KeyLookup classifies the keys in any order, with all the target keys
+in memory.
+"""
+from lwetl.jdbc import Jdbc
+from lwetl.uploader import escape_column_names
+
+# number of target keys per query
+DEFAULT_CHUNK_SIZE = 10000
+# number of obsolete keys passed to the callback at once
+DEFAULT_OBSOLETE_CHUNK_SIZE = 500
+
+# query of the next chunk of keys
+CHUNK_QUERIES = {
+    'oracle': 'SELECT {columns} FROM {table} {where} ORDER BY {order} FETCH FIRST {n} ROWS ONLY',
+    'sqlserver': 'SELECT TOP ({n}) {columns} FROM {table} {where} ORDER BY {order}'
+}
+DEFAULT_CHUNK_QUERY = 'SELECT {columns} FROM {table} {where} ORDER BY {order} LIMIT {n}'
+
+
+class KeyOrderError(Exception):
+    """
+    The keys of the source or the target are not in the order of the merge, e.g., on a case-insensitive
+    collation of a character key
+    """
+    pass
+
+
+def after_condition(key_columns: list, key: tuple, descending: bool = False) -> (str, list):
+    """
+    @param key_columns: list of the key columns
+    @param key: tuple - the values of the key columns
+    @param descending: bool - keys in descending order
+    @return: tuple (str - condition for the keys after the specified key, list - the parameters)
+    """
+    operator = '<' if descending else '>'
+    terms = []
+    parameters = []
+    for x in range(len(key_columns)):
+        term = ['{} = ?'.format(c) for c in key_columns[:x]] + ['{} {} ?'.format(key_columns[x], operator)]
+        terms.append('(' + ' AND '.join(term) + ')')
+        parameters += list(key[:x + 1])
+    return '(' + ' OR '.join(terms) + ')', parameters
+
+
+class MergeJoin:
+    """
+    Classifies the keys of the source rows against the keys of the target table. The source keys must be
+    presented in the same order as the target keys are read.
+    """
+
+    def __init__(self, jdbc: Jdbc, table: str, key_columns: list, descending: bool = False,
+                 where: str = None, parameters: list = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 value_columns: list = None, collect_obsolete: bool = False, on_obsolete=None,
+                 obsolete_chunk_size: int = DEFAULT_OBSOLETE_CHUNK_SIZE):
+        """
+        @param jdbc: Jdbc - connection to the target database
+        @param table: str - name of the target table
+        @param key_columns: list of the key columns (or a str for a single key column)
+        @param descending: bool - keys in descending order
+        @param where: str - additional condition on the target rows (without WHERE)
+        @param parameters: list - parameters of the condition
+        @param chunk_size: int - number of keys per query
+        @param value_columns: list - other columns to read. The values of an existing key are available
+            in the attribute values after exists()
+        @param collect_obsolete: bool - collect the obsolete target keys. Otherwise, they are only counted
+        @param on_obsolete: function - called with a list of obsolete keys, as soon as obsolete_chunk_size keys
+            are collected, and with the remaining keys on finish(). Requires collect_obsolete
+        @param obsolete_chunk_size: int - number of obsolete keys per call of on_obsolete
+        """
+        self.jdbc = jdbc
+        self.table = table
+        self.key_columns = [key_columns] if isinstance(key_columns, str) else list(key_columns)
+        self.value_columns = list(value_columns or [])
+        self.descending = descending
+        self.where = where
+        self.parameters = list(parameters or [])
+        self.chunk_size = max(1, chunk_size)
+
+        self.chunk = []
+        self.chunk_values = []
+        self.position = 0
+        # values of the value columns of the last existing key
+        self.values = None
+        self.last_target = None
+        self.last_source = None
+        self.exhausted = False
+        # target keys without a source row, which are not passed to on_obsolete yet
+        self.collect_obsolete = collect_obsolete
+        self.on_obsolete = on_obsolete
+        self.obsolete_chunk_size = max(1, obsolete_chunk_size)
+        self.obsolete = []
+        self.obsolete_count = 0
+        self.existing_count = 0
+        self.queries = 0
+
+    def _key(self, key) -> tuple:
+        return key if isinstance(key, tuple) else (key,)
+
+    def _before(self, a: tuple, b: tuple) -> bool:
+        return (a > b) if self.descending else (a < b)
+
+    def _fetch(self):
+        conditions = []
+        parameters = []
+        if self.where:
+            conditions.append('(' + self.where + ')')
+            parameters += self.parameters
+        if self.last_target is not None:
+            condition, key_parameters = after_condition(self.key_columns, self.last_target, self.descending)
+            conditions.append(condition)
+            parameters += key_parameters
+        direction = ' DESC' if self.descending else ''
+        columns = self.key_columns
+        if len(self.value_columns) > 0:
+            columns = columns + escape_column_names(self.jdbc, self.value_columns)
+        sql = CHUNK_QUERIES.get(self.jdbc.type, DEFAULT_CHUNK_QUERY).format(
+            columns=', '.join(columns), table=self.table,
+            where='WHERE ' + ' AND '.join(conditions) if len(conditions) > 0 else '',
+            order=', '.join([c + direction for c in self.key_columns]), n=self.chunk_size)
+        rows = [tuple(r) for r in self.jdbc.query(sql, parameters if len(parameters) > 0 else None)]
+        n_keys = len(self.key_columns)
+        self.chunk = [r[:n_keys] for r in rows]
+        self.chunk_values = [r[n_keys:] for r in rows]
+        self.position = 0
+        self.queries += 1
+        if len(self.chunk) < self.chunk_size:
+            self.exhausted = True
+
+    def _head(self):
+        """
+        @return: tuple - the next unmatched target key, or None if there are no more
+        """
+        if self.position >= len(self.chunk):
+            if self.exhausted:
+                return None
+            self._fetch()
+            if len(self.chunk) == 0:
+                return None
+            for x in range(len(self.chunk)):
+                previous = self.last_target if x == 0 else self.chunk[x - 1]
+                if (previous is not None) and (not self._before(previous, self.chunk[x])):
+                    raise KeyOrderError('Target keys of {} out of order: {} after {}'.format(
+                        self.table, self.chunk[x], previous))
+            self.last_target = self.chunk[-1]
+        return self.chunk[self.position]
+
+    def _add_obsolete(self, key: tuple):
+        self.obsolete_count += 1
+        if self.collect_obsolete:
+            self.obsolete.append(key)
+            if (self.on_obsolete is not None) and (len(self.obsolete) >= self.obsolete_chunk_size):
+                self.flush_obsolete()
+
+    def flush_obsolete(self):
+        """
+        Pass the collected obsolete keys to on_obsolete, e.g., if the source rows were not read completely
+        """
+        if (self.on_obsolete is not None) and (len(self.obsolete) > 0):
+            keys = self.obsolete
+            self.obsolete = []
+            self.on_obsolete(keys)
+
+    def exists(self, key) -> bool:
+        """
+        Classify the next source key. Target keys before this key are obsolete
+        @param key: the key value (a tuple for composite keys)
+        @return: bool - True if the key exists in the target table
+        @raise KeyOrderError: if the source keys are not in the order of the target keys
+        """
+        key = self._key(key)
+        if (self.last_source is not None) and (not self._before(self.last_source, key)):
+            raise KeyOrderError('Source keys of {} out of order: {} after {}'.format(
+                self.table, key, self.last_source))
+        self.last_source = key
+        head = self._head()
+        while (head is not None) and self._before(head, key):
+            self._add_obsolete(head)
+            self.position += 1
+            head = self._head()
+        if head == key:
+            self.values = self.chunk_values[self.position]
+            self.position += 1
+            self.existing_count += 1
+            return True
+        self.values = None
+        return False
+
+    def finish(self) -> list:
+        """
+        Mark the target keys after the last source key as obsolete. Call after the last source row
+        @return: list of the obsolete target keys (tuples), which were not passed to on_obsolete
+        """
+        head = self._head()
+        while head is not None:
+            self._add_obsolete(head)
+            self.position += 1
+            head = self._head()
+        self.flush_obsolete()
+        return self.obsolete
+
+
+class KeyLookup:
+    """
+    Classifies the keys of the source rows against the keys of the target table, which are read into memory
+    at once. The source keys may be presented in any order. Same interface as the MergeJoin.
+    """
+
+    def __init__(self, jdbc: Jdbc, table: str, key_columns: list, where: str = None, parameters: list = None,
+                 value_columns: list = None, collect_obsolete: bool = False, on_obsolete=None,
+                 obsolete_chunk_size: int = DEFAULT_OBSOLETE_CHUNK_SIZE):
+        """
+        For the parameters see MergeJoin
+        """
+        self.jdbc = jdbc
+        self.table = table
+        self.key_columns = [key_columns] if isinstance(key_columns, str) else list(key_columns)
+        self.value_columns = list(value_columns or [])
+        self.where = where
+        self.parameters = list(parameters or [])
+        self.collect_obsolete = collect_obsolete
+        self.on_obsolete = on_obsolete
+        self.obsolete_chunk_size = max(1, obsolete_chunk_size)
+
+        # target key -> values of the value columns, of the keys without a source row (yet)
+        self.targets = None
+        self.values = None
+        self.obsolete = []
+        self.obsolete_count = 0
+        self.existing_count = 0
+        self.queries = 0
+
+    def _key(self, key) -> tuple:
+        return key if isinstance(key, tuple) else (key,)
+
+    def _load(self):
+        columns = self.key_columns
+        if len(self.value_columns) > 0:
+            columns = columns + escape_column_names(self.jdbc, self.value_columns)
+        sql = 'SELECT {} FROM {}'.format(', '.join(columns), self.table)
+        if self.where:
+            sql += ' WHERE ' + self.where
+        n_keys = len(self.key_columns)
+        self.targets = dict()
+        for r in self.jdbc.query(sql, self.parameters if len(self.parameters) > 0 else None):
+            r = tuple(r)
+            self.targets[r[:n_keys]] = r[n_keys:]
+        self.queries += 1
+
+    def flush_obsolete(self):
+        """
+        Pass the collected obsolete keys to on_obsolete
+        """
+        if (self.on_obsolete is not None) and (len(self.obsolete) > 0):
+            keys = self.obsolete
+            self.obsolete = []
+            self.on_obsolete(keys)
+
+    def exists(self, key) -> bool:
+        """
+        Classify the next source key
+        @param key: the key value (a tuple for composite keys)
+        @return: bool - True if the key exists in the target table
+        """
+        if self.targets is None:
+            self._load()
+        key = self._key(key)
+        if key in self.targets:
+            self.values = self.targets.pop(key)
+            self.existing_count += 1
+            return True
+        self.values = None
+        return False
+
+    def finish(self) -> list:
+        """
+        Mark the target keys without a source row as obsolete. Call after the last source row
+        @return: list of the obsolete target keys (tuples), which were not passed to on_obsolete
+        """
+        if self.targets is None:
+            self._load()
+        for key in self.targets.keys():
+            self.obsolete_count += 1
+            if self.collect_obsolete:
+                self.obsolete.append(key)
+                if (self.on_obsolete is not None) and (len(self.obsolete) >= self.obsolete_chunk_size):
+                    self.flush_obsolete()
+        self.targets = dict()
+        self.flush_obsolete()
+        return self.obsolete
@@ -0,0 +1,177 @@
+"""
+Pipelined copy for db-copy: a reader thread fetches the rows of the source cursor, a converter thread
+transforms them into python values, and the writer (the calling thread) uploads them to the target.
+The stages are joined by bounded queues: a slow stage blocks the stages in front of it.
+"""
+import threading
+
+from datetime import datetime
+from queue import Queue, Empty, Full
+
+from jaydebeapi import Cursor, Error
+
+from lwetl.exceptions import SQLExecuteException
+from lwetl.jdbc import Jdbc, DataTransformer
+
+# number of fetched batches waiting in each queue
+DEFAULT_QUEUE_SIZE = 8
+
+# seconds between checks of the stop signal while blocked on a queue
+POLL_INTERVAL = 0.1
+
+# marks the end of the data in a queue
+END_OF_DATA = None
+
+
+class StageStatistics:
+    """
+    Number of rows, working time, and stall time (waiting on the neighbouring stages) of a pipeline stage
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+        self.busy = 0.0
+        self.stall = 0.0
+
+    def __str__(self):
+        return '{}: {} rows, busy {:.1f} s, stalled {:.1f} s'.format(self.name, self.rows, self.busy, self.stall)
+
+
+class CopyPipeline:
+    """
+    Iterates over the rows of a source cursor, like Jdbc.get_data(), with the fetch and the conversion
+    of the rows in background threads.
+    """
+
+    def __init__(self, jdbc: Jdbc, cursor: Cursor, return_type=dict, include_none: bool = False,
+                 array_size: int = 1000, queue_size: int = DEFAULT_QUEUE_SIZE):
+        """
+        @param jdbc: Jdbc - the source connection. Must not be used by other threads during the iteration
+        @param cursor: Cursor - cursor of the executed query
+        @param return_type: return type of the rows, see Jdbc.get_data()
+        @param include_none: bool - return None values in dictionaries
+        @param array_size: int - number of rows per fetch
+        @param queue_size: int - number of fetched batches waiting between two stages
+        """
+        self.jdbc = jdbc
+        self.cursor = cursor
+        self.array_size = max(1, array_size)
+        self.transformer = DataTransformer(cursor, return_type=return_type, upper_case=jdbc.upper_case,
+                                           include_none=include_none, database_type=jdbc.type)
+        self.fetched = Queue(maxsize=max(1, queue_size))
+        self.converted = Queue(maxsize=max(1, queue_size))
+        self.stop = threading.Event()
+        self.threads = []
+
+        self.reader = StageStatistics('reader')
+        self.converter = StageStatistics('converter')
+        self.writer = StageStatistics('writer')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _put(self, queue: Queue, item, stage: StageStatistics) -> bool:
+        """
+        @return: bool - False if the pipeline was stopped before the item could be queued
+        """
+        t0 = datetime.now()
+        try:
+            while not self.stop.is_set():
+                try:
+                    queue.put(item, timeout=POLL_INTERVAL)
+                    return True
+                except Full:
+                    pass
+            return False
+        finally:
+            stage.stall += (datetime.now() - t0).total_seconds()
+
+    def _get(self, queue: Queue, stage: StageStatistics):
+        t0 = datetime.now()
+        try:
+            while True:
+                try:
+                    return queue.get(timeout=POLL_INTERVAL)
+                except Empty:
+                    if self.stop.is_set():
+                        return END_OF_DATA
+        finally:
+            stage.stall += (datetime.now() - t0).total_seconds()
+
+    def _read(self):
+        batch_nr = 0
+        while not self.stop.is_set():
+            batch_nr += 1
+            t0 = datetime.now()
+            try:
+                rows = self.cursor.fetchmany(self.array_size)
+            except Error as fetch_error:
+                self._put(self.fetched, SQLExecuteException(
+                    'Failed to fetch data in batch {}: {}'.format(batch_nr, fetch_error)), self.reader)
+                return
+            self.reader.busy += (datetime.now() - t0).total_seconds()
+            if len(rows) == 0:
+                break
+            self.reader.rows += len(rows)
+            if not self._put(self.fetched, rows, self.reader):
+                return
+        self._put(self.fetched, END_OF_DATA, self.reader)
+
+    def _convert(self):
+        while True:
+            rows = self._get(self.fetched, self.converter)
+            if (rows is END_OF_DATA) or isinstance(rows, Exception):
+                self._put(self.converted, rows, self.converter)
+                return
+            t0 = datetime.now()
+            try:
+                rows = [self.transformer(row) for row in rows]
+            except Exception as convert_error:
+                self._put(self.converted, convert_error, self.converter)
+                return
+            self.converter.busy += (datetime.now() - t0).total_seconds()
+            self.converter.rows += len(rows)
+            if not self._put(self.converted, rows, self.converter):
+                return
+
+    def __iter__(self):
+        self.threads = [threading.Thread(target=self._read, daemon=True),
+                        threading.Thread(target=self._convert, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+        t0 = datetime.now()
+        try:
+            while True:
+                rows = self._get(self.converted, self.writer)
+                if rows is END_OF_DATA:
+                    break
+                elif isinstance(rows, Exception):
+                    raise rows
+                for row in rows:
+                    self.writer.rows += 1
+                    yield row
+        finally:
+            self.writer.busy = (datetime.now() - t0).total_seconds() - self.writer.stall
+            self.close()
+
+    def close(self):
+        """
+        Stop the background threads and close the source cursor
+        """
+        self.stop.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.cursor is not None:
+            self.jdbc.close(self.cursor)
+            self.cursor = None
+
+    def statistics(self) -> str:
+        """
+        @return: str - the throughput and stall times of the stages
+        """
+        return ', '.join([str(stage) for stage in [self.reader, self.converter, self.writer]])
@@ -0,0 +1,140 @@
+"""
+Row counts of the tables for the planning of db-copy. Exact counts (SELECT COUNT(*)) scan the full tables:
+they run in parallel on separate connections. Alternatively, the counts are estimated from the catalog
+statistics, and empty tables are detected with (cheap) EXISTS queries.
+"""
+import queue
+import threading
+
+from lwetl.exceptions import SQLExecuteException
+from lwetl.jdbc import Jdbc
+from lwetl.queries import table_row_estimate_queries
+
+COUNT_QUERY = 'SELECT COUNT(*) FROM {0}'
+
+# returns 1 if the table has rows, 0 otherwise
+EXISTS_QUERIES = {
+    'oracle': 'SELECT COUNT(*) FROM DUAL WHERE EXISTS (SELECT 1 FROM {0})'
+}
+EXISTS_QUERY = 'SELECT CASE WHEN EXISTS (SELECT 1 FROM {0}) THEN 1 ELSE 0 END'
+
+
+def estimate_rows(jdbc: Jdbc) -> dict:
+    """
+    Read the estimated row counts from the catalog statistics
+    @param jdbc: Jdbc - database connection
+    @return: dict of the estimated row count of each table (upper case). Tables without statistics are
+        not included. Empty if the database type has no statistics
+    """
+    sql = table_row_estimate_queries.get(jdbc.type)
+    if sql is None:
+        return dict()
+    if '@SCHEMA@' in sql:
+        sql = sql.replace('@SCHEMA@', jdbc.schema)
+    estimates = dict()
+    try:
+        for table_name, num_rows in jdbc.query(sql):
+            if (num_rows is not None) and (num_rows >= 0):
+                estimates[table_name.upper()] = int(num_rows)
+    except SQLExecuteException:
+        # e.g., no access to the statistics
+        jdbc.rollback()
+    return estimates
+
+
+def count_query(jdbc: Jdbc, table: str, exists: bool = False) -> str:
+    """
+    @param jdbc: Jdbc - database connection
+    @param table: str - name of the table
+    @param exists: bool - only check if the table has rows
+    @return: str - the query of the row count, or of the EXISTS check
+    """
+    if exists:
+        return EXISTS_QUERIES.get(jdbc.type, EXISTS_QUERY).format(table)
+    return COUNT_QUERY.format(table)
+
+
+def count_worker(connections: tuple, tasks: queue.Queue, results: dict, errors: list):
+    """
+    Run count queries on a private set of connections, until the task queue is empty
+    @param connections: tuple of Jdbc - the connections to clone
+    @param tasks: Queue of tuples (connection index, table, exists)
+    @param results: dict - the counts are stored under (connection index, table)
+    @param errors: list - exceptions are added to this list
+    """
+    private = dict()
+    try:
+        while True:
+            try:
+                nr, table, exists = tasks.get_nowait()
+            except queue.Empty:
+                break
+            if nr not in private:
+                private[nr] = Jdbc(connections[nr].login)
+            jdbc = private[nr]
+            results[(nr, table)] = jdbc.get_int(count_query(jdbc, table, exists))
+    except Exception as count_error:
+        errors.append(count_error)
+    finally:
+        for jdbc in private.values():
+            jdbc.close()
+
+
+def run_counts(connections: tuple, tasks: list, jobs: int = 1) -> dict:
+    """
+    Run count queries. With more than one job, the queries run in parallel, each worker on its own connections
+    @param connections: tuple of Jdbc - database connections
+    @param tasks: list of tuples (connection index, table, exists), see count_query()
+    @param jobs: int - number of parallel workers
+    @return: dict of the counts of each (connection index, table)
+    """
+    results = dict()
+    if (jobs <= 1) or (len(tasks) < 2):
+        for nr, table, exists in tasks:
+            jdbc = connections[nr]
+            results[(nr, table)] = jdbc.get_int(count_query(jdbc, table, exists))
+        return results
+
+    task_queue = queue.Queue()
+    for task in tasks:
+        task_queue.put(task)
+    errors = []
+    workers = []
+    for x in range(min(jobs, len(tasks))):
+        worker = threading.Thread(target=count_worker, name='C{}'.format(x + 1),
+                                  args=(connections, task_queue, results, errors))
+        worker.start()
+        workers.append(worker)
+    for worker in workers:
+        worker.join()
+    if len(errors) > 0:
+        raise errors[0]
+    return results
+
+
+def table_counts(connections: tuple, tables: list, estimate: bool = False, jobs: int = 1) -> dict:
+    """
+    Count the rows of the tables on each connection
+    @param connections: tuple of Jdbc - database connections, e.g., (source, target)
+    @param tables: list of the table names (upper case)
+    @param estimate: bool - use the estimates of the catalog statistics. Empty tables are verified with EXISTS.
+        Only tables with rows and without a (non-zero) estimate are counted
+    @param jobs: int - number of parallel workers
+    @return: dict with a tuple of the row count on each connection for each table
+    """
+    nrs = range(len(connections))
+    if estimate:
+        counts = [estimate_rows(jdbc) for jdbc in connections]
+        # the statistics may be stale: an empty target decides on the copy in the mode 'empty'
+        checks = run_counts(connections, [(nr, t, True) for nr in nrs for t in tables], jobs)
+        for (nr, t), has_rows in checks.items():
+            if not has_rows:
+                counts[nr][t] = 0
+            elif counts[nr].get(t, 0) == 0:
+                counts[nr].pop(t, None)
+    else:
+        counts = [dict() for _ in connections]
+    pending = [(nr, t, False) for nr in nrs for t in tables if t not in counts[nr]]
+    for (nr, t), n in run_counts(connections, pending, jobs).items():
+        counts[nr][t] = n
+    return dict([(t, tuple([counts[nr][t] for nr in nrs])) for t in tables])
@@ -0,0 +1,88 @@
+"""
+Scheduling of parallel table copies in db-copy: a table is handed out to a worker once all the tables
+it refers to (FK references) are finished. Of the tables that are ready, the largest goes first.
+"""
+import threading
+
+
+def dependency_graph(tables: list, table_info: dict) -> dict:
+    """
+    Get the parents of each table: the tables in the list, which it refers to with a foreign key
+    @param tables: list of table names
+    @param table_info: dict with the FK reference info of the tables:
+        table -> column -> (FK table, constraint, FK column)
+    @return: dict table -> set of parent tables. Self references are ignored
+    """
+    graph = dict()
+    for table in tables:
+        graph[table] = set([info[0] for info in table_info.get(table, dict()).values()
+                            if (info[0] != table) and (info[0] in tables)])
+    return graph
+
+
+class TableScheduler:
+    """
+    Thread-safe queue of tables, ordered by the FK dependencies and the size of the tables
+    """
+
+    def __init__(self, tables: list, parents: dict, weights: dict = None):
+        """
+        @param tables: list of the tables to copy
+        @param parents: dict table -> set of parent tables, see dependency_graph()
+        @param weights: dict table -> weight (e.g., the number of rows). Heavy tables are scheduled first
+        """
+        self.pending = list(tables)
+        self.parents = parents
+        self.weights = weights or dict()
+        self.running = set()
+        self.finished = set()
+        self.stopped = False
+        self.condition = threading.Condition()
+
+    def _ready(self) -> list:
+        return [t for t in self.pending if self.parents.get(t, set()) <= self.finished]
+
+    def _select(self):
+        ready = self._ready()
+        if (len(ready) == 0) and (len(self.running) == 0) and (len(self.pending) > 0):
+            # circular references: release the tables with the fewest unfinished parents
+            unfinished = dict([(t, len(self.parents.get(t, set()) - self.finished)) for t in self.pending])
+            least = min(unfinished.values())
+            ready = [t for t in self.pending if unfinished[t] == least]
+        if len(ready) == 0:
+            return None
+        return max(ready, key=lambda t: self.weights.get(t, 0))
+
+    def next_table(self):
+        """
+        Wait for the next table, which is ready to copy
+        @return: str - the name of the table, or None if all tables are handed out, or the scheduler stopped
+        """
+        with self.condition:
+            while True:
+                if self.stopped or (len(self.pending) == 0):
+                    return None
+                table = self._select()
+                if table is not None:
+                    self.pending.remove(table)
+                    self.running.add(table)
+                    return table
+                self.condition.wait()
+
+    def done(self, table: str):
+        """
+        Mark a table as finished
+        @param table: str - the name of the table
+        """
+        with self.condition:
+            self.running.discard(table)
+            self.finished.add(table)
+            self.condition.notify_all()
+
+    def stop(self):
+        """
+        Stop handing out tables. Tables in progress are not affected
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
@@ -0,0 +1,160 @@
+"""
+Key-range partitions for db-copy: a large table is divided into ranges of its primary key with (nearly)
+the same number of rows, which are copied in separate processes. Finished ranges are recorded in
+checkpoint files next to the journal, so an interrupted copy resumed with --resume skips them.
+"""
+import json
+import os
+
+from lwetl.exceptions import SQLExecuteException
+from lwetl.jdbc import Jdbc
+
+# extension of the directory of the checkpoint files of finished ranges, next to the journal
+SPLIT_CHECKPOINT_EXTENSION = '.split'
+
+# tables with fewer rows are not split
+SPLIT_MIN_ROWS = 10000
+
+# upper bound of the key in each of n tiles of (nearly) equal size
+NTILE_QUERY = 'SELECT MAX({0}) FROM (SELECT {0}, NTILE({2}) OVER (ORDER BY {0}) AS TILE FROM {1} {3}) t ' \
+              'GROUP BY TILE ORDER BY 1'
+
+
+def key_boundaries(jdbc: Jdbc, table: str, key_column: str, n: int, condition: str = '',
+                   parameters: list = None) -> list:
+    """
+    Get the keys, which divide the table in n ranges with (nearly) the same number of rows. Uses NTILE,
+    if supported by the database. Otherwise, the range between the minimum and maximum of a numeric key
+    is divided in equal parts.
+    @param jdbc: Jdbc - database connection
+    @param table: str - name of the table
+    @param key_column: str - primary key column
+    @param n: int - number of ranges
+    @param condition: str - only divide the rows matching this condition (without WHERE), see range_condition()
+    @param parameters: list - the parameters of the condition
+    @return: list of the n-1 (or less) upper boundaries of the ranges, in ascending order
+    """
+    where = 'WHERE ' + condition if condition else ''
+    try:
+        keys = [r[0] for r in jdbc.query(NTILE_QUERY.format(key_column, table, n, where), parameters)]
+        return [k for k in keys if k is not None][:-1]
+    except SQLExecuteException:
+        jdbc.rollback()
+    low, high = jdbc.query_single('SELECT MIN({0}), MAX({0}) FROM {1} {2}'.format(key_column, table, where),
+                                  parameters)
+    if not (isinstance(low, (int, float)) and isinstance(high, (int, float))):
+        return []
+    step = (high - low) / n
+    boundaries = []
+    for x in range(1, n):
+        key = low + x * step
+        if isinstance(low, int):
+            key = int(key)
+        if (len(boundaries) == 0) or (key > boundaries[-1]):
+            boundaries.append(key)
+    return boundaries
+
+
+def key_ranges(boundaries: list) -> list:
+    """
+    @param boundaries: list of the upper boundaries, see key_boundaries()
+    @return: list of tuples (lower bound, upper bound). None for the open ends
+    """
+    bounds = [None] + list(boundaries) + [None]
+    return [(bounds[x], bounds[x + 1]) for x in range(len(bounds) - 1)]
+
+
+def range_condition(key_column: str, key_range: tuple) -> (str, list):
+    """
+    @param key_column: str - primary key column
+    @param key_range: tuple (lower bound (exclusive), upper bound (inclusive)). None for an open end
+    @return: tuple (str - the condition, list - the parameters). Empty and None for an unbounded range
+    """
+    conditions = []
+    parameters = []
+    low, high = key_range
+    if low is not None:
+        conditions.append('{} > ?'.format(key_column))
+        parameters.append(low)
+    if high is not None:
+        conditions.append('{} <= ?'.format(key_column))
+        parameters.append(high)
+    if len(conditions) == 0:
+        return '', None
+    return ' AND '.join(conditions), parameters
+
+
+def checkpoint_directory(journal_file: str) -> str:
+    """
+    @param journal_file: str - the checkpoint journal of the copy
+    @return: str - the directory of the checkpoint files of the ranges
+    """
+    return os.path.splitext(journal_file)[0] + SPLIT_CHECKPOINT_EXTENSION
+
+
+def remove_checkpoints(directory: str):
+    """
+    Remove the checkpoint files of all tables, e.g., at the start of a copy, which is not resumed
+    @param directory: str - the directory of the checkpoint files
+    """
+    if os.path.isdir(directory):
+        for fname in os.listdir(directory):
+            if fname.endswith('.json'):
+                os.remove(os.path.join(directory, fname))
+        if len(os.listdir(directory)) == 0:
+            os.rmdir(directory)
+
+
+class SplitCheckpoint:
+    """
+    Checkpoint files of the finished ranges of a table
+    """
+
+    def __init__(self, table: str, n_ranges: int, directory: str):
+        self.table = table
+        self.n_ranges = n_ranges
+        self.directory = directory
+
+    def _file_name(self, nr: int) -> str:
+        return os.path.join(self.directory, '{}.{}-of-{}.json'.format(self.table, nr, self.n_ranges))
+
+    @staticmethod
+    def _key(key_range: tuple) -> list:
+        return [None if k is None else str(k) for k in key_range]
+
+    def is_done(self, nr: int, key_range: tuple) -> bool:
+        """
+        @param nr: int - number of the range
+        @param key_range: tuple - the bounds of the range
+        @return: bool - True if a range with the same bounds was finished before
+        """
+        fname = self._file_name(nr)
+        if not os.path.isfile(fname):
+            return False
+        try:
+            with open(fname) as f:
+                return json.load(f).get('range') == self._key(key_range)
+        except (OSError, ValueError):
+            return False
+
+    def mark_done(self, nr: int, key_range: tuple, counts: dict):
+        """
+        Record a finished range
+        @param nr: int - number of the range
+        @param key_range: tuple - the bounds of the range
+        @param counts: dict - statistics of the range
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._file_name(nr), 'w') as f:
+            json.dump({'table': self.table, 'range': self._key(key_range), 'counts': counts}, f)
+
+    def clear(self):
+        """
+        Remove the checkpoint files of the table
+        """
+        for nr in range(1, self.n_ranges + 1):
+            fname = self._file_name(nr)
+            if os.path.isfile(fname):
+                os.remove(fname)
+        if os.path.isdir(self.directory) and (len(os.listdir(self.directory)) == 0):
+            os.rmdir(self.directory)
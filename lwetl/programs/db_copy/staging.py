@@ -0,0 +1,266 @@
+"""
+Staging tables for db-copy: load the source rows into a copy of the target table,
+then reconcile the copy with the target table using set-based SQL statements.
+If the target database can read the source table itself (same instance, or a database link),
+the source table is reconciled directly, without transfer of the rows through the client.
+"""
+import re
+
+import lwetl
+
+from collections import OrderedDict
+
+from lwetl.jdbc import Jdbc
+from lwetl.uploader import escape_column_names
+
+# prefix of the staging tables created on the target database
+STAGING_PREFIX = 'LWS_'
+
+# maximum length of the name of the staging table (oracle < 12.2)
+MAX_NAME_LENGTH = 30
+
+STAGING_DELETE = 'delete'
+STAGING_UPDATE = 'update'
+STAGING_INSERT = 'insert'
+
+
+class ReconcileTable:
+    """
+    A new table read by the target database with the same layout as the live table: a staging table,
+    or the source table itself, see StagingTable and SourceTable.
+
+    It is reconciled with the live table with (at most) one DELETE, one UPDATE and one INSERT
+    statement. The client does not need to know which keys exist on either side.
+    """
+
+    def __init__(self, jdbc: Jdbc, table: str, key_column: str, name: str):
+        """
+        @param jdbc: Jdbc - connection to the target database
+        @param table: str - name of the live table
+        @param key_column: str - primary key column of the live table
+        @param name: str - name of the table with the new contents, as seen from the target database
+        """
+        self.jdbc = jdbc
+        self.table = table
+        self.key_column = key_column
+        self.name = name
+
+    def source(self, condition: str = '') -> str:
+        """
+        @param condition: str - a condition on the rows of the new table (without WHERE)
+        @return: str - the new table, or a sub-query of the rows matching the condition
+        """
+        if not condition:
+            return self.name
+        return '(SELECT * FROM {} WHERE {})'.format(self.name, condition)
+
+    def update_statement(self, columns: list, condition: str = ''):
+        """
+        Get the SQL to update the live table with the contents of the new table
+        @param columns: list of the columns to update, excluding the primary key
+        @param condition: str - only use the rows of the new table matching this condition
+        @return: str - the sql, or None if there is nothing to update
+        """
+        if len(columns) == 0:
+            return None
+
+        db_type = self.jdbc.type
+        source = self.source(condition)
+        pk = escape_column_names(self.jdbc, [self.key_column])[0]
+        cols = escape_column_names(self.jdbc, columns)
+        if db_type == 'oracle':
+            return 'MERGE INTO {0} trg USING {1} s ON (trg.{2} = s.{2}) WHEN MATCHED THEN UPDATE SET {3}'.format(
+                self.table, source, pk, ', '.join(['trg.{0} = s.{0}'.format(c) for c in cols]))
+        elif db_type == 'sqlserver':
+            return 'UPDATE trg SET {3} FROM {0} trg INNER JOIN {1} s ON trg.{2} = s.{2}'.format(
+                self.table, source, pk, ', '.join(['trg.{0} = s.{0}'.format(c) for c in cols]))
+        elif db_type == 'postgresql':
+            return 'UPDATE {0} trg SET {3} FROM {1} s WHERE trg.{2} = s.{2}'.format(
+                self.table, source, pk, ', '.join(['{0} = s.{0}'.format(c) for c in cols]))
+        elif db_type == 'mysql':
+            return 'UPDATE {0} trg INNER JOIN {1} s ON trg.{2} = s.{2} SET {3}'.format(
+                self.table, source, pk, ', '.join(['trg.{0} = s.{0}'.format(c) for c in cols]))
+        else:
+            # correlated sub-queries (sqlite and others)
+            return 'UPDATE {0} SET ({3}) = (SELECT {3} FROM {1} s WHERE s.{2} = {0}.{2}) ' \
+                   'WHERE EXISTS (SELECT 1 FROM {1} s WHERE s.{2} = {0}.{2})'.format(
+                        self.table, source, pk, ', '.join(cols))
+
+    def insert_statement(self, columns: list, condition: str = '') -> str:
+        """
+        Get the SQL to insert the records of the new table, which do not exist in the live table
+        @param columns: list of the columns to insert, including the primary key
+        @param condition: str - only use the rows of the new table matching this condition
+        @return: str - the sql
+        """
+        pk = escape_column_names(self.jdbc, [self.key_column])[0]
+        cols = ', '.join(escape_column_names(self.jdbc, columns))
+        return 'INSERT INTO {0} ({3}) SELECT {3} FROM {1} s ' \
+               'WHERE NOT EXISTS (SELECT 1 FROM {0} trg WHERE trg.{2} = s.{2})'.format(
+                    self.table, self.source(condition), pk, cols)
+
+    def delete_statement(self, condition: str = '') -> str:
+        """
+        Get the SQL to remove the records of the live table, which are not in the new table
+        @param condition: str - only remove the rows of the live table matching this condition
+        @return: str - the sql
+        """
+        pk = escape_column_names(self.jdbc, [self.key_column])[0]
+        return 'DELETE FROM {0} WHERE {3}NOT EXISTS (SELECT 1 FROM {1} s WHERE s.{2} = {0}.{2})'.format(
+            self.table, self.name, pk, '({}) AND '.format(condition) if condition else '')
+
+    def reconcile(self, columns: list, update=True, delete=False, condition: str = '',
+                  parameters: list = None) -> OrderedDict:
+        """
+        Merge the contents of the new table into the live table. The statements
+        are executed in the order: delete, update, insert. The changes are not committed.
+
+        @param columns: list of column names present in the new table and the live table
+        @param update: bool - update existing records of the live table
+        @param delete: bool - remove records of the live table, which are not in the new table
+        @param condition: str - only reconcile the rows matching this condition (without WHERE), e.g.,
+            a range of the primary key. Must hold for the new table and the live table.
+        @param parameters: list - the parameters of the condition
+        @return: OrderedDict of the affected row counts with the keys delete, update, insert
+        @raise SQLExecuteException: on failure of one of the statements
+        """
+        statements = OrderedDict()
+        if delete:
+            statements[STAGING_DELETE] = self.delete_statement(condition)
+        if update:
+            statements[STAGING_UPDATE] = self.update_statement(
+                [c for c in columns if c.upper() != self.key_column.upper()], condition)
+        statements[STAGING_INSERT] = self.insert_statement(columns, condition)
+
+        counts = OrderedDict()
+        for label, sql in statements.items():
+            if sql is None:
+                counts[label] = 0
+            else:
+                values = None
+                if parameters:
+                    # the condition may be repeated in the statement (e.g., correlated sub-queries)
+                    values = list(parameters) * (sql.count('?') // len(parameters))
+                cursor = self.jdbc.execute(sql, values, cursor=None)
+                counts[label] = max(cursor.rowcount, 0)
+                self.jdbc.close(cursor)
+        return counts
+
+
+class StagingTable(ReconcileTable):
+    """
+    A staging table on the target database with the same layout as the live table.
+    The staging table is created empty, filled with any uploader, and reconciled with the live table.
+    """
+
+    def __init__(self, jdbc: Jdbc, table: str, key_column: str, name: str = None):
+        """
+        @param jdbc: Jdbc - connection to the target database
+        @param table: str - name of the live table
+        @param key_column: str - primary key column of the live table
+        @param name: str - name of the staging table. Defaults to the table name with prefix LWS_
+        """
+        if name is None:
+            name = (STAGING_PREFIX + table)[:MAX_NAME_LENGTH]
+        super(StagingTable, self).__init__(jdbc, table, key_column, name.upper())
+
+    def create(self):
+        """
+        (Re-)create the staging table as an empty copy of the live table
+        @raise SQLExecuteException: if the table cannot be created
+        """
+        self.drop()
+        if self.jdbc.type == 'sqlserver':
+            sql = 'SELECT * INTO {0} FROM {1} WHERE 1=0'
+        else:
+            sql = 'CREATE TABLE {0} AS SELECT * FROM {1} WHERE 1=0'
+        self.jdbc.execute(sql.format(self.name, self.table), cursor=None)
+        self.jdbc.commit()
+
+    def create_index(self):
+        """
+        Create an index on the key column of the loaded staging table. Without it, the reconcile
+        statements scan the staging table for every row of the live table.
+        The index is dropped with the staging table.
+        @raise SQLExecuteException: if the index cannot be created
+        """
+        pk = escape_column_names(self.jdbc, [self.key_column])[0]
+        index_name = self.name[:MAX_NAME_LENGTH - 3] + '_IX'
+        self.jdbc.execute('CREATE INDEX {0} ON {1} ({2})'.format(index_name, self.name, pk), cursor=None)
+        self.jdbc.commit()
+
+    def drop(self):
+        """
+        Drop the staging table. Errors (e.g., the table does not exist) are ignored.
+        """
+        try:
+            self.jdbc.execute('DROP TABLE {0}'.format(self.name), cursor=None)
+            self.jdbc.commit()
+        except lwetl.SQLExecuteException:
+            self.jdbc.rollback()
+
+
+def source_reference(source: Jdbc, target: Jdbc, table: str, link: str = None):
+    """
+    Get the name, by which the target database reaches a table of the source database
+    @param source: Jdbc - connection to the source database
+    @param target: Jdbc - connection to the target database
+    @param table: str - name of the table
+    @param link: str - a database link (oracle), linked server (sqlserver), or a schema of foreign tables
+        (e.g., postgresql postgres_fdw), which is defined on the target. A template, if it contains {table}.
+        Otherwise the reference is <table>@<link> (oracle), or <link>.<table>
+    @return: str - the reference, or None if the databases are not on the same instance and no link is
+        specified
+    """
+    if link:
+        if '{table}' in link:
+            return link.format(table=table)
+        elif target.type == 'oracle':
+            return '{}@{}'.format(table, link)
+        else:
+            return '{}.{}'.format(link, table)
+    if (source.type != target.type) or (source.url == target.url and source.schema == target.schema):
+        return None
+    if source.type == 'oracle':
+        # schemas of the same instance
+        if source.url == target.url:
+            return '{}.{}'.format(source.schema, table)
+    elif source.type == 'mysql':
+        # databases of the same server
+        if source.url.split('?')[0].rsplit('/', 1)[0] == target.url.split('?')[0].rsplit('/', 1)[0]:
+            return '{}.{}'.format(source.url.split('?')[0].rsplit('/', 1)[-1], table)
+    elif source.type == 'sqlserver':
+        # databases of the same server, in the default schema
+        pattern = re.compile(r';\s*databaseName=([^;]+)', re.IGNORECASE)
+        if pattern.sub('', source.url) == pattern.sub('', target.url):
+            database = pattern.search(source.url)
+            if database is not None:
+                return '{}..{}'.format(database.group(1), table)
+    return None
+
+
+class SourceTable(ReconcileTable):
+    """
+    A table of the source database, which is read by the target database itself, see source_reference().
+    It is reconciled with the live table like a staging table, but it is never created or dropped.
+    """
+
+    def __init__(self, jdbc: Jdbc, table: str, key_column: str, reference: str):
+        """
+        @param jdbc: Jdbc - connection to the target database
+        @param table: str - name of the live table
+        @param key_column: str - primary key column of the live table
+        @param reference: str - the source table as seen from the target database
+        """
+        super(SourceTable, self).__init__(jdbc, table, key_column, reference)
+
+    def is_accessible(self) -> bool:
+        """
+        @return: bool - True if the target database can read the source table
+        """
+        try:
+            list(self.jdbc.query('SELECT 1 FROM {} WHERE 1=0'.format(self.name)))
+        except lwetl.SQLExecuteException:
+            self.jdbc.rollback()
+            return False
+        return True
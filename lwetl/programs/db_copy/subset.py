@@ -0,0 +1,207 @@
+"""
+Filtered copies of db-copy: the rows of a table are restricted with a condition (--where). In a subset copy,
+the conditions of the root tables are propagated along the foreign keys: referenced parent rows, and
+optionally the child rows, are selected with IN (SELECT ...) sub-queries. The key sets are resolved by the
+source database in single set-based queries; no keys are transferred to the client. Optionally (--key-tables),
+the resolved key set of each table is stored in a key table on the source (see KeySets), so the conditions do
+not nest the sub-queries of all the tables on the path from the roots.
+"""
+import lwetl
+
+from lwetl.jdbc import Jdbc
+from lwetl.programs.db_copy.staging import MAX_NAME_LENGTH
+
+IN_CONDITION = '{column} IN (SELECT {ref_column} FROM {table} WHERE {condition})'
+
+# prefix of the key tables of a subset created on the source database
+KEY_SET_PREFIX = 'LWK_'
+
+
+def parse_conditions(where_args: list, tables: list) -> dict:
+    """
+    @param where_args: list of str - the --where arguments in the format <table>:<condition>
+    @param tables: list of the tables, which may be filtered (upper case)
+    @return: dict of the condition of each table (upper case)
+    @raise ValueError: on an invalid argument or an unknown table
+    """
+    conditions = dict()
+    for where_arg in where_args or []:
+        table, sep, condition = where_arg.partition(':')
+        table = table.strip().upper()
+        condition = condition.strip()
+        if (len(sep) == 0) or (len(table) == 0) or (len(condition) == 0):
+            raise ValueError("Invalid condition '{}': use <table>:<condition>.".format(where_arg))
+        if table not in tables:
+            raise ValueError('Table {} of the condition not found in the tables to copy.'.format(table))
+        if table in conditions:
+            conditions[table] = '({}) AND ({})'.format(conditions[table], condition)
+        else:
+            conditions[table] = condition
+    return conditions
+
+
+def and_conditions(*conditions) -> str:
+    """
+    @param conditions: str - conditions (without WHERE). Empty conditions are ignored
+    @return: str - the conjunction of the conditions, or an empty string
+    """
+    conditions = [c for c in conditions if c]
+    if len(conditions) < 2:
+        return ''.join(conditions)
+    return ' AND '.join(['(' + c + ')' for c in conditions])
+
+
+def references(tables: list, table_info: dict, pk_info: dict) -> list:
+    """
+    @param tables: list of the tables
+    @param table_info: dict with the FK reference info: table -> column -> (FK table, constraint, FK column)
+    @param pk_info: dict with the primary key column of each table. Used if the FK column is not known
+    @return: list of tuples (table, column, FK table, FK column) of the references between the tables.
+        Self references are ignored
+    """
+    refs = []
+    for table in tables:
+        for column, info in sorted(table_info.get(table, dict()).items()):
+            fk_table = info[0]
+            fk_column = info[2] if (len(info) > 2) and info[2] else pk_info.get(fk_table)
+            if (fk_table != table) and (fk_table in tables) and (fk_column is not None):
+                refs.append((table, column, fk_table, fk_column))
+    return refs
+
+
+def subset_conditions(tables: list, table_info: dict, pk_info: dict, root_conditions: dict,
+                      children: bool = False, materialize=None) -> (dict, list):
+    """
+    Propagate the conditions of the root tables along the foreign keys of the source
+    @param tables: list of the candidate tables
+    @param table_info: dict with the FK reference info of the source tables, see references()
+    @param pk_info: dict with the primary key column of each source table
+    @param root_conditions: dict of the condition of each root table, see parse_conditions()
+    @param children: bool - also select the rows, which refer to the selected rows (one pass, from the roots down)
+    @param materialize: function (table, condition) -> condition, which resolves the derived condition of a
+        table, once it is final for a pass, see KeySets.materialize(). Optional: by default the sub-queries are
+        nested in the conditions of the tables further down the path
+    @return: tuple (dict of the condition of each selected table, list of the references (table, column) in
+        a cycle, which were not followed). Tables not in the dict are not part of the subset
+    """
+    refs = references(tables, table_info, pk_info)
+    conditions = dict(root_conditions)
+    # the reference, through which a child was selected: not followed back up
+    origin = dict()
+
+    if children:
+        # from the roots down: the first selected parent decides on the rows of a child
+        queue = sorted(root_conditions.keys())
+        while len(queue) > 0:
+            parent = queue.pop(0)
+            for table, column, fk_table, fk_column in refs:
+                if (fk_table == parent) and (table not in conditions):
+                    conditions[table] = IN_CONDITION.format(column=column, ref_column=fk_column, table=parent,
+                                                            condition=conditions[parent])
+                    if materialize is not None:
+                        conditions[table] = materialize(table, conditions[table])
+                    origin[table] = (column, parent)
+                    queue.append(table)
+
+    # from the selected tables up: the parents of a table are resolved once all tables referring to it are final
+    pending = set(tables)
+    skipped = []
+    while len(pending) > 0:
+        ready = sorted([t for t in pending if not any([(r[2] == t) and (r[0] in pending) for r in refs])])
+        if len(ready) == 0:
+            # reference cycle: drop the references from the tables still pending to one table
+            table = sorted(pending)[0]
+            skipped += [(r[0], r[1]) for r in refs if (r[2] == table) and (r[0] in pending)]
+            ready = [table]
+        for table in ready:
+            pending.remove(table)
+            terms = []
+            if table in conditions:
+                terms.append(conditions[table])
+            for child, column, fk_table, fk_column in refs:
+                if (fk_table == table) and (child not in pending) and (child in conditions) and \
+                        (origin.get(child) != (column, table)):
+                    terms.append(IN_CONDITION.format(column=fk_column, ref_column=column, table=child,
+                                                     condition=conditions[child]))
+            if len(terms) == 1:
+                if (materialize is not None) and (table not in conditions):
+                    terms[0] = materialize(table, terms[0])
+                conditions[table] = terms[0]
+            elif len(terms) > 1:
+                conditions[table] = ' OR '.join(['(' + term + ')' for term in terms])
+                if materialize is not None:
+                    conditions[table] = materialize(table, conditions[table])
+    return conditions, [(t, c) for t, c in skipped if t in conditions]
+
+
+def count_rows(jdbc: Jdbc, table: str, condition: str) -> int:
+    """
+    @param jdbc: Jdbc - database connection
+    @param table: str - name of the table
+    @param condition: str - the condition on the rows (without WHERE)
+    @return: int - the number of rows matching the condition
+    """
+    return jdbc.get_int('SELECT COUNT(*) FROM {} WHERE {}'.format(table, condition))
+
+
+class KeySets:
+    """
+    The resolved key sets of the tables of a subset, stored in key tables (LWK_<table>) on the source database.
+    The condition of a table refers to its own key table only.
+    """
+
+    def __init__(self, jdbc: Jdbc, pk_info: dict):
+        """
+        @param jdbc: Jdbc - connection to the source database
+        @param pk_info: dict with the primary key column of each source table
+        """
+        self.jdbc = jdbc
+        self.pk_info = pk_info
+        # table -> name of the key table
+        self.tables = dict()
+
+    def materialize(self, table: str, condition: str) -> str:
+        """
+        Add the keys of the rows matching the condition to the key table of the table
+        @param table: str - name of the table
+        @param condition: str - the condition on the rows (without WHERE)
+        @return: str - the condition on the key table. The condition itself, if the table has no primary key,
+            or if the key table cannot be created (e.g., a read-only source)
+        """
+        pk = self.pk_info.get(table)
+        if pk is None:
+            return condition
+        name = (KEY_SET_PREFIX + table)[:MAX_NAME_LENGTH].upper()
+        try:
+            if table not in self.tables:
+                self._drop(name)
+                if self.jdbc.type == 'sqlserver':
+                    sql = 'SELECT {1} INTO {0} FROM {2} WHERE {3}'
+                else:
+                    sql = 'CREATE TABLE {0} AS SELECT {1} FROM {2} WHERE {3}'
+            else:
+                # the conditions only grow: add the new keys
+                sql = 'INSERT INTO {0} ({1}) SELECT {1} FROM {2} WHERE ({3}) AND {1} NOT IN (SELECT {1} FROM {0})'
+            self.jdbc.execute(sql.format(name, pk, table, condition), cursor=None)
+            self.jdbc.commit()
+        except lwetl.SQLExecuteException as key_set_error:
+            self.jdbc.rollback()
+            print('WARNING: key table {} of the subset not created: {}'.format(name, key_set_error))
+            return condition
+        self.tables[table] = name
+        return '{0} IN (SELECT {0} FROM {1})'.format(pk, name)
+
+    def _drop(self, name: str):
+        try:
+            self.jdbc.execute('DROP TABLE {}'.format(name), cursor=None)
+            self.jdbc.commit()
+        except lwetl.SQLExecuteException:
+            self.jdbc.rollback()
+
+    def drop(self):
+        """
+        Drop the key tables. Errors are ignored.
+        """
+        for name in self.tables.values():
+            self._drop(name)
+        self.tables = dict()
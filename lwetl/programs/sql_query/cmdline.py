@@ -126,6 +126,45 @@ parser.add_argument('-t', '--target', action='store', nargs='?', type=str,
   A comma-separated list of column names. Only columns in this list will be exported.
   Exports all columns if not specified''')
 
+parser.add_argument('--compress', action='store', choices=['gzip', 'zstd'], default=None,
+                    dest='compression',
+                    help='''Compress SQL output written to a file (-f sql -o file).
+Also derived from the file extension (.gz or .zst). zstd requires the zstandard module.''')
+
+parser.add_argument('--max-size', action='store', type=int, default=0,
+                    dest='max_size',
+                    help='''Rotate SQL output files after the specified number of MB (uncompressed).
+Files are numbered <name>.0001.sql, ... and listed in <name>.index.csv''')
+
+parser.add_argument('--max-statements', action='store', type=int, default=0,
+                    dest='max_statements',
+                    help='Rotate SQL output files after the specified number of statements.')
+
+parser.add_argument('--adaptive', action='store_true',
+                    help='''Upload a file (-t, --target) in batches, which are tuned on the measured throughput.
+Commits on rows, elapsed time (10 s), or data volume (64 MB). The -n option sets the initial batch size.''')
+
+parser.add_argument('--watermark', action='store', default=None,
+                    dest='watermark',
+                    help='''Incremental extraction of a table (command_or_sql): only return the rows with a value
+in this column above the watermark of the previous run. The column must increase on every insert or
+update (e.g., a modification timestamp or a sequence number).''')
+
+parser.add_argument('--state', action='store', default=lwetl.incremental.DEFAULT_STATE_FILE,
+                    dest='state_file',
+                    help='''The file with the watermarks of incremental extractions (see --watermark).
+Defaults to {}. The watermark is stored per table and column.'''.format(lwetl.incremental.DEFAULT_STATE_FILE))
+
+parser.add_argument('--overlap', action='store', type=float, default=0,
+                    dest='overlap',
+                    help='''Re-read the rows this far below the watermark (seconds for timestamps), to catch
+rows of transactions, which committed late. Rows extracted before without changes are skipped.''')
+
+parser.add_argument('--follow', action='store', nargs='?', type=float, const=60.0, default=None,
+                    dest='follow',
+                    help='''Repeat the incremental extraction every SECONDS (default 60) until interrupted.
+New rows are appended to the output. Only for the formats csv, text and sql.''')
+
 parser.add_argument('--cast', action='store',
                     help=("Force casting of the dbase return values. Enter the specifiers as a comma-separated list.\n"
                           "Valid specifiers are: bool, int, float, str, date, a datetime.strptime format string, or "
@@ -6,6 +6,7 @@
 import lwetl
 import os
 import sys
+import time
 
 from collections import OrderedDict
 
@@ -57,7 +58,8 @@ def get_table_info_sql(jdbc: lwetl.Jdbc) -> str:
 
 
 def upload_table(jdbc: lwetl.Jdbc, commit_mode: str, commit_nr: int, max_rows: int,
-                 table_name: str, file_name: str, file_format: str, separator: str, log_file: str) -> int:
+                 table_name: str, file_name: str, file_format: str, separator: str, log_file: str,
+                 adaptive: bool = False) -> int:
     if file_format not in ['xlsx', 'csv']:
         # guess by file extension
         lc_filename = file_name.lower()
@@ -87,27 +89,53 @@ def upload_table(jdbc: lwetl.Jdbc, commit_mode: str, commit_nr: int, max_rows: i
         print('ERROR: formatter {} is not supported for file upload. Valid choices: csv, xlsx'.format(file_format))
         return 1
 
+    controller = None
+    if adaptive:
+        # batched inserts: the batch size and the commits follow the measured throughput
+        controller = lwetl.AdaptiveController(batch_size=commit_nr)
+        table_uploader = lwetl.MultiParameterUploader(jdbc, table_name, fstream=log_file, commit_mode=commit_mode,
+                                                      controller=controller)
+    else:
+        table_uploader = lwetl.ParameterUploader(jdbc, table_name, fstream=log_file, commit_mode=commit_mode)
+
     row_count = 0
     importer.open()
-    with lwetl.ParameterUploader(jdbc, table_name, fstream=log_file, commit_mode=commit_mode,
-                                 commit_count=commit_nr) as uploader:
+    # parse the input file while the previous rows are send to the database
+    with lwetl.WriteBehindUploader(table_uploader) as uploader:
         for row in importer.get_data():
             row_count += 1
             uploader.insert(row)
+            if controller is None:
+                is_due = uploader.row_count >= commit_nr
+            else:
+                is_due = controller.commit_is_due(uploader.row_count)
+            if is_due:
+                uploader.commit()
             if (max_rows > 0) and (row_count >= max_rows):
                 break
     importer.close()
     print('Done: {} rows uploaded.'.format(row_count))
+    if controller is not None:
+        print('Adaptive upload: ' + controller.statistics())
     return 0
 
 
 # noinspection PyBroadException
-def parse_output(cursors: list, args):
+def parse_output(cursors: list, args, extractor=None, append: bool = False):
+    """
+    Write the results of queries with the specified formatter
+    @param cursors: list of cursors of the executed queries
+    @param args: parsed command line arguments
+    @param extractor: IncrementalExtractor, which filters the rows of the (single) cursor. Optional
+    @param append: bool - append to the output of a previous call (no header)
+    @return: bool - True if all rows were written. False after a retrieval error, or if the output was
+        truncated on user request (--max-rows)
+    """
     if len(cursors) < 1:
-        return
+        return True
 
     kwargs = {
-        'append': False,
+        'append': append,
         'filename_or_stream': args.output_file
     }
     if args.format == 'csv':
@@ -121,6 +149,9 @@ def parse_output(cursors: list, args):
     elif args.format == 'sql':
         jdbc = getattr(cursors[0], lwetl.jdbc.PARENT_CONNECTION)
         kwargs['connection'] = jdbc
+        kwargs['compression'] = args.compression
+        kwargs['max_bytes'] = args.max_size * 1024 * 1024
+        kwargs['max_statements'] = args.max_statements
         kwargs['columns'] = jdbc.get_columns(cursors[0])
         if args.target_db is not None:
             if '?' in args.target_db:
@@ -156,6 +187,7 @@ def parse_output(cursors: list, args):
         return_type = tuple([s.strip() for s in args.cast.split(',')])
 
     sql_count = 0
+    complete = True
     f = FORMATTERS[args.format](**kwargs)
     for cursor in cursors:
         sql_count += 1
@@ -175,10 +207,15 @@ def parse_output(cursors: list, args):
 
         rc = 0
         rc_max = args.max_rows
-        f.header()
+        if not append:
+            f.header()
         try:
             single_cast = isinstance(return_type, tuple) and (len(return_type) == 1)
-            for row in jdbc.get_data(cursor, return_type=return_type):
+            if extractor is None:
+                rows = jdbc.get_data(cursor, return_type=return_type)
+            else:
+                rows = extractor.get_data(cursor)
+            for row in rows:
                 if single_cast and (not isinstance(row, tuple)):
                     row = tuple([row])
                 f.write(row)
@@ -186,11 +223,59 @@ def parse_output(cursors: list, args):
                 if (rc_max > 0) and (rc >= rc_max):
                     print('Output truncated on user request.', file=sys.stdout)
                     jdbc.close(cursor)
+                    complete = False
                     break
             f.footer()
         except lwetl.SQLExecuteException as exec_error:
             print('ERROR: cannot retrieve the data: ' + str(exec_error))
+            complete = False
     f.close()
+    return complete
+
+
+def incremental_query(jdbc: lwetl.Jdbc, table_name: str, args) -> int:
+    """
+    Extract the new and changed rows of a table since the previous run, see --watermark
+    @param jdbc: lwetl.Jdbc the database connection
+    @param table_name: str - name of the table
+    @param args: parsed command line arguments
+    @return: int - the exit code
+    """
+    if (args.follow is not None) and (args.format not in ['csv', 'text', 'sql']):
+        print('ERROR: the format {} cannot be appended in follow mode. Use csv, text or sql.'.format(args.format))
+        return 1
+    if args.cast is not None:
+        print('WARNING: the --cast option is ignored in incremental extractions.', file=sys.stderr)
+    overlap = int(args.overlap) if float(args.overlap).is_integer() else args.overlap
+    extractor = lwetl.IncrementalExtractor(jdbc, table_name, args.watermark, state_file=args.state_file,
+                                           overlap=overlap)
+    n_polls = 0
+    try:
+        while True:
+            try:
+                cursor = extractor.execute()
+            except lwetl.SQLExecuteException as exec_error:
+                print('ERROR: cannot query {}: {}'.format(table_name, exec_error), file=sys.stderr)
+                return 1
+            complete = parse_output([cursor], args, extractor, append=n_polls > 0)
+            # end the read transaction of the poll
+            jdbc.rollback()
+            if not complete:
+                # the next run repeats the extraction from the saved watermark
+                print('ERROR: extraction of {} incomplete: watermark not saved.'.format(table_name),
+                      file=sys.stderr)
+                return 1
+            extractor.save()
+            n_polls += 1
+            print('{} new or changed rows of {} ({} skipped). Watermark {} = {}'.format(
+                extractor.row_count, table_name, extractor.skip_count, args.watermark, extractor.watermark),
+                file=sys.stderr)
+            if args.follow is None:
+                break
+            time.sleep(args.follow)
+    except KeyboardInterrupt:
+        print('Follow mode terminated after {} polls.'.format(n_polls), file=sys.stderr)
+    return 0
 
 
 def commit(jdbc: lwetl.Jdbc, mode, row_count, tot_count):
@@ -296,18 +381,24 @@ def main():
             jdbc.query("SELECT * FROM {0} WHERE 0=1".format(table_name))
         except lwetl.SQLExecuteException:
             table_name = None
-        if table_name is not None:
+        if (table_name is not None) and (args.watermark is not None):
+            return incremental_query(jdbc, table_name, args)
+        elif table_name is not None:
             if args.file_name is None:
                 sql = 'SELECT * FROM ' + table_name
             elif os.path.isfile(args.file_name):
                 return upload_table(jdbc, args.commit_mode, args.commit_nr, args.max_rows,
-                                    table_name, args.file_name, args.format, args.separator, args.log_file)
+                                    table_name, args.file_name, args.format, args.separator, args.log_file,
+                                    args.adaptive)
             else:
                 print('ERROR: specified input file not found: ' + args.file_name)
                 return 1
     else:
         sql = args.command_or_sql
 
+    if args.watermark is not None:
+        print('ERROR: the --watermark option requires a table name.')
+        return 1
     if sql is None:
         sql = sys.stdin
     return parse_sql_commands(jdbc, sql, args)
@@ -213,3 +213,23 @@ SELECT COUNT(DISTINCT table_nme) FROM information_schema.tables
 WHERE table_schema = 'public' AND table_type = 'BASE TABLE' AND table_catalog = '@SCHEMA@'
 ''',
 }
+
+# estimated number of rows of each table, read from the catalog statistics. NUM_ROWS is NULL (or negative
+# for postgresql) if the table has no statistics. Only the tables of the default schema, in which the
+# unqualified table names are resolved
+table_row_estimate_queries = {
+    'oracle':     'SELECT TABLE_NAME, NUM_ROWS FROM USER_TABLES',
+    'sqlserver':  '''
+SELECT t.name AS TABLE_NAME, SUM(p.row_count) AS NUM_ROWS
+FROM sys.dm_db_partition_stats p JOIN sys.tables t ON t.object_id = p.object_id
+WHERE p.index_id IN (0, 1) AND SCHEMA_NAME(t.schema_id) = SCHEMA_NAME()
+GROUP BY t.name''',
+    'mysql':      '''
+SELECT TABLE_NAME, TABLE_ROWS AS NUM_ROWS FROM information_schema.TABLES
+WHERE TABLE_SCHEMA = '@SCHEMA@' AND TABLE_TYPE = 'BASE TABLE'
+''',
+    'postgresql': '''
+SELECT c.relname AS TABLE_NAME, c.reltuples AS NUM_ROWS
+FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')''',
+}
@@ -0,0 +1,71 @@
+"""
+    Output of rows rejected by the database
+
+    Rows, which fail on upload (e.g., on a constraint violation), are written as CSV records with the name
+    of the table, the operation, the error message of the driver, and the values of the row in JSON format.
+"""
+
+import csv
+import json
+import sys
+import threading
+
+REJECT_HEADER = ['table', 'operation', 'error', 'data']
+
+
+class RejectWriter:
+    """
+    Writes rejected rows to a CSV file (delimiter ';') or an open text stream. Thread-safe.
+    """
+
+    def __init__(self, filename_or_stream=None, append: bool = False, delimiter: str = ';'):
+        """
+        @param filename_or_stream: str or text stream. Defaults to stderr
+        @param append: bool - append to an existing file
+        @param delimiter: str - the CSV delimiter
+        """
+        self.owns_stream = isinstance(filename_or_stream, str)
+        if self.owns_stream:
+            self.stream = open(filename_or_stream, 'a' if append else 'w', newline='', encoding='utf-8')
+            has_header = append and (self.stream.tell() > 0)
+        else:
+            self.stream = sys.stderr if filename_or_stream is None else filename_or_stream
+            has_header = False
+        self.writer = csv.writer(self.stream, dialect='excel', delimiter=delimiter)
+        if not has_header:
+            self.writer.writerow(REJECT_HEADER)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, table: str, operation: str, data: dict, error):
+        """
+        Write a rejected row
+        @param table: str - name of the table
+        @param operation: str - insert, update, or delete
+        @param data: dict - the values of the row. Updates and deletes also hold the where clause
+        @param error: Exception or str - the error of the database driver
+        """
+        record = [table, operation, str(error).strip(), json.dumps(data, default=str)]
+        with self.lock:
+            self.writer.writerow(record)
+            self.count += 1
+
+    def flush(self):
+        with self.lock:
+            if self.stream is not None:
+                self.stream.flush()
+
+    def close(self):
+        if self.stream is None:
+            return
+        if self.owns_stream:
+            self.stream.close()
+        else:
+            self.stream.flush()
+        self.stream = None
@@ -0,0 +1,227 @@
+"""
+    Streaming output of SQL scripts
+
+    Statements are written straight to disk through a buffered (optionally compressed) stream.
+    Output files may be rotated by size or by number of statements. An index file records which
+    tables and statement ranges went to which file.
+"""
+
+import csv
+import gzip
+import io
+import logging
+import os
+import sys
+
+# define a logger
+LOGGER = logging.getLogger(os.path.basename(__file__).split('.')[0])
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+COMPRESSION_TYPES = {
+    COMPRESSION_GZIP: '.gz',
+    COMPRESSION_ZSTD: '.zst'
+}
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+INDEX_EXTENSION = '.index.csv'
+INDEX_HEADER = ['file', 'table', 'first_statement', 'last_statement', 'statements']
+
+
+def split_script_name(filename: str) -> (str, str, str):
+    """
+    Split a script file name into a stem, extension, and compression type
+    @param filename: str - e.g., dump.sql.gz
+    @return: tuple (stem, extension, compression type or None), e.g., ('dump', '.sql', 'gzip')
+    """
+    compression = None
+    for c_type, c_ext in COMPRESSION_TYPES.items():
+        if filename.lower().endswith(c_ext):
+            compression = c_type
+            filename = filename[:-len(c_ext)]
+            break
+    stem, extension = os.path.splitext(filename)
+    return stem, extension, compression
+
+
+class ScriptWriter:
+    """
+    Streams SQL statements to one or more script files, or to an open text stream.
+
+    May be used as the fstream of an uploader: statements are then written directly to disk,
+    see Uploader. Other text is written with write(), e.g., via print(text, file=writer).
+    """
+
+    def __init__(self, filename_or_stream, compression: str = None, max_bytes: int = 0, max_statements: int = 0,
+                 append: bool = False, index: bool = None, terminator: str = ';',
+                 buffer_size: int = DEFAULT_BUFFER_SIZE, compress_level: int = 6):
+        """
+        @param filename_or_stream: str or text stream. Rotation, compression, and index do not apply to streams
+        @param compression: str - None, 'gzip', or 'zstd' (requires the zstandard package). If None, the
+            compression is derived from the file extension (.gz or .zst)
+        @param max_bytes: int - start a new file after this number of (uncompressed) bytes. <= 0: no limit
+        @param max_statements: int - start a new file after this number of statements. <= 0: no limit
+        @param append: bool - append to an existing file. With rotation: continue after the existing files
+        @param index: bool - write an index file (<stem>.index.csv). Defaults to True if files are rotated
+        @param terminator: str - appended to each statement
+        @param buffer_size: int - size of the write buffer in bytes
+        @param compress_level: int - compression level of gzip (1-9) or zstd (1-22)
+        """
+        self.max_bytes = max(0, max_bytes or 0)
+        self.max_statements = max(0, max_statements or 0)
+        self.rotate = (self.max_bytes > 0) or (self.max_statements > 0)
+        self.append = append
+        self.terminator = terminator
+        self.buffer_size = buffer_size
+        self.compress_level = compress_level
+
+        self.stream = None
+        self.owns_stream = isinstance(filename_or_stream, str)
+        if self.owns_stream:
+            self.stem, self.extension, derived_compression = split_script_name(filename_or_stream)
+            self.compression = derived_compression if compression is None else compression
+            if (self.compression is not None) and (self.compression not in COMPRESSION_TYPES):
+                raise ValueError('Illegal compression type. Supported: {}. Found: {}'.format(
+                    list(COMPRESSION_TYPES.keys()), self.compression))
+            self.filename = filename_or_stream
+            self.write_index = self.rotate if index is None else index
+        else:
+            if filename_or_stream is None:
+                filename_or_stream = sys.stdout
+            self.stream = filename_or_stream
+            self.compression = None
+            self.filename = None
+            self.write_index = False
+
+        # statistics
+        self.file_count = 0
+        self.statement_count = 0
+        self.file_statements = 0
+        self.file_bytes = 0
+        self.files = []
+
+        # index administration: current run of statements of the same table in the same file
+        self.index_stream = None
+        self.index_writer = None
+        self.run = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _file_name(self) -> str:
+        if not self.rotate:
+            return self.filename
+        extension = self.extension + (COMPRESSION_TYPES[self.compression] if self.compression else '')
+        return '{}.{:04d}{}'.format(self.stem, self.file_count, extension)
+
+    def _open(self):
+        self.file_count += 1
+        self.file_statements = 0
+        self.file_bytes = 0
+        fname = self._file_name()
+        if self.rotate and self.append:
+            # continue after the existing files
+            while os.path.exists(fname):
+                self.file_count += 1
+                fname = self._file_name()
+        mode = 'ab' if (self.append and not self.rotate) else 'wb'
+        if self.compression == COMPRESSION_GZIP:
+            raw = gzip.open(fname, mode, compresslevel=self.compress_level)
+        else:
+            raw = open(fname, mode)
+        if self.compression == COMPRESSION_ZSTD:
+            try:
+                import zstandard
+            except ImportError:
+                zstandard = None
+            if zstandard is None:
+                raw.close()
+                raise ValueError("zstd compression requires the zstandard module. Use 'pip install zstandard'.")
+            raw = zstandard.ZstdCompressor(level=self.compress_level).stream_writer(raw, closefd=True)
+        self.stream = io.TextIOWrapper(io.BufferedWriter(raw, buffer_size=self.buffer_size), encoding='utf-8')
+        self.files.append(fname)
+        LOGGER.debug('Opened script file: ' + fname)
+
+    def _close_stream(self):
+        self._end_run()
+        if (self.stream is not None) and self.owns_stream:
+            self.stream.close()
+            self.stream = None
+        elif self.stream is not None:
+            self.stream.flush()
+
+    def _end_run(self):
+        if self.run is None:
+            return
+        if self.write_index:
+            if self.index_writer is None:
+                index_name = self.stem + INDEX_EXTENSION
+                has_header = self.append and os.path.isfile(index_name)
+                self.index_stream = open(index_name, 'a' if self.append else 'w', newline='')
+                self.index_writer = csv.writer(self.index_stream, delimiter=';')
+                if not has_header:
+                    self.index_writer.writerow(INDEX_HEADER)
+            fname, table, first, last = self.run
+            self.index_writer.writerow([os.path.basename(fname), table or '', first, last, last - first + 1])
+        self.run = None
+
+    def _text_out(self, text: str):
+        if self.stream is None:
+            self._open()
+        self.stream.write(text)
+        # the limit is in utf-8 bytes: only non-ascii text is encoded to count them
+        self.file_bytes += len(text) if text.isascii() else len(text.encode('utf-8'))
+
+    def write(self, text: str):
+        """
+        Write raw text (file-like interface). Does not count as a statement
+        @param text: str
+        """
+        self._text_out(text)
+
+    def flush(self):
+        if self.stream is not None:
+            self.stream.flush()
+
+    def write_statement(self, sql: str, table: str = None):
+        """
+        Write a single SQL statement
+        @param sql: str - the statement without terminator
+        @param table: str - the table of the statement (for the index)
+        """
+        if self.owns_stream and self.rotate and (self.stream is not None) and (
+                ((self.max_statements > 0) and (self.file_statements >= self.max_statements)) or
+                ((self.max_bytes > 0) and (self.file_bytes >= self.max_bytes))):
+            self._close_stream()
+        self._text_out(sql + self.terminator + '\n')
+
+        self.statement_count += 1
+        self.file_statements += 1
+        if self.owns_stream:
+            fname = self.files[-1]
+            if (self.run is not None) and ((self.run[0] != fname) or (self.run[1] != table)):
+                self._end_run()
+            if self.run is None:
+                self.run = [fname, table, self.statement_count, self.statement_count]
+            else:
+                self.run[3] = self.statement_count
+
+    def write_statements(self, statements, table: str = None):
+        """
+        Write a sequence of SQL statements
+        @param statements: iterable of str
+        @param table: str - the table of the statements (for the index)
+        """
+        for sql in statements:
+            self.write_statement(sql, table)
+
+    def close(self):
+        self._close_stream()
+        if self.index_stream is not None:
+            self.index_stream.close()
+            self.index_stream = None
+            self.index_writer = None
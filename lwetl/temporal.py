@@ -0,0 +1,174 @@
+"""
+    Conversion of date and time values between python and java (jdbc)
+
+    Values are mapped through the number of seconds (and nanoseconds) since the epoch 1970-01-01 00:00:00 UTC.
+    Naive datetime objects (without tzinfo) are interpreted according to a zone policy:
+    - local: the time zone of the process (default, must match the default time zone of the JVM)
+    - utc: naive values are UTC
+    Datetime objects with tzinfo are always converted with their own UTC offset.
+"""
+
+import re
+
+from datetime import date, datetime, timedelta, timezone
+from dateutil.parser import parse as dt_parse
+
+ZONE_LOCAL = 'local'
+ZONE_UTC = 'utc'
+ZONE_POLICIES = [ZONE_LOCAL, ZONE_UTC]
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_SECOND = timedelta(seconds=1)
+
+# ISO 8601 fast path: yyyy-mm-dd[(T| )HH:MM[:SS[.fraction]]][Z|+HH[:MM]]
+RE_ISO_DATE_TIME = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})'
+    r'(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:[.,](\d{1,9}))?)?)?'
+    r'\s*(Z|[+\-]\d{2}(?::?\d{2})?)?$')
+
+
+def parse_datetime(value: str) -> datetime:
+    """
+    Parse a string into a datetime. ISO 8601 formats are parsed with a pre-compiled regular expression,
+    other formats fall back to dateutil.
+    @param value: str - the input
+    @return: datetime - naive unless the input specifies a UTC offset
+    @raise ValueError: if the string cannot be parsed
+    """
+    m = RE_ISO_DATE_TIME.match(value.strip())
+    if m is None:
+        return dt_parse(value)
+    year, month, day, hour, minute, second, fraction, offset = m.groups()
+    microsecond = 0 if fraction is None else int(fraction[:6].ljust(6, '0'))
+    tz = None
+    if offset is not None:
+        if offset == 'Z':
+            tz = timezone.utc
+        else:
+            digits = offset[1:].replace(':', '')
+            delta = timedelta(hours=int(digits[:2]), minutes=int(digits[2:] or 0))
+            tz = timezone(-delta if offset[0] == '-' else delta)
+    return datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+                    microsecond, tz)
+
+
+def check_zone(zone: str) -> str:
+    if zone not in ZONE_POLICIES:
+        raise ValueError('Illegal zone policy. Supported: {}. Found: {}'.format(ZONE_POLICIES, zone))
+    return zone
+
+
+def to_epoch_seconds(value: (datetime, date), zone: str = ZONE_LOCAL) -> int:
+    """
+    @param value: datetime or date
+    @param zone: str - zone policy for naive values
+    @return: int - whole seconds since the epoch (microseconds are ignored)
+    """
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is not None:
+        return (value - EPOCH_UTC) // ONE_SECOND
+    elif zone == ZONE_UTC:
+        return (value - EPOCH) // ONE_SECOND
+    else:
+        return int(value.replace(microsecond=0).timestamp())
+
+
+def to_naive(value: datetime, zone: str = ZONE_LOCAL) -> datetime:
+    """
+    @param value: datetime
+    @param zone: str - zone policy of the returned value
+    @return: datetime - the value without tzinfo. Values with tzinfo are converted with their UTC offset
+        into the time zone of the policy
+    """
+    if value.tzinfo is None:
+        return value
+    elif zone == ZONE_UTC:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    else:
+        return value.astimezone().replace(tzinfo=None)
+
+
+def to_epoch_millis(value: (datetime, date), zone: str = ZONE_LOCAL) -> int:
+    return to_epoch_seconds(value, zone) * 1000 + (getattr(value, 'microsecond', 0) // 1000)
+
+
+def to_epoch_nanos(value: (datetime, date), zone: str = ZONE_LOCAL) -> int:
+    return to_epoch_seconds(value, zone) * 1000000000 + getattr(value, 'microsecond', 0) * 1000
+
+
+def from_epoch_seconds(seconds: int, microsecond: int = 0, zone: str = ZONE_LOCAL) -> datetime:
+    """
+    @param seconds: int - whole seconds since the epoch
+    @param microsecond: int - fraction of the second
+    @param zone: str - zone policy of the returned (naive) datetime
+    @return: datetime
+    """
+    if zone == ZONE_UTC:
+        return EPOCH + timedelta(seconds=seconds, microseconds=microsecond)
+    else:
+        return datetime.fromtimestamp(seconds).replace(microsecond=microsecond)
+
+
+def from_epoch_millis(millis: int, zone: str = ZONE_LOCAL) -> datetime:
+    return from_epoch_seconds(millis // 1000, (millis % 1000) * 1000, zone)
+
+
+def from_epoch_nanos(nanos: int, zone: str = ZONE_LOCAL) -> datetime:
+    return from_epoch_seconds(nanos // 1000000000, (nanos % 1000000000) // 1000, zone)
+
+
+class TemporalConverter:
+    """
+    Converts python date and time values into java.sql.Timestamp objects and vice versa
+    """
+
+    def __init__(self, zone: str = ZONE_LOCAL):
+        """
+        @param zone: str - zone policy of naive datetime objects: 'local' (default) or 'utc'
+        """
+        self.zone = check_zone(zone)
+        self.timestamp_class = None
+
+    def to_timestamp(self, value: (datetime, date, str)):
+        """
+        @param value: datetime, date, or str
+        @return: java.sql.Timestamp with microsecond precision
+        @raise ValueError: if the string cannot be parsed
+        """
+        if isinstance(value, str):
+            value = parse_datetime(value)
+        if self.timestamp_class is None:
+            # JVM must have started for this. Imported here: the parsers of this module do not require jpype
+            from jpype import JPackage
+            self.timestamp_class = JPackage('java').sql.Timestamp
+        ts = self.timestamp_class(to_epoch_seconds(value, self.zone) * 1000)
+        microsecond = getattr(value, 'microsecond', 0)
+        if microsecond > 0:
+            ts.setNanos(microsecond * 1000)
+        return ts
+
+    def from_java(self, value) -> datetime:
+        """
+        Convert a java temporal object (java.sql.Timestamp, java.sql.Date, java.time.LocalDateTime,
+        java.time.LocalDate), or its string representation, into a naive datetime
+        @param value: the java object or a string
+        @return: datetime
+        @raise ValueError: if the value cannot be converted
+        """
+        if isinstance(value, str):
+            return parse_datetime(value)
+        type_name = type(value).__name__
+        if type_name == 'java.sql.Timestamp':
+            return from_epoch_seconds(int(value.getTime()) // 1000, int(value.getNanos()) // 1000, self.zone)
+        elif type_name == 'java.sql.Date':
+            value = value.toLocalDate()
+            type_name = 'java.time.LocalDate'
+        if type_name == 'java.time.LocalDateTime':
+            return datetime(value.getYear(), value.getMonthValue(), value.getDayOfMonth(),
+                            value.getHour(), value.getMinute(), value.getSecond(), value.getNano() // 1000)
+        elif type_name == 'java.time.LocalDate':
+            return datetime(value.getYear(), value.getMonthValue(), value.getDayOfMonth())
+        else:
+            return parse_datetime(str(value.toString()))
@@ -5,15 +5,29 @@
 import copy
 import logging
 import os
+import threading
+import warnings
+
+from queue import Queue
+
+from datetime import date
 
 from collections import OrderedDict
 from decimal import Decimal
+from functools import partial
 
 from jaydebeapi import DatabaseError
-from jpype import JPackage
+from jpype import JPackage, JImplements, JOverride
 
 from .exceptions import SQLExecuteException, CommitException
-from .jdbc import Jdbc, DummyJdbc, COLUMN_TYPE_DATE, COLUMN_TYPE_FLOAT, COLUMN_TYPE_NUMBER
+from .jdbc import Jdbc, DummyJdbc, COLUMN_TYPE_DATE, COLUMN_TYPE_FLOAT, COLUMN_TYPE_NUMBER, UPDATE_COUNTS, \
+    GENERATED_KEYS
+from .adaptive import AdaptiveController
+from .bulk_mode import BulkLoadMode
+from .key_allocator import KeyAllocator, get_key_allocator
+from .reject_writer import RejectWriter
+from .script_writer import ScriptWriter
+from .temporal import TemporalConverter, ZONE_LOCAL, check_zone, from_epoch_seconds, parse_datetime, to_naive
 from .utils import *
 
 # define a logger
@@ -28,8 +42,51 @@ DEFAULT_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
 DEFAULT_TIME_FORMAT_MS = '%Y-%m-%d %H:%M:%S.%f'
 DEFAULT_DATE_FORMAT = '%Y-%m-%d'
 
+# default limits of the row buffer of the MultiParameterUploader
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_BATCH_BYTES = 16 * 1024 * 1024
+
+# Limits for multi-row VALUES statements, see MultiRowUploader
+# maximum number of bind parameters of a single statement
+MAX_STATEMENT_PARAMETERS = {
+    'sqlserver': 2099,  # 2100 includes the statement handle of sp_prepexec
+    'sqlite': 32766,  # SQLITE_MAX_VARIABLE_NUMBER since 3.32
+    'postgresql': 32767,
+    'mysql': 65535,
+    'oracle': 65535
+}
+DEFAULT_MAX_STATEMENT_PARAMETERS = 999
+# maximum number of rows in a single statement
+MAX_STATEMENT_ROWS = {
+    'sqlserver': 1000,  # limit of the table value constructor
+    'oracle': 500  # INSERT ALL degrades with larger numbers
+}
+DEFAULT_MAX_STATEMENT_ROWS = 1000
+# used if max_allowed_packet of mysql cannot be retrieved
+DEFAULT_MYSQL_PACKET_SIZE = 4 * 1024 * 1024
+
+# default limits of the row buffer of the BulkUploader
+DEFAULT_BULK_BATCH_SIZE = 100000
+DEFAULT_BULK_BATCH_BYTES = 64 * 1024 * 1024
+# number of rows serialized at once into the stream of the bulk interface
+BULK_STREAM_CHUNK_ROWS = 10000
+# precision of the text columns of the sqlserver bulk copy: -1 is NVARCHAR(MAX). Short for numbers and dates
+SQLSERVER_MAX_PRECISION = -1
+SQLSERVER_TEXT_PRECISION = {
+    COLUMN_TYPE_NUMBER: 100,
+    COLUMN_TYPE_FLOAT: 100,
+    COLUMN_TYPE_DATE: 50
+}
+
+# default queue limits of the WriteBehindUploader
+# number of operations passed to the writer thread in a single chunk
+DEFAULT_WRITE_BEHIND_CHUNK_SIZE = 100
+# maximum number of chunks waiting for the writer thread
+DEFAULT_WRITE_BEHIND_QUEUE_SIZE = 20
+
 # PK_COUNTERS
-# For update of integer primary keys without database IO
+# Deprecated: the last key returned by get_pk_counter(). The keys are allocated by the MaxKeyAllocator
+# instances of key_allocator.py (KEY_ALLOCATORS)
 #
 # Structure:
 # login->table->column_name
@@ -39,26 +96,58 @@ PK_COUNTERS = dict()
 
 def get_pk_counter(jdbc: (Jdbc, DummyJdbc), table_name: str, column_name: str, increment=1) -> int:
     """
-    Internal factory to keep track of PK table counters over multiple Jdbc Instances
+    Deprecated: use get_key_allocator(), or an allocator of key_allocator.py
 
-    @param jdbc: Jdbc - database connection, fines the database scheme
-    @param table_name: str - name of the able
+    @param jdbc: Jdbc - database connection, defines the database scheme
+    @param table_name: str - name of the table
     @param column_name: str - name of the PK column
-    @param increment: int - increment on call. Defaults to 1
+    @param increment: int - increment on call. Defaults to 1. Use 0 to get the current value without an increment
     @return: int - the next value (incremented by increment)
     """
+    warnings.warn('get_pk_counter() is deprecated: use a KeyAllocator.', DeprecationWarning, stacklevel=2)
+    allocator = get_key_allocator(jdbc, table_name, column_name)
+    if increment < 1:
+        key = allocator.current()
+    else:
+        for _ in range(increment):
+            allocator.next_key()
+        key = allocator.current()
+    PK_COUNTERS.setdefault(jdbc.login, dict()).setdefault(table_name, dict())[column_name] = key
+    return key
+
+
+def escape_column_names(jdbc: (Jdbc, DummyJdbc), column_names: list) -> list:
+    """
+    Escape column names, if required by the connection
+    @param jdbc: Jdbc - database connection, defines the escape rules
+    @param column_names: list of column names
+    @return: list of (escaped) column names
+    """
+    if jdbc.always_escape:
+        if jdbc.type == 'oracle':
+            return ['"{0}"'.format(c) for c in column_names]
+        elif jdbc.type == 'mysql':
+            return ['`{0}`'.format(c) for c in column_names]
+        elif jdbc.type == 'sqlserver':
+            return ['[{0}]'.format(c) for c in column_names]
+        else:
+            return [c for c in column_names]
+    else:
+        return [c for c in column_names]
 
-    global PK_COUNTERS
-    login = jdbc.login
-    if login not in PK_COUNTERS:
-        PK_COUNTERS[login] = dict()
-    if table_name not in PK_COUNTERS[login]:
-        PK_COUNTERS[login][table_name] = dict()
-    if column_name not in PK_COUNTERS[login][table_name]:
-        PK_COUNTERS[login][table_name][column_name] = jdbc.get_int(
-            "SELECT MAX({}) FROM {}".format(column_name, table_name))
-    PK_COUNTERS[login][table_name][column_name] += increment
-    return PK_COUNTERS[login][table_name][column_name]
+
+def estimate_size(value) -> int:
+    """
+    Rough estimate of the upload size of a single value
+    @param value: Any - the value to estimate
+    @return: int - estimated size in bytes
+    """
+    if value is None:
+        return 0
+    elif isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    else:
+        return 8
 
 
 class NativeExpression:
@@ -95,10 +184,26 @@ class Uploader:
         self.commit_mode = self.set_commit_mode(commit_mode)
         self.exit_on_fail = exit_on_fail
         self.has_sql_errors = False
+        # set while a failed batch is split up: errors are raised and handled by the caller, see _bisect()
+        self.bisecting = False
 
-        # internal counter for integer primary keys
+        # key allocators of integer primary keys: column name -> KeyAllocator
         self.counters = dict()
 
+        # identity column, which keys are retrieved after an insert
+        self.generated_key_column = kwargs.get('generated_keys', None)
+        if isinstance(self.generated_key_column, str):
+            self.generated_key_column = self.generated_key_column.upper()
+        self.generated_keys = []
+
+        # optional tuning of batch and commit sizes
+        self.controller = kwargs.get('controller', None)  # type: AdaptiveController
+        self.uncommitted_bytes = 0
+
+        # disable the indexes and constraints of the table within the with-block, see BulkLoadMode
+        self.bulk_mode = verified_boolean(kwargs.get('bulk_mode', False))
+        self.bulk_load_mode = None
+
         # retrieve column names of the specified table
         self.columns = None
         error_message = None
@@ -128,35 +233,67 @@ class Uploader:
         self.row_count = 0
         self.has_sql_errors = False
         self.pipe_buffer = []
+        if self.bulk_mode and (self.bulk_load_mode is None):
+            if self.commit_mode == UPLOAD_MODE_COMMIT:
+                self.bulk_load_mode = BulkLoadMode(self.jdbc, [self.table])
+                self.bulk_load_mode.disable()
+            else:
+                LOGGER.warning('Bulk mode ignored in commit mode: ' + self.commit_mode)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.commit()
-
-    def _insert_or_update(self, sql, parameters=None):
+        try:
+            self.commit()
+        finally:
+            if self.bulk_load_mode is not None:
+                bulk_load_mode = self.bulk_load_mode
+                self.bulk_load_mode = None
+                bulk_load_mode.__exit__(exc_type, exc_val, exc_tb)
+
+    def _insert_or_update(self, sql, parameters=None, strip_semi_colon=True, return_keys=False, n_rows=None):
         """
         Internal function handling either an insert, or an update command
         @param sql: str - generated sql for insert or update
         @param parameters: list or None, associated parameters, if any
+        @param strip_semi_colon: bool - remove trailing semi-colons from the sql (default). Set to False for
+            statements, which require a terminator (e.g., MERGE on sqlserver)
+        @param return_keys: bool - retrieve the keys of the identity column, if defined, into generated_keys
+        @param n_rows: int - number of rows of a statement with a single parameter list (multi-row inserts).
+            Counted in the dry-run and pipe modes. Defaults to the number of parameter lists
+        @return: list of int - the update count per parameter row for a list of parameter lists, None otherwise
         """
+        update_counts = None
         if self.commit_mode in [UPLOAD_MODE_COMMIT, UPLOAD_MODE_ROLLBACK]:
             exec_error = None
+            key_columns = None
+            if return_keys and (self.generated_key_column is not None):
+                key_columns = [self.generated_key_column]
             try:
-                self.cursor = self.jdbc.execute(sql, parameters, self.cursor, use_current_cursor=False)
+                self.cursor = self.jdbc.execute(sql, parameters, self.cursor, use_current_cursor=False,
+                                                strip_semi_colon=strip_semi_colon, key_columns=key_columns)
                 n = self.cursor.rowcount
+                update_counts = getattr(self.cursor, UPDATE_COUNTS, None)
+                if key_columns is not None:
+                    self.generated_keys.extend(getattr(self.cursor, GENERATED_KEYS, None) or [])
                 # except DatabaseError as db_error:
             except Exception as db_error:
-                LOGGER.error(db_error)
                 exec_error = db_error
                 n = 0
+            if exec_error is not None:
+                if self.bisecting:
+                    raise SQLExecuteException(str(exec_error).strip())
+                LOGGER.error(exec_error)
             if self.exit_on_fail and (exec_error is not None):
                 self.has_sql_errors = True
                 raise SQLExecuteException('Insert command failed: ' + str(exec_error))
         elif self.commit_mode in [UPLOAD_MODE_DRYRUN, UPLOAD_MODE_PIPE]:
             n = 1
-            if isinstance(parameters, list) and (len(parameters) > 0) and isinstance(parameters[0], list):
+            if n_rows is not None:
+                n = n_rows
+            elif isinstance(parameters, list) and (len(parameters) > 0) and isinstance(parameters[0], list):
                 n = len(parameters)
-            if self.commit_mode == UPLOAD_MODE_PIPE:
+            if (self.commit_mode == UPLOAD_MODE_PIPE) and (not isinstance(self.fstream, ScriptWriter)):
+                # a ScriptWriter streams the statements to disk
                 self.pipe_buffer.append((sql, parameters))
         else:
             supported_modes = [UPLOAD_MODE_COMMIT, UPLOAD_MODE_ROLLBACK, UPLOAD_MODE_DRYRUN, UPLOAD_MODE_PIPE]
@@ -169,7 +306,11 @@ class Uploader:
         if self.fstream is not None:
             if parameters is not None:
                 sql = '{} {}'.format(sql, str(parameters))
-            print(sql + ";", file=self.fstream)
+            if isinstance(self.fstream, ScriptWriter):
+                self.fstream.write_statement(sql, self.table)
+            else:
+                print(sql + ";", file=self.fstream)
+        return update_counts
 
     @staticmethod
     def set_commit_mode(commit_mode):
@@ -180,12 +321,24 @@ class Uploader:
         else:
             return UPLOAD_MODE_DRYRUN
 
-    def add_counter(self, columns: (str, list, set, tuple)):
+    def commit_is_due(self) -> bool:
+        """
+        @return: bool - True if the controller (see argument controller) decides that a commit is due.
+            Always False without a controller.
+        """
+        if self.controller is None:
+            return False
+        return self.controller.commit_is_due(self.row_count, self.uncommitted_bytes)
+
+    def add_counter(self, columns: (str, list, set, tuple), allocator: KeyAllocator = None):
         """
         Mark columns as counters. Assumes the column type is a number.
-        Queries the maximum number of each column and then adds the next value (+1) in the column on each insert.
+        By default, queries the maximum number of each column and then adds the next value (+1) in the column
+        on each insert. This is only safe if no other process inserts into the table.
 
         @param columns: columns to mark as a counter. May be a (comma-separated) string, a list, set, or a tuple
+        @param allocator: KeyAllocator - allocator of the keys (single column only), e.g., a HiLoAllocator
+            or a SequenceAllocator for concurrent uploads
         """
         if isinstance(columns, str):
             if ',' in columns:
@@ -194,11 +347,24 @@ class Uploader:
                 columns = [columns]
         elif not isinstance(columns, (list, set, tuple)):
             raise ValueError('Method add_counter requires a string, tuple or list')
+        if (allocator is not None) and (len(columns) != 1):
+            raise ValueError('A key allocator requires a single column. Found: {}'.format(columns))
 
         for name in columns:
             name = name.upper()
-            if name not in self.counters:
-                self.counters[name] = get_pk_counter(self.jdbc, self.table, name, 0)
+            if allocator is not None:
+                self.counters[name] = allocator
+            elif name not in self.counters:
+                self.counters[name] = get_key_allocator(self.jdbc, self.table, name)
+
+    def pop_generated_keys(self) -> list:
+        """
+        @return: list of int - the keys of the identity column generated since the previous call,
+            see the argument generated_keys
+        """
+        keys = self.generated_keys
+        self.generated_keys = []
+        return keys
 
     @staticmethod
     def capitalize_keys(d: dict):
@@ -237,18 +403,17 @@ class Uploader:
         else:
             return '=', value
 
+    def insert_row(self, columns: tuple, values: tuple):
+        """
+        Insert a row of positional values
+        @param columns: tuple of the column names (upper case)
+        @param values: tuple of the values in the order of the columns
+        """
+        # noinspection PyUnresolvedReferences
+        self.insert(OrderedDict(zip(columns, values)))
+
     def escape_column_names(self, column_names: list) -> list:
-        if self.jdbc.always_escape:
-            if self.jdbc.type == 'oracle':
-                return ['"{0}"'.format(c) for c in column_names]
-            elif self.jdbc.type == 'mysql':
-                return ['`{0}`'.format(c) for c in column_names]
-            elif self.jdbc.type == 'sqlserver':
-                return ['[{0}]'.format(c) for c in column_names]
-            else:
-                return [c for c in column_names]
-        else:
-            return [c for c in column_names]
+        return escape_column_names(self.jdbc, column_names)
 
     def escape_column_name(self, column_name):
         return self.escape_column_names([column_name])[0]
@@ -267,10 +432,16 @@ class Uploader:
             except (SQLExecuteException, LookupError, CommitException) as commit_exception:
                 error = commit_exception
         elif (self.commit_mode == UPLOAD_MODE_DRYRUN) and (self.fstream is not None):
-            print('DRY-RUN COMMIT {} } rows.'.format(self.table, self.row_count), file=self.fstream)
+            print('DRY-RUN COMMIT {}: {} rows.'.format(self.table, self.row_count), file=self.fstream)
 
         self.cursor = None
         self.row_count = 0
+        self.uncommitted_bytes = 0
+        if self.controller is not None:
+            if error is None:
+                self.controller.record_commit()
+            else:
+                self.controller.record_error(error)
         if error is not None:
             msg = '{}: {}'.format(type(error).__name__, error)
             raise CommitException(msg)
@@ -299,6 +470,8 @@ class NativeUploader(Uploader):
         # default values, if not present in the input row
         self.database_type = kwargs.get('type', jdbc.type)
         self.defaults = dict()
+        # zone policy of the date values in the sql
+        self.zone = check_zone(kwargs.get('zone', getattr(jdbc, 'zone', ZONE_LOCAL)))
 
     def __enter__(self):
         return super(NativeUploader, self).__enter__()
@@ -339,8 +512,7 @@ class NativeUploader(Uploader):
                     dd[column_name] = "'{0}'".format(value)
         if add_defaults:
             for column_name in [k for k in self.counters.keys() if k not in dd]:
-                self.counters[column_name] = get_pk_counter(self.jdbc, self.table, column_name)
-                dd[column_name] = str(self.counters[column_name])
+                dd[column_name] = str(self.counters[column_name].next_key())
         return dd
 
     def _process_where_clause(self, where_clause):
@@ -371,25 +543,24 @@ class NativeUploader(Uploader):
         @return: native SQL representation of the date
         """
         if isinstance(value, str):
-            pass
+            if RE_IS_DATE.match(value) or RE_IS_DATE_TIME.match(value):
+                t = parse_datetime(value)
+            else:
+                raise ValueError(
+                    'Value ({}) cannot be converted to a time object.'.format(value))
         elif isinstance(value, float):
-            value = datetime.fromtimestamp(int(value)).strftime(DEFAULT_TIME_FORMAT)
+            t = from_epoch_seconds(int(value), zone=self.zone)
         elif isinstance(value, datetime):
-            value = value.strftime(DEFAULT_TIME_FORMAT_MS)
+            t = value
         else:
             raise ValueError('Value cannot be converted to a time object.')
+        # the sql has no UTC offset
+        t = to_naive(t, self.zone)
 
-        if RE_IS_DATE.match(value):
-            value = value + ' 00:00:00'
-        if RE_IS_DATE_TIME.match(value):
-            t = dt_parse(value)
-            if self.database_type == 'oracle':
-                return "TO_TIMESTAMP('{}','YYYY-MM-DD HH24:MI:SS.FF3')".format(t.strftime(DEFAULT_TIME_FORMAT_MS))
-            else:
-                return "'{}'".format(t.strftime(DEFAULT_TIME_FORMAT_MS) + '000')
+        if self.database_type == 'oracle':
+            return "TO_TIMESTAMP('{}','YYYY-MM-DD HH24:MI:SS.FF3')".format(t.strftime(DEFAULT_TIME_FORMAT_MS))
         else:
-            raise ValueError(
-                'Value ({}) cannot be converted to a time object.'.format(value))
+            return "'{}'".format(t.strftime(DEFAULT_TIME_FORMAT_MS) + '000')
 
     def insert(self, data: dict):
         """
@@ -472,7 +643,7 @@ class ParameterUploader(Uploader):
                  fstream=None, commit_mode=UPLOAD_MODE_DRYRUN, exit_on_fail=True, **kwargs):
         super(ParameterUploader, self).__init__(jdbc, table, fstream=fstream, commit_mode=commit_mode,
                                                 exit_on_fail=exit_on_fail, **kwargs)
-        self.sqlDate = JPackage('java').sql.Timestamp
+        self.temporal = TemporalConverter(kwargs.get('zone', getattr(jdbc, 'zone', ZONE_LOCAL)))
 
     def __enter__(self):
         return super(ParameterUploader, self).__enter__()
@@ -490,7 +661,7 @@ class ParameterUploader(Uploader):
             column_name = column_name.upper()
             if (column_name in column_names) and (not is_empty(value)):
                 data_dict[column_name] = value
-            else:
+            elif column_name in self.columns:
                 null_list.append(column_name)
         if export_null:
             return data_dict, null_list
@@ -513,8 +684,8 @@ class ParameterUploader(Uploader):
         @param value: value to convert
         @return: converted value
         """
-        if isinstance(value, datetime):
-            return self.sqlDate((int(value.strftime("%s"))*1000) + (value.microsecond // 1000))
+        if isinstance(value, date):
+            return self.temporal.to_timestamp(value)
         elif type(value).__name__ in ['bytes', 'bytearray']:
             error_msg = None
             try:
@@ -530,14 +701,10 @@ class ParameterUploader(Uploader):
             return value
         elif isinstance(value, str):
             if self.columns[column_name] == COLUMN_TYPE_DATE:
-                if RE_IS_DATE_TIME.match(value):
-                    date = dt_parse(value)
-                elif RE_IS_DATE.match(value):
-                    date = datetime.strptime(value[:10], DEFAULT_DATE_FORMAT)
-                else:
-                    msg = 'Invalid time format: {}'.format(value)
-                    raise ValueError(msg)
-                return self.sqlDate((int(date.strftime("%s"))*1000) + (date.microsecond // 1000))
+                try:
+                    return self.temporal.to_timestamp(value)
+                except (ValueError, OverflowError):
+                    raise ValueError('Invalid time format: {}'.format(value))
             elif self.columns[column_name] == COLUMN_TYPE_NUMBER:
                 return int(value)
             elif self.columns[column_name] == COLUMN_TYPE_FLOAT:
@@ -560,40 +727,44 @@ class ParameterUploader(Uploader):
             values.append(self._convert(column_name, dd[column_name]))
 
         for column_name in [k for k in self.counters.keys() if k not in cols]:
-            self.counters[column_name] = get_pk_counter(self.jdbc, self.table, column_name)
             cols.append(column_name)
-            values.append(self.counters[column_name])
+            values.append(self.counters[column_name].next_key())
 
         if len(cols) > 0:
             sql = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(
                 self.table, ','.join(self.escape_column_names(cols)), ','.join(['?'] * len(values)))
-            self._insert_or_update(sql, values)
+            self._insert_or_update(sql, values, return_keys=True)
 
-    def update(self, data: dict, where_clause):
+    def insert_row(self, columns: tuple, values: tuple):
         """
-        Update an existing row in the table
-        @param data: dict of values, keys are the column name. Non-existing column names are ignored.
-        @param where_clause: None, str, or dict.
-           - None - Updates all columns.
-           - dict - keys are column names. Non-existing column names are ignored. Multiple columns are
-                    combined with the AND statement. The value may be:
-                    - a raw value (results in COLUMN_NAME = VALUE)
-                    - a string with an operator and value (e.g., LIKE 'ABC%')
-                    - a tuple (operator,value)
+        Insert a row of positional values. Faster than insert(): the columns are not filtered, and must
+        exist in the table. Columns with a None value are omitted, as in insert(), so their default applies.
+        @param columns: tuple of the column names (upper case)
+        @param values: tuple of the values in the order of the columns
         """
-        update_data, null_list = self._filter_data(data, True)
-        if (len(update_data) + len(null_list)) == 0:
-            return
+        cols = []
+        row = []
+        for column_name, value in zip(columns, values):
+            if value is not None:
+                cols.append(column_name)
+                row.append(self._convert(column_name, value))
+        for column_name in [k for k in self.counters.keys() if k not in columns]:
+            cols.append(column_name)
+            row.append(self.counters[column_name].next_key())
+
+        if len(cols) > 0:
+            sql = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+                self.table, ','.join(self.escape_column_names(cols)), ','.join(['?'] * len(row)))
+            self._insert_or_update(sql, row, return_keys=True)
 
+    def _where_statement(self, where_clause):
+        """
+        Parse the where clause into a parameterized SQL where statement
+        @param where_clause: None or dict, see update()
+        @return: tuple (str - the where statement, list - parameter values, dict - the filtered where clause)
+        """
         values = []
-        s_list = []
         w_list = []
-        for column_name in [k for k in self.columns.keys() if k in update_data]:
-            values.append(self._convert(column_name, update_data[column_name]))
-            s_list.append('{} = ?'.format(self.escape_column_name(column_name)))
-        for column_name in null_list:
-            s_list.append('{} = NULL'.format(self.escape_column_name(column_name)))
-
         where_data = self._process_where_clause(where_clause)
         if where_data:
             for column_name in [k for k in self.columns.keys() if k in where_data]:
@@ -604,8 +775,59 @@ class ParameterUploader(Uploader):
             where_str = 'WHERE {}'.format(' AND '.join(w_list))
         else:
             where_str = ''
+        return where_str, values, where_data
+
+    def _update_statement(self, data: dict, where_clause):
+        """
+        Generate the parameterized SQL of an update
+        @param data: dict of values, see update()
+        @param where_clause: None or dict, see update()
+        @return: tuple (sql, parameter values, filtered where clause), or None if there is nothing to update
+        """
+        update_data, null_list = self._filter_data(data, True)
+        if (len(update_data) + len(null_list)) == 0:
+            return None
+
+        values = []
+        s_list = []
+        for column_name in [k for k in self.columns.keys() if k in update_data]:
+            values.append(self._convert(column_name, update_data[column_name]))
+            s_list.append('{} = ?'.format(self.escape_column_name(column_name)))
+        for column_name in null_list:
+            s_list.append('{} = NULL'.format(self.escape_column_name(column_name)))
+
+        where_str, where_values, where_data = self._where_statement(where_clause)
         sql = 'UPDATE {} SET {} {}'.format(self.table, ', '.join(s_list), where_str)
-        self._insert_or_update(sql, values)
+        return sql, values + where_values, where_data
+
+    def _delete_statement(self, where_clause):
+        """
+        Generate the parameterized SQL of a delete
+        @param where_clause: None or dict, see delete()
+        @return: tuple (sql, parameter values or None, filtered where clause)
+        """
+        where_str, values, where_data = self._where_statement(where_clause)
+        if len(values) == 0:
+            values = None
+        sql = 'DELETE FROM {} {}'.format(self.table, where_str)
+        return sql, values, where_data
+
+    def update(self, data: dict, where_clause):
+        """
+        Update an existing row in the table
+        @param data: dict of values, keys are the column name. Non-existing column names are ignored.
+        @param where_clause: None, str, or dict.
+           - None - Updates all columns.
+           - dict - keys are column names. Non-existing column names are ignored. Multiple columns are
+                    combined with the AND statement. The value may be:
+                    - a raw value (results in COLUMN_NAME = VALUE)
+                    - a string with an operator and value (e.g., LIKE 'ABC%')
+                    - a tuple (operator,value)
+        """
+        statement = self._update_statement(data, where_clause)
+        if statement is not None:
+            sql, values, _ = statement
+            self._insert_or_update(sql, values)
 
     def delete(self, where_clause):
         """
@@ -618,21 +840,7 @@ class ParameterUploader(Uploader):
                     - a string with an operator and value (e.g., LIKE 'ABC%')
                     - a tuple (operator,value)
         """
-
-        values = []
-        w_list = []
-        where_data = self._process_where_clause(where_clause)
-        if where_data:
-            for column_name in [k for k in self.columns.keys() if k in where_data]:
-                operator, value = self._split_where_value(where_data[column_name], ('IS', None))
-                values.append(self._convert(column_name, value))
-                w_list.append('{} {} ?'.format(column_name, operator))
-        if len(w_list) > 0:
-            where_str = 'WHERE {}'.format(' AND '.join(w_list))
-        else:
-            where_str = ''
-            values = None
-        sql = 'DELETE FROM {} {}'.format(self.table, where_str)
+        sql, values, _ = self._delete_statement(where_clause)
         self._insert_or_update(sql, values)
 
     def commit(self):
@@ -645,54 +853,1035 @@ class MultiParameterUploader(ParameterUploader):
     """
         Upload data into a table using the jdbc executemany parameterized command.
         Supports:
-        - insert
+        - insert  - insert a new row
+        - update  - update rows
+        - delete  - delete rows
+
+        Rows are buffered as positional lists against a registry of the used columns. The buffer is flushed
+        (send to the database without a commit) automatically once it holds batch_size rows, or its estimated
+        size exceeds batch_bytes. Specify zero or a negative number to disable either limit.
+
+        Updates and deletes with the same SET/WHERE shape share a single parameterized statement. The buffer
+        is flushed when the type of operation (insert, update, delete) changes, so these are sent in order.
+        Updates of a different shape are grouped by statement in the order of first appearance: do not rely
+        on their order for the same row within a single flush.
+        Updates and deletes that did not affect any row are collected in missing_rows.
+
+        With bisection (arguments reject or bisect), a failed batch is rolled back to a savepoint, split
+        in two halves, and each half is retried recursively until the failing rows are isolated. These rows
+        are rejected (see pop_rejected_rows) and the other rows of the batch are kept.
     """
 
     def __init__(self, jdbc: Jdbc, table: str, fstream=None, commit_mode=UPLOAD_MODE_DRYRUN,
                  exit_on_fail=True, **kwargs):
         super(MultiParameterUploader, self).__init__(jdbc, table, fstream=fstream, commit_mode=commit_mode,
                                                      exit_on_fail=exit_on_fail, **kwargs)
+        self.batch_size = kwargs.get('batch_size', DEFAULT_BATCH_SIZE)
+        self.batch_bytes = kwargs.get('batch_bytes', DEFAULT_BATCH_BYTES)
+
+        # used_keys: column name -> position in the buffered rows
+        self.used_keys = OrderedDict()
         self.data_buffer = []
-        self.used_keys = []
+        # tuple (columns, positions in the buffered rows) of the rows of insert_row()
+        self.row_positions = None
+        # statement_buffer: sql -> (list of parameter rows, list of associated where clauses)
+        self.statement_buffer = OrderedDict()
+        self.statement_count = 0
+        # the type of the buffered operations: insert, update, or delete
+        self.buffered_operation = None
+        # estimated bytes of the buffered inserts, and of the buffered updates and deletes
+        self.buffer_size = 0
+        self.statement_bytes = 0
+
+        # where clauses of updates and deletes, which did not affect any row
+        self.missing_rows = []
         if self.commit_mode == UPLOAD_MODE_PIPE:
             msg = "Commit mode '{}' not allowed for this class.".format(self.commit_mode)
             raise ValueError(msg)
 
+        # bisection of failed batches: RejectWriter, file name, or text stream for the rejected rows
+        reject = kwargs.get('reject', None)
+        self.owns_reject_writer = isinstance(reject, str)
+        if (reject is None) or isinstance(reject, RejectWriter):
+            self.reject_writer = reject
+        else:
+            self.reject_writer = RejectWriter(reject)
+        self.bisect = verified_boolean(kwargs.get('bisect', self.reject_writer is not None)) and \
+            (self.commit_mode in [UPLOAD_MODE_COMMIT, UPLOAD_MODE_ROLLBACK])
+        # tuples (operation, dict of values, error message) of the rejected rows, if there is no reject writer
+        self.rejected_rows = []
+        self.reject_count = 0
+
     def __enter__(self):
         super(MultiParameterUploader, self).__enter__()
-        self.data_buffer = []
-        self.used_keys = []
+        self._clear_buffer()
+        self._clear_statement_buffer()
+        self.missing_rows = []
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        super(MultiParameterUploader, self).__exit__(exc_type, exc_val, exc_tb)
+        try:
+            super(MultiParameterUploader, self).__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            if self.reject_writer is not None:
+                if self.owns_reject_writer:
+                    self.reject_writer.close()
+                else:
+                    self.reject_writer.flush()
+
+    def _clear_buffer(self):
+        self.used_keys = OrderedDict()
+        self.data_buffer = []
+        self.row_positions = None
+        self.buffer_size = 0
+
+    def _clear_statement_buffer(self):
+        self.statement_buffer = OrderedDict()
+        self.statement_count = 0
+        self.statement_bytes = 0
+
+    def _buffer_is_full(self) -> bool:
+        batch_size = self.batch_size if self.controller is None else self.controller.batch_size
+        if (batch_size is not None) and (0 < batch_size <= len(self.data_buffer) + self.statement_count):
+            return True
+        return (self.batch_bytes is not None) and (0 < self.batch_bytes <= self.buffer_size + self.statement_bytes)
+
+    def _set_value(self, row: list, column_name: str, value):
+        position = self.used_keys.get(column_name, None)
+        if position is None:
+            # rows stored earlier are padded on flush
+            position = len(self.used_keys)
+            self.used_keys[column_name] = position
+            row.append(None)
+        row[position] = value
+
+    def _switch_operation(self, operation: str):
+        """
+        Flush the buffer, if it holds operations of another type
+        @param operation: str - insert, update, or delete
+        """
+        if (self.buffered_operation is not None) and (self.buffered_operation != operation):
+            self.flush()
+        self.buffered_operation = operation
+
+    def _add_statement(self, sql: str, values: list, where_data):
+        if sql not in self.statement_buffer:
+            self.statement_buffer[sql] = [], []
+        parameters, where_list = self.statement_buffer[sql]
+        parameters.append(values)
+        where_list.append(where_data)
+        self.statement_count += 1
+        self.statement_bytes += sum([estimate_size(v) for v in values])
+        self.row_count += 1
+        if self._buffer_is_full():
+            self.flush()
 
     def insert(self, data: dict):
-        dd = dict()
-        for column_name, value in self._filter_data(data).items():
-            dd[column_name] = self._convert(column_name, value)
+        dd = self._filter_data(data)
+        self._switch_operation('insert')
+        row = [None] * len(self.used_keys)
+        for column_name, value in dd.items():
+            self._set_value(row, column_name, self._convert(column_name, value))
+            self.buffer_size += estimate_size(value)
         for column_name in [k for k in self.counters if k not in dd]:
-            dd[column_name] = get_pk_counter(self.jdbc, self.table, column_name)
-        if len(dd) > 0:
-            self.used_keys += [k for k in dd.keys() if k not in self.used_keys]
-            self.data_buffer.append(dd)
+            self._set_value(row, column_name, self.counters[column_name].next_key())
+            self.buffer_size += 8
+        if (len(dd) + len(self.counters)) > 0:
+            self.data_buffer.append(row)
             self.row_count += 1
+            if self._buffer_is_full():
+                self.flush()
 
-    def commit(self):
-        if len(self.data_buffer) == 0:
-            return
+    def _row_positions(self, columns: tuple) -> list:
+        """
+        @param columns: tuple of the column names of insert_row()
+        @return: list of the positions of the columns in the buffered rows
+        """
+        if (self.row_positions is None) or \
+                ((self.row_positions[0] is not columns) and (self.row_positions[0] != columns)):
+            for column_name in columns:
+                if column_name not in self.used_keys:
+                    # rows stored earlier are padded on flush
+                    self.used_keys[column_name] = len(self.used_keys)
+            self.row_positions = columns, [self.used_keys[c] for c in columns]
+        return self.row_positions[1]
+
+    def insert_row(self, columns: tuple, values: tuple):
+        """
+        Buffer an insert of a row of positional values. See ParameterUploader.insert_row()
+        """
+        self._switch_operation('insert')
+        positions = self._row_positions(columns)
+        row = [None] * len(self.used_keys)
+        for position, column_name, value in zip(positions, columns, values):
+            if value is not None:
+                row[position] = self._convert(column_name, value)
+                self.buffer_size += estimate_size(value)
+        for column_name in [k for k in self.counters if k not in columns]:
+            self._set_value(row, column_name, self.counters[column_name].next_key())
+            self.buffer_size += 8
+        self.data_buffer.append(row)
+        self.row_count += 1
+        if self._buffer_is_full():
+            self.flush()
 
-        keys = [k for k in self.columns.keys() if k in self.used_keys]
-        parameters = []
-        for data in self.data_buffer:
-            values = []
-            for column_name in keys:
-                values.append(data.get(column_name, None))
-            parameters.append(values)
+    def update(self, data: dict, where_clause):
+        """
+        Buffer an update of existing rows in the table. See ParameterUploader.update()
+        """
+        statement = self._update_statement(data, where_clause)
+        if statement is not None:
+            self._switch_operation('update')
+            self._add_statement(*statement)
+
+    def delete(self, where_clause):
+        """
+        Buffer a delete of existing rows from the table. See ParameterUploader.delete()
+        A delete without a where clause is executed immediately, after a flush of the buffer.
+        """
+        sql, values, where_data = self._delete_statement(where_clause)
+        if values is None:
+            self.flush()
+            self._insert_or_update(sql, None)
+        else:
+            self._switch_operation('delete')
+            self._add_statement(sql, values, where_data)
 
+    def _send_inserts(self, keys: list):
+        """
+        Send the buffered inserts to the database
+        @param keys: list - the column names of each (padded) row in the buffer
+        """
         sql = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(self.table, ','.join(self.escape_column_names(keys)),
                                                           ','.join(['?'] * len(keys)))
-        self._insert_or_update(sql, parameters)
-        self.data_buffer = []
-        self.used_keys = []
+        self._insert_or_update(sql, self.data_buffer, return_keys=True)
+
+    def _send_rows(self, keys: list, rows: list):
+        """
+        Send a part of the buffered inserts to the database
+        @param keys: list - the column names of each (padded) row
+        @param rows: list - the rows to send
+        """
+        data_buffer = self.data_buffer
+        self.data_buffer = rows
+        try:
+            self._send_inserts(keys)
+        finally:
+            self.data_buffer = data_buffer
+
+    def _send_statement(self, sql: str, rows: list):
+        """
+        Send an update or delete statement for a list of parameter rows
+        @param sql: str - the parameterized statement
+        @param rows: list of tuples (parameter values, where clause)
+        """
+        update_counts = self._insert_or_update(sql, [values for values, _ in rows])
+        if update_counts is not None:
+            self.missing_rows += [w for n, (_, w) in zip(update_counts, rows) if n == 0]
+
+    def _reject(self, operation: str, data: dict, error):
+        LOGGER.warning('Rejected {} on {}: {}'.format(operation, self.table, error))
+        self.reject_count += 1
+        if self.reject_writer is not None:
+            self.reject_writer.write(self.table, operation, data, error)
+        else:
+            self.rejected_rows.append((operation, data, str(error)))
+
+    def _bisect(self, rows: list, send, describe) -> int:
+        """
+        Send rows to the database. On failure, roll back to a savepoint, split the rows in two halves,
+        and retry each half, until the failing rows are isolated and rejected.
+        Without a savepoint (auto-commit), the rows are sent once and the bisection is switched off: the
+        rows of a failed batch may already be stored, and are not sent again.
+        @param rows: list - the rows to send
+        @param send: function - sends a list of rows
+        @param describe: function - returns a tuple (operation, dict of values) of a rejected row
+        @return: int - the number of rejected rows
+        """
+        savepoint = self.jdbc.set_savepoint()
+        if savepoint is None:
+            LOGGER.warning('No savepoint on the connection (auto-commit): no bisection of failed batches.')
+            self.bisect = False
+            send(rows)
+            return 0
+        n_keys = len(self.generated_keys)
+        total_row_count = self.total_row_count
+        self.bisecting = True
+        try:
+            send(rows)
+        except SQLExecuteException as error:
+            self.jdbc.rollback(savepoint)
+            del self.generated_keys[n_keys:]
+            self.total_row_count = total_row_count
+            if len(rows) == 1:
+                self._reject(*describe(rows[0]), error)
+                return 1
+            half = len(rows) // 2
+            return self._bisect(rows[:half], send, describe) + self._bisect(rows[half:], send, describe)
+        finally:
+            self.bisecting = False
+        self.jdbc.release_savepoint(savepoint)
+        return 0
+
+    def _flush_inserts(self):
+        if len(self.data_buffer) == 0:
+            return
+
+        n_columns = len(self.used_keys)
+        for row in self.data_buffer:
+            if len(row) < n_columns:
+                row.extend([None] * (n_columns - len(row)))
+
+        # the rows are already counted on insert
+        row_count = self.row_count
+        rejected = 0
+        keys = list(self.used_keys.keys())
+        try:
+            if self.bisect:
+                rejected = self._bisect(self.data_buffer, partial(self._send_rows, keys),
+                                        lambda row: ('insert', OrderedDict(zip(keys, row))))
+            else:
+                self._send_inserts(keys)
+        finally:
+            self.row_count = row_count - rejected
+            self._clear_buffer()
+
+    def _flush_statements(self):
+        if self.statement_count == 0:
+            return
+
+        row_count = self.row_count
+        rejected = 0
+        try:
+            for sql, (parameters, where_list) in self.statement_buffer.items():
+                rows = list(zip(parameters, where_list))
+                if self.bisect:
+                    operation = sql.split(None, 1)[0].lower()
+                    rejected += self._bisect(rows, partial(self._send_statement, sql),
+                                             lambda row: (operation, {'values': row[0], 'where': row[1]}))
+                else:
+                    self._send_statement(sql, rows)
+        finally:
+            self.row_count = row_count - rejected
+            self._clear_statement_buffer()
+
+    def flush(self):
+        """
+        Send the buffered rows to the database without a commit.
+        The rows are padded in place, no copy of the buffer is made.
+        """
+        self.buffered_operation = None
+        rows = len(self.data_buffer) + self.statement_count
+        if rows == 0:
+            return
+        n_bytes = self.buffer_size + self.statement_bytes
+        is_partial = not self._buffer_is_full()
+        t0 = datetime.now()
+        error = None
+        try:
+            self._flush_inserts()
+            self._flush_statements()
+        except Exception as flush_error:
+            error = flush_error
+            raise
+        finally:
+            self.uncommitted_bytes += n_bytes
+            if self.controller is not None:
+                self.controller.record_flush(rows, n_bytes, (datetime.now() - t0).total_seconds(), error,
+                                             is_partial)
+
+    def pop_missing_rows(self) -> list:
+        """
+        @return: list of the where clauses of updates and deletes, which did not affect any row since
+            the previous call. Only available after a flush.
+        """
+        missing_rows = self.missing_rows
+        self.missing_rows = []
+        return missing_rows
+
+    def pop_rejected_rows(self) -> list:
+        """
+        @return: list of tuples (operation, dict of values, error message) of the rows rejected by the bisection
+            of failed batches since the previous call. Only available after a flush, and only without a
+            reject writer (argument reject).
+        """
+        rejected_rows = self.rejected_rows
+        self.rejected_rows = []
+        return rejected_rows
+
+    def commit(self):
+        self.flush()
         super(ParameterUploader, self).commit()
+
+
+class MultiRowUploader(MultiParameterUploader):
+    """
+        Upload data into a table by packing multiple rows into a single INSERT statement:
+        - INSERT INTO t (...) VALUES (...),(...),... for most databases
+        - INSERT ALL INTO t (...) VALUES (...) ... SELECT 1 FROM dual for oracle
+
+        Faster than the executemany of the MultiParameterUploader for drivers with a poor batch
+        implementation, e.g., mysql without rewriteBatchedStatements, or sqlserver with the Microsoft driver.
+        The number of rows per statement respects the parameter limit of the database type, and for mysql
+        also max_allowed_packet. Updates and deletes are handled as in the MultiParameterUploader.
+    """
+
+    def __init__(self, jdbc: Jdbc, table: str, fstream=None, commit_mode=UPLOAD_MODE_DRYRUN,
+                 exit_on_fail=True, **kwargs):
+        super(MultiRowUploader, self).__init__(jdbc, table, fstream=fstream, commit_mode=commit_mode,
+                                               exit_on_fail=exit_on_fail, **kwargs)
+        self.database_type = kwargs.get('type', jdbc.type)
+        self.max_statement_parameters = kwargs.get(
+            'max_statement_parameters',
+            MAX_STATEMENT_PARAMETERS.get(self.database_type, DEFAULT_MAX_STATEMENT_PARAMETERS))
+        self.max_statement_rows = kwargs.get(
+            'max_statement_rows', MAX_STATEMENT_ROWS.get(self.database_type, DEFAULT_MAX_STATEMENT_ROWS))
+        self.max_packet_size = None
+        if self.database_type == 'mysql':
+            self.max_packet_size = DEFAULT_MYSQL_PACKET_SIZE
+            if isinstance(jdbc, Jdbc):
+                try:
+                    self.max_packet_size = jdbc.get_int('SELECT @@max_allowed_packet')
+                except SQLExecuteException as exec_error:
+                    LOGGER.warning('Cannot retrieve max_allowed_packet: {}'.format(exec_error))
+
+        # statement templates: (column names, number of rows) -> sql
+        self.statement_cache = dict()
+
+    def __enter__(self):
+        return super(MultiRowUploader, self).__enter__()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        super(MultiRowUploader, self).__exit__(exc_type, exc_val, exc_tb)
+
+    def rows_per_statement(self, n_columns: int) -> int:
+        """
+        @param n_columns: int - number of columns per row
+        @return: int - the maximum number of rows in a single statement for the current buffer
+        """
+        n_rows = max(1, min(self.max_statement_rows, self.max_statement_parameters // max(1, n_columns)))
+        if (self.max_packet_size is not None) and (len(self.data_buffer) > 0):
+            # keep a margin for the sql text and the protocol overhead. The buffer size only counts the inserts
+            row_size = 16 * n_columns + (self.buffer_size // len(self.data_buffer))
+            n_rows = max(1, min(n_rows, (3 * self.max_packet_size // 4) // row_size))
+        return n_rows
+
+    def _statement(self, keys: tuple, n_rows: int) -> str:
+        """
+        Get the insert statement for the specified columns and number of rows. Statements are cached.
+        """
+        cache_key = keys, n_rows
+        sql = self.statement_cache.get(cache_key, None)
+        if sql is None:
+            columns = ','.join(self.escape_column_names(list(keys)))
+            values = '({})'.format(','.join(['?'] * len(keys)))
+            if self.database_type == 'oracle':
+                into = 'INTO {} ({}) VALUES {}'.format(self.table, columns, values)
+                sql = 'INSERT ALL {} SELECT 1 FROM dual'.format(' '.join([into] * n_rows))
+            else:
+                sql = 'INSERT INTO {} ({}) VALUES {}'.format(self.table, columns, ','.join([values] * n_rows))
+            if len(self.statement_cache) > 16:
+                # different column sets: only keep the most recent
+                self.statement_cache = dict()
+            self.statement_cache[cache_key] = sql
+        return sql
+
+    def _send_inserts(self, keys: list):
+        keys = tuple(keys)
+        n_rows = self.rows_per_statement(len(keys))
+        for x in range(0, len(self.data_buffer), n_rows):
+            chunk = self.data_buffer[x:x + n_rows]
+            self._insert_or_update(self._statement(keys, len(chunk)), [v for row in chunk for v in row],
+                                   n_rows=len(chunk))
+
+
+def java_class(class_name: str):
+    """
+    Retrieve a java class from the JVM
+    @param class_name: str - full name of the class, e.g., org.postgresql.copy.CopyManager
+    @return: the java class
+    @raise LookupError if the class is not loaded
+    """
+    domains = class_name.split('.')
+    jclass = JPackage(domains.pop(0))
+    try:
+        for domain in domains:
+            jclass = getattr(jclass, domain)
+    except AttributeError:
+        jclass = None
+    if (jclass is None) or (type(jclass).__name__ == 'JPackage'):
+        raise LookupError('Java class not found: ' + class_name)
+    return jclass
+
+
+@JImplements('java.util.Enumeration', deferred=True)
+class ChunkEnumeration:
+    """
+    Java enumeration, which takes the next element from a python iterator on demand
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.next_chunk = next(chunks, None)
+
+    @JOverride
+    def hasMoreElements(self):
+        return self.next_chunk is not None
+
+    @JOverride
+    def nextElement(self):
+        chunk = self.next_chunk
+        self.next_chunk = next(self.chunks, None)
+        return chunk
+
+
+class BulkUploader(MultiParameterUploader):
+    """
+        Upload data into a table through the native bulk interface of the database, reached via the
+        classes of the JDBC driver:
+        - postgresql: CopyManager.copyIn (COPY ... FROM STDIN in CSV format)
+        - sqlserver:  SQLServerBulkCopy with a CSV record stream
+        - mysql:      LOAD DATA LOCAL INFILE from an in-memory stream. Requires allowLoadLocalInfile=true
+                      in the connection url.
+        - oracle:     array-bound batched inserts. With direct_path=True, the inserts use the APPEND_VALUES
+                      hint. A direct-path insert must be committed before the next flush: call commit()
+                      after each batch.
+        Other database types (e.g., sqlite) use the batched inserts of the MultiParameterUploader.
+
+        The buffer is streamed to the server on each flush. Updates and deletes are handled as in the
+        MultiParameterUploader. In dry-run mode the executemany statements are logged instead.
+    """
+
+    def __init__(self, jdbc: Jdbc, table: str, fstream=None, commit_mode=UPLOAD_MODE_DRYRUN,
+                 exit_on_fail=True, **kwargs):
+        kwargs.setdefault('batch_size', DEFAULT_BULK_BATCH_SIZE)
+        kwargs.setdefault('batch_bytes', DEFAULT_BULK_BATCH_BYTES)
+        super(BulkUploader, self).__init__(jdbc, table, fstream=fstream, commit_mode=commit_mode,
+                                           exit_on_fail=exit_on_fail, **kwargs)
+        self.database_type = kwargs.get('type', jdbc.type)
+        self.direct_path = verified_boolean(kwargs.get('direct_path', False))
+        # a direct-path insert was sent, which is not committed yet
+        self.direct_path_pending = False
+
+        self.bulk_loader = None
+        if self.commit_mode in [UPLOAD_MODE_COMMIT, UPLOAD_MODE_ROLLBACK]:
+            self.bulk_loader = {
+                'postgresql': self._copy_postgresql,
+                'sqlserver': self._bulk_copy_sqlserver,
+                'mysql': self._load_data_mysql
+            }.get(self.database_type, None)
+
+    def __enter__(self):
+        return super(BulkUploader, self).__enter__()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        super(BulkUploader, self).__exit__(exc_type, exc_val, exc_tb)
+
+    def _convert(self, column_name: str, value):
+        if self.bulk_loader is None:
+            return super(BulkUploader, self)._convert(column_name, value)
+        else:
+            # serialized as text on flush
+            return value
+
+    def _text_value(self, value) -> str:
+        """
+        Serialize a value for the text-based bulk interfaces
+        """
+        if isinstance(value, str):
+            return value
+        elif isinstance(value, bool):
+            if self.database_type == 'postgresql':
+                return 'true' if value else 'false'
+            return '1' if value else '0'
+        elif isinstance(value, datetime):
+            return value.strftime(DEFAULT_TIME_FORMAT_MS)
+        elif isinstance(value, date):
+            return value.strftime(DEFAULT_DATE_FORMAT)
+        elif isinstance(value, (bytes, bytearray)):
+            if self.database_type == 'postgresql':
+                return '\\x' + value.hex()
+            raise SQLExecuteException('Binary upload not supported by the bulk loader of ' + self.database_type)
+        else:
+            return str(value)
+
+    def _csv_value(self, value) -> str:
+        if value is None:
+            return ''
+        return '"{}"'.format(self._text_value(value).replace('"', '""'))
+
+    def _tsv_value(self, value) -> str:
+        if value is None:
+            return '\\N'
+        return self._text_value(value).replace('\\', '\\\\').replace('\t', '\\t').replace(
+            '\n', '\\n').replace('\r', '\\r').replace('\0', '\\0')
+
+    def _serialize_buffer(self, formatter, delimiter: str):
+        """
+        Serialize the buffer as delimited text, in chunks of BULK_STREAM_CHUNK_ROWS rows. The buffer is not
+        changed: the rows of a failed batch are retried in the bisection, see _bisect()
+        @param formatter: function to format a single value
+        @param delimiter: str - the column delimiter
+        @return: iterator of bytes - the utf-8 encoded lines of each chunk
+        """
+        rows = self.data_buffer
+        for x in range(0, len(rows), BULK_STREAM_CHUNK_ROWS):
+            lines = [delimiter.join([formatter(v) for v in row]) for row in rows[x:x + BULK_STREAM_CHUNK_ROWS]]
+            lines.append('')
+            yield '\n'.join(lines).encode('utf-8')
+
+    def _stream_buffer(self, formatter, delimiter: str):
+        """
+        Serialize the buffer into a java input stream, see _serialize_buffer(). The chunks are serialized
+        while the stream is read
+        @return: java.io.SequenceInputStream
+        """
+        byte_stream = java_class('java.io.ByteArrayInputStream')
+        chunks = (byte_stream(chunk) for chunk in self._serialize_buffer(formatter, delimiter))
+        return java_class('java.io.SequenceInputStream')(ChunkEnumeration(chunks))
+
+    def _copy_postgresql(self, keys: list) -> int:
+        stream = self._stream_buffer(self._csv_value, ',')
+        base_connection = self.jdbc.connection.jconn.unwrap(java_class('org.postgresql.core.BaseConnection'))
+        copy_manager = java_class('org.postgresql.copy.CopyManager')(base_connection)
+        sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            self.table, ','.join(self.escape_column_names(keys)))
+        return int(copy_manager.copyIn(sql, stream))
+
+    def _bulk_copy_sqlserver(self, keys: list) -> int:
+        n_rows = len(self.data_buffer)
+        stream = self._stream_buffer(self._csv_value, ',')
+        record = java_class('com.microsoft.sqlserver.jdbc.SQLServerBulkCSVFileRecord')(stream, 'UTF-8', ',', False)
+        record.setEscapeColumnDelimitersCSV(True)
+        nvarchar = java_class('java.sql.Types').NVARCHAR
+        bulk_copy = java_class('com.microsoft.sqlserver.jdbc.SQLServerBulkCopy')(self.jdbc.connection.jconn)
+        bulk_copy.setDestinationTableName(self.table)
+        for x, column_name in enumerate(keys, start=1):
+            # the values are converted by the server: text and LOB columns are declared as NVARCHAR(MAX)
+            precision = SQLSERVER_TEXT_PRECISION.get(self.columns.get(column_name), SQLSERVER_MAX_PRECISION)
+            record.addColumnMetadata(x, column_name, nvarchar, precision, 0)
+            bulk_copy.addColumnMapping(x, column_name)
+        bulk_copy.writeToServer(record)
+        bulk_copy.close()
+        return n_rows
+
+    def _load_data_mysql(self, keys: list) -> int:
+        stream = self._stream_buffer(self._tsv_value, '\t')
+        statement = self.jdbc.connection.jconn.createStatement()
+        mysql_statement = None
+        for class_name in ['com.mysql.cj.jdbc.JdbcStatement', 'com.mysql.jdbc.Statement']:
+            # noinspection PyBroadException
+            try:
+                mysql_statement = statement.unwrap(java_class(class_name))
+                break
+            except Exception:
+                pass
+        if mysql_statement is None:
+            raise LookupError('MySQL statement class not found in the driver.')
+        mysql_statement.setLocalInfileInputStream(stream)
+        sql = ("LOAD DATA LOCAL INFILE 'lwetl.tsv' INTO TABLE {} CHARACTER SET utf8mb4 "
+               "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({})").format(
+            self.table, ','.join(self.escape_column_names(keys)))
+        n_rows = int(mysql_statement.executeUpdate(sql))
+        statement.close()
+        return n_rows
+
+    def _send_inserts(self, keys: list):
+        if self.bulk_loader is None:
+            if (self.database_type == 'oracle') and self.direct_path and (self.commit_mode == UPLOAD_MODE_COMMIT) \
+                    and (not self.bisect):
+                # a direct-path insert must be committed before the table is accessed again
+                if self.direct_path_pending:
+                    raise SQLExecuteException('Direct-path insert into {} not committed: call commit() after '
+                                              'each batch.'.format(self.table))
+                sql = 'INSERT /*+ APPEND_VALUES */ INTO {0} ({1}) VALUES ({2})'.format(
+                    self.table, ','.join(self.escape_column_names(keys)), ','.join(['?'] * len(keys)))
+                self._insert_or_update(sql, self.data_buffer)
+                self.direct_path_pending = True
+            else:
+                super(BulkUploader, self)._send_inserts(keys)
+            return
+
+        n_rows = len(self.data_buffer)
+        exec_error = None
+        with self.jdbc.statistics as stt:
+            stt.add_exec_count(n_rows)
+            try:
+                n = self.bulk_loader(keys)
+            except Exception as error:
+                exec_error = error
+                n = 0
+        if exec_error is not None:
+            if self.bisecting:
+                raise SQLExecuteException(str(exec_error).strip())
+            LOGGER.error(exec_error)
+            if self.exit_on_fail:
+                self.has_sql_errors = True
+                raise SQLExecuteException('Bulk insert failed: ' + str(exec_error))
+        self.total_row_count += n
+        if self.fstream is not None:
+            print('BULK INSERT {}: {} rows;'.format(self.table, n), file=self.fstream)
+
+    def commit(self):
+        super(BulkUploader, self).commit()
+        self.direct_path_pending = False
+
+
+class UpsertUploader(MultiParameterUploader):
+    """
+        Upload data into a table with a dialect-specific upsert per batch:
+        - oracle, sqlserver:  MERGE
+        - postgresql, sqlite: INSERT ... ON CONFLICT DO UPDATE
+        - mysql:              INSERT ... ON DUPLICATE KEY UPDATE
+        Rows, which exist in the target table (by key_columns), are updated. Other rows are inserted.
+
+        Keyword arguments:
+        - key_columns:    (required) a (comma-separated) string or a list of the key columns. These must be
+                          specified in each inserted row, and have a unique constraint (for postgresql, sqlite and
+                          mysql).
+        - update_columns: columns to update on existing rows. Defaults to all non-key columns of the row.
+                          Use an empty list to only insert rows, which do not exist yet.
+
+        Only the columns specified for a row are inserted or updated: consecutive rows with the same columns
+        share a statement. Updates and deletes are handled as in the MultiParameterUploader.
+    """
+
+    def __init__(self, jdbc: Jdbc, table: str, fstream=None, commit_mode=UPLOAD_MODE_DRYRUN,
+                 exit_on_fail=True, **kwargs):
+        super(UpsertUploader, self).__init__(jdbc, table, fstream=fstream, commit_mode=commit_mode,
+                                             exit_on_fail=exit_on_fail, **kwargs)
+        self.database_type = kwargs.get('type', jdbc.type)
+        if self.database_type not in ['oracle', 'sqlserver', 'postgresql', 'sqlite', 'mysql']:
+            raise ValueError('Upsert not supported for database type: {}'.format(self.database_type))
+
+        self.key_columns = self._column_list(kwargs.get('key_columns', None))
+        if len(self.key_columns) == 0:
+            raise ValueError('The UpsertUploader requires the key_columns argument.')
+        unknown_columns = [c for c in self.key_columns if c not in self.columns]
+        if len(unknown_columns) > 0:
+            raise ValueError('Key columns not found in {}: {}'.format(table, ', '.join(unknown_columns)))
+
+        update_columns = kwargs.get('update_columns', None)
+        if update_columns is None:
+            self.update_columns = None
+        else:
+            self.update_columns = [c for c in self._column_list(update_columns) if c not in self.key_columns]
+
+        # id of a buffered row -> tuple of the positions of the columns specified for the row
+        self.row_signatures = dict()
+
+    def __enter__(self):
+        return super(UpsertUploader, self).__enter__()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        super(UpsertUploader, self).__exit__(exc_type, exc_val, exc_tb)
+
+    @staticmethod
+    def _column_list(columns) -> list:
+        if columns is None:
+            return []
+        elif isinstance(columns, str):
+            columns = columns.split(',')
+        elif not isinstance(columns, (list, set, tuple)):
+            raise ValueError('Columns must be specified as a string, tuple or list')
+        return [c.strip().upper() for c in columns if len(c.strip()) > 0]
+
+    def insert(self, data: dict):
+        """
+        Insert or update a row. Columns with an empty value are set to NULL
+        @param data: dict of values, keys are the column name. Non-existing column names are ignored.
+        """
+        dd, null_list = self._filter_data(data, True)
+        missing_keys = [k for k in self.key_columns if (k not in dd) and (k not in self.counters)]
+        if len(missing_keys) > 0:
+            raise ValueError('Key columns not specified for upsert: ' + ', '.join(missing_keys))
+
+        self._switch_operation('insert')
+        row = [None] * len(self.used_keys)
+        for column_name, value in dd.items():
+            self._set_value(row, column_name, self._convert(column_name, value))
+            self.buffer_size += estimate_size(value)
+        for column_name in null_list:
+            self._set_value(row, column_name, None)
+        for column_name in [k for k in self.counters if k not in dd]:
+            self._set_value(row, column_name, self.counters[column_name].next_key())
+            self.buffer_size += 8
+        self.row_signatures[id(row)] = tuple(sorted([self.used_keys[c] for c in list(dd.keys()) + null_list] +
+                                                    [self.used_keys[k] for k in self.counters if k not in dd]))
+        self.data_buffer.append(row)
+        self.row_count += 1
+        if self._buffer_is_full():
+            self.flush()
+
+    def insert_row(self, columns: tuple, values: tuple):
+        """
+        Insert or update a row of positional values. None values are set to NULL
+        """
+        self._switch_operation('insert')
+        positions = self._row_positions(columns)
+        row = [None] * len(self.used_keys)
+        for position, column_name, value in zip(positions, columns, values):
+            if value is not None:
+                row[position] = self._convert(column_name, value)
+                self.buffer_size += estimate_size(value)
+        counters = [k for k in self.counters if k not in columns]
+        for column_name in counters:
+            self._set_value(row, column_name, self.counters[column_name].next_key())
+            self.buffer_size += 8
+        self.row_signatures[id(row)] = tuple(sorted(positions + [self.used_keys[k] for k in counters]))
+        self.data_buffer.append(row)
+        self.row_count += 1
+        if self._buffer_is_full():
+            self.flush()
+
+    def _clear_buffer(self):
+        super(UpsertUploader, self)._clear_buffer()
+        self.row_signatures = dict()
+
+    def _row_positions(self, columns: tuple) -> list:
+        if (self.row_positions is None) or (self.row_positions[0] != columns):
+            missing_keys = [k for k in self.key_columns if (k not in columns) and (k not in self.counters)]
+            if len(missing_keys) > 0:
+                raise ValueError('Key columns not specified for upsert: ' + ', '.join(missing_keys))
+        return super(UpsertUploader, self)._row_positions(columns)
+
+    def upsert_statement(self, keys: list) -> str:
+        """
+        Generate the parameterized upsert statement
+        @param keys: list - names of the columns of each parameter row
+        @return: str - the sql
+        """
+        if self.update_columns is None:
+            update_columns = [c for c in keys if c not in self.key_columns]
+        else:
+            update_columns = [c for c in self.update_columns if c in keys]
+
+        columns = self.escape_column_names(keys)
+        e_keys = self.escape_column_names(self.key_columns)
+        e_update = self.escape_column_names(update_columns)
+        parameters = ','.join(['?'] * len(keys))
+
+        if self.database_type in ['oracle', 'sqlserver']:
+            if self.database_type == 'oracle':
+                source = '(SELECT {} FROM dual) src'.format(','.join(['? AS ' + c for c in columns]))
+            else:
+                source = '(VALUES ({})) AS src ({})'.format(parameters, ','.join(columns))
+            sql = 'MERGE INTO {} trg USING {} ON ({})'.format(
+                self.table, source, ' AND '.join(['trg.{0} = src.{0}'.format(c) for c in e_keys]))
+            if len(e_update) > 0:
+                sql += ' WHEN MATCHED THEN UPDATE SET {}'.format(
+                    ', '.join(['trg.{0} = src.{0}'.format(c) for c in e_update]))
+            sql += ' WHEN NOT MATCHED THEN INSERT ({}) VALUES ({})'.format(
+                ','.join(columns), ','.join(['src.' + c for c in columns]))
+            if self.database_type == 'sqlserver':
+                sql += ';'
+        else:
+            sql = 'INSERT INTO {} ({}) VALUES ({})'.format(self.table, ','.join(columns), parameters)
+            if self.database_type == 'mysql':
+                if len(e_update) == 0:
+                    # no-op update
+                    e_update = e_keys[:1]
+                sql += ' ON DUPLICATE KEY UPDATE {}'.format(
+                    ', '.join(['{0} = VALUES({0})'.format(c) for c in e_update]))
+            elif len(e_update) == 0:
+                sql += ' ON CONFLICT ({}) DO NOTHING'.format(','.join(e_keys))
+            else:
+                sql += ' ON CONFLICT ({}) DO UPDATE SET {}'.format(
+                    ','.join(e_keys), ', '.join(['{0} = EXCLUDED.{0}'.format(c) for c in e_update]))
+        return sql
+
+    def _send_inserts(self, keys: list):
+        """
+        Send the buffered rows with one statement per run of rows with the same columns. Columns, which are
+        not specified for a row, are not set to NULL on an existing row
+        """
+        all_positions = tuple(range(len(keys)))
+        run_signature, run_rows = None, []
+        for row in self.data_buffer:
+            signature = self.row_signatures.get(id(row), all_positions)
+            if (signature != run_signature) and (len(run_rows) > 0):
+                self._send_upserts(keys, run_signature, run_rows)
+                run_rows = []
+            run_signature = signature
+            run_rows.append(row)
+        if len(run_rows) > 0:
+            self._send_upserts(keys, run_signature, run_rows)
+
+    def _send_upserts(self, keys: list, positions: tuple, rows: list):
+        if len(positions) == len(keys):
+            parameters = rows
+        else:
+            parameters = [[row[p] for p in positions] for row in rows]
+        self._insert_or_update(self.upsert_statement([keys[p] for p in positions]), parameters,
+                               strip_semi_colon=False)
+
+
+class WriteBehindUploader:
+    """
+        Wrapper, which sends the operations of an uploader from a dedicated writer thread.
+
+        insert(), update(), delete(), and commit() only add the operation to a bounded queue. The writer thread
+        executes the operations in order on the wrapped uploader, so the preparation of the next rows overlaps
+        with the database I/O of the previous ones. The caller blocks only if the queue is full.
+
+        An exception in the writer thread (e.g., an SQLExecuteException if exit_on_fail is set, or a
+        CommitException) stops the processing of the queue. It is raised in the caller thread on the next call,
+        or on exit of the with-block. All later operations, including commits, are skipped, and the transaction
+        is rolled back on exit. Without exit_on_fail, failed statements are logged and skipped as usual.
+
+        The Jdbc connection of the wrapped uploader must not be used by other threads while the writer is active.
+    """
+
+    def __init__(self, uploader: Uploader, chunk_size: int = DEFAULT_WRITE_BEHIND_CHUNK_SIZE,
+                 queue_size: int = DEFAULT_WRITE_BEHIND_QUEUE_SIZE):
+        """
+        @param uploader: Uploader - the uploader to wrap
+        @param chunk_size: int - number of operations passed to the writer thread at once
+        @param queue_size: int - maximum number of chunks waiting for the writer thread
+        """
+        if uploader.commit_mode == UPLOAD_MODE_PIPE:
+            msg = "Commit mode '{}' not allowed for this class.".format(uploader.commit_mode)
+            raise ValueError(msg)
+        self.uploader = uploader
+        self.chunk_size = max(1, chunk_size)
+        self.queue = Queue(maxsize=max(1, queue_size))
+        self.pending = []
+        self.writer = None
+        # the exception of the writer thread, until it is raised in the caller thread
+        self.error = None
+        # set on an exception in the writer thread: the remaining operations are skipped
+        self.failed = False
+
+        # rows queued since the last commit, and in total
+        self.row_count = 0
+        self.total_row_count = 0
+
+    def __enter__(self):
+        self.uploader.__enter__()
+        self.pending = []
+        self.error = None
+        self.failed = False
+        self.row_count = 0
+        self.writer = threading.Thread(target=self._write, name='write-behind ' + self.uploader.table, daemon=True)
+        self.writer.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.writer is not None:
+            self._enqueue('__exit__', exc_type, exc_val, exc_tb)
+            self._put()
+            self.queue.put(None)
+            self.writer.join()
+            self.writer = None
+        if self.failed:
+            error = self.error
+            self.error = None
+            # the writer skipped the exit of the uploader: roll back the transaction
+            self.uploader.has_sql_errors = True
+            try:
+                if error is None:
+                    self.uploader.__exit__(exc_type, exc_val, exc_tb)
+                else:
+                    self.uploader.__exit__(type(error), error, None)
+            except Exception as exit_error:
+                LOGGER.error(exit_error)
+            if self.uploader.commit_mode in [UPLOAD_MODE_COMMIT, UPLOAD_MODE_ROLLBACK]:
+                self.uploader.jdbc.rollback()
+            if (error is not None) and (exc_type is None):
+                raise error
+
+    def _write(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                self.queue.task_done()
+                break
+            if not self.failed:
+                try:
+                    for method, args in chunk:
+                        getattr(self.uploader, method)(*args)
+                except Exception as write_error:
+                    LOGGER.error(write_error)
+                    # discard the remaining operations, but keep on draining the queue
+                    self.error = write_error
+                    self.failed = True
+            self.queue.task_done()
+
+    def _check(self):
+        if self.writer is None:
+            raise RuntimeError('{} must be used in a with-block.'.format(type(self).__name__))
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def _put(self):
+        if len(self.pending) > 0:
+            self.queue.put(self.pending)
+            self.pending = []
+
+    def _enqueue(self, method: str, *args):
+        self.pending.append((method, args))
+        if len(self.pending) >= self.chunk_size:
+            self._put()
+
+    def insert(self, data: dict):
+        """
+        Queue an insert, see the wrapped uploader. The data is copied.
+        """
+        self._check()
+        self._enqueue('insert', dict(data))
+        self.row_count += 1
+        self.total_row_count += 1
+
+    def insert_row(self, columns: tuple, values: tuple):
+        """
+        Queue an insert of a row of positional values, see the wrapped uploader.
+        """
+        self._check()
+        self._enqueue('insert_row', tuple(columns), tuple(values))
+        self.row_count += 1
+        self.total_row_count += 1
+
+    def update(self, data: dict, where_clause):
+        """
+        Queue an update, see the wrapped uploader. The data is copied.
+        """
+        self._check()
+        self._enqueue('update', dict(data), copy.copy(where_clause))
+        self.row_count += 1
+        self.total_row_count += 1
+
+    def delete(self, where_clause):
+        """
+        Queue a delete, see the wrapped uploader.
+        """
+        self._check()
+        self._enqueue('delete', copy.copy(where_clause))
+        self.row_count += 1
+        self.total_row_count += 1
+
+    def add_counter(self, columns: (str, list, set, tuple), allocator: KeyAllocator = None):
+        """
+        Mark columns as counters, see the wrapped uploader. Call before the first insert.
+        """
+        self.uploader.add_counter(columns, allocator)
+
+    def commit(self):
+        """
+        Queue a commit. Does not wait for the writer thread.
+        """
+        self._check()
+        self._enqueue('commit')
+        self._put()
+        self.row_count = 0
+
+    def join(self):
+        """
+        Wait until the writer thread has processed all queued operations
+        @raise: the exception of the writer thread, if any
+        """
+        self._check()
+        self._put()
+        self.queue.join()
+        self._check()
@@ -3,10 +3,12 @@
 """
 
 import re
-from datetime import datetime
-from dateutil.parser import parse as dt_parse
+from datetime import date, datetime
+from decimal import Decimal
 from base64 import urlsafe_b64encode, urlsafe_b64decode
 
+from .temporal import parse_datetime
+
 # regex filters
 # set to max of 23 numbers not to conflict with a mongo id
 RE_IS_NUMBER = re.compile(r'^\d{1,23}(\.\d*)*$')
@@ -44,15 +46,49 @@ def string2date(str_value: str) -> datetime:
     """
     if not isinstance(str_value, str):
         raise ValueError('Invalid argument type in string2date(). Must be a string.')
-    if RE_IS_DATE_TIME.match(str_value):
-        return dt_parse(str_value)
-    elif RE_IS_DATE.match(str_value):
-        return datetime.strptime(str_value[:10], '%Y-%m-%d')
+    if RE_IS_DATE_TIME.match(str_value) or RE_IS_DATE.match(str_value):
+        return parse_datetime(str_value)
     else:
         msg = 'Invalid time format. Must be yyyy-mm-dd HH:MMM:SS. Found: ({})'.format(str_value)
         raise ValueError(msg)
 
 
+def value_to_json(value) -> dict:
+    """
+    Convert a (key or watermark) value into a JSON serializable dictionary, which preserves the type
+    @param value: None, int, float, str, Decimal, date, or datetime
+    @return: dict with the type and the value
+    """
+    if isinstance(value, datetime):
+        return {'type': 'datetime', 'value': value.isoformat()}
+    elif isinstance(value, date):
+        return {'type': 'date', 'value': value.isoformat()}
+    elif isinstance(value, Decimal):
+        return {'type': 'decimal', 'value': str(value)}
+    else:
+        return {'type': type(value).__name__, 'value': value}
+
+
+def json_to_value(encoded: dict):
+    """
+    Convert the output of value_to_json() back into the value
+    @param encoded: dict with the type and the value
+    @return: the value
+    """
+    value = encoded.get('value')
+    value_type = encoded.get('type')
+    if value is None:
+        return None
+    elif value_type == 'datetime':
+        return datetime.fromisoformat(value)
+    elif value_type == 'date':
+        return date.fromisoformat(value)
+    elif value_type == 'decimal':
+        return Decimal(value)
+    else:
+        return value
+
+
 def encode(key, clear):
     enc = []
     for i in range(len(clear)):
@@ -345,3 +345,21 @@ def test_formatters(jdbc: lwetl.Jdbc):
             formatter = formatters[ext]()
             print("\n\nTesting (2): " + type(formatter).__name__)
             formatter(**kwargs)
+
+
+def test_multi_update(jdbc: lwetl.Jdbc):
+    print('\nRunning batched update test: ({},{})'.format(jdbc.login, jdbc.type))
+    table = 'LWETL_PRODUCT'
+    ids = [r[0] for r in jdbc.query('SELECT ID FROM {0} ORDER BY ID'.format(table))]
+    missing_id = (max(ids) if len(ids) > 0 else 0) + 1000
+
+    with lwetl.MultiParameterUploader(jdbc, table, commit_mode=lwetl.UPLOAD_MODE_ROLLBACK, batch_size=2) as upl:
+        for id_pk in ids:
+            upl.update({'PRICE': 1.0}, {'ID': id_pk})
+        upl.update({'PRICE': 1.0}, {'ID': missing_id})
+        upl.commit()
+        missing_rows = upl.pop_missing_rows()
+    print('Missing rows: {}'.format(missing_rows))
+    if jdbc.type != 'oracle':
+        # oracle does not report row counts of batches
+        assert missing_rows == [{'ID': missing_id}]
@@ -0,0 +1,59 @@
+"""
+    Tests of the AdaptiveController
+"""
+from datetime import datetime, timedelta
+
+from lwetl import AdaptiveController
+from lwetl.adaptive import is_lock_error
+
+
+def test_hill_climb():
+    controller = AdaptiveController(batch_size=100, step=2.0)
+    # throughput improves: keep growing
+    controller.record_flush(100, 0, 1.0)
+    assert controller.batch_size == 200
+    controller.record_flush(200, 0, 1.0)
+    assert controller.batch_size == 400
+    # throughput degrades: reverse
+    controller.record_flush(400, 0, 4.0)
+    assert controller.batch_size == 200
+    assert controller.direction == -1
+    # no significant change: prefer larger batches
+    controller.record_flush(200, 0, 2.0)
+    assert controller.batch_size == 400
+
+
+def test_partial_flush_ignored():
+    controller = AdaptiveController(batch_size=100, step=2.0)
+    controller.record_flush(10, 0, 1.0, partial=True)
+    assert controller.batch_size == 100
+    assert controller.total_rows == 10
+
+
+def test_back_off():
+    controller = AdaptiveController(batch_size=1000, min_batch_size=300)
+    controller.record_flush(1000, 0, 1.0, error=Exception('ORA-00001: unique constraint violated'))
+    assert controller.batch_size == 500
+    controller.record_flush(500, 0, 1.0, error=Exception('failed'))
+    assert controller.batch_size == 300
+    assert controller.error_count == 2
+
+    controller = AdaptiveController(batch_size=1000)
+    controller.record_error(Exception('constraint violated'))
+    assert controller.batch_size == 1000
+    controller.record_error(Exception('Deadlock found when trying to get lock'))
+    assert controller.batch_size == 500
+    assert is_lock_error('ORA-00060: deadlock detected')
+
+
+def test_commit_is_due():
+    controller = AdaptiveController(batch_size=100, batches_per_commit=10, commit_seconds=10.0,
+                                    commit_bytes=1000)
+    assert not controller.commit_is_due(0)
+    assert not controller.commit_is_due(999, 10)
+    assert controller.commit_is_due(1000)
+    assert controller.commit_is_due(1, 1000)
+    controller.last_commit = datetime.now() - timedelta(seconds=11)
+    assert controller.commit_is_due(1)
+    controller.record_commit()
+    assert not controller.commit_is_due(1)
@@ -0,0 +1,274 @@
+"""
+    Tests of the db-copy components without a database connection
+"""
+import pytest
+import re
+import zlib
+
+from argparse import Namespace
+
+from lwetl import AdaptiveController, SQLExecuteException
+from lwetl.programs.db_copy.checksum import ChecksumSync, row_hash
+from lwetl.programs.db_copy.main import commit_is_due
+from lwetl.programs.db_copy.merge_join import MergeJoin, KeyLookup, KeyOrderError
+from lwetl.programs.db_copy.staging import StagingTable, SourceTable
+
+
+class RowCountUploader:
+    def __init__(self, row_count: int, controller: AdaptiveController = None):
+        self.row_count = row_count
+        self.uncommitted_bytes = 0
+        self.controller = controller
+
+    def commit_is_due(self) -> bool:
+        return self.controller.commit_is_due(self.row_count, self.uncommitted_bytes)
+
+
+def test_commit_is_due():
+    args = Namespace(adaptive=True, commit_nr=50)
+    # single and native drivers have no controller: commit on the row count
+    assert commit_is_due(RowCountUploader(50), args)
+    assert not commit_is_due(RowCountUploader(49), args)
+    controller = AdaptiveController(batch_size=100, batches_per_commit=10)
+    assert not commit_is_due(RowCountUploader(50, controller), args)
+    assert commit_is_due(RowCountUploader(1000, controller), args)
+
+
+class KeyTable:
+    """
+    Target table stand-in for the MergeJoin: returns the chunks of the ordered keys after the last key
+    """
+
+    def __init__(self, keys: list, n_key_columns: int = 1, descending: bool = False):
+        self.type = 'postgresql'
+        self.always_escape = False
+        self.rows = sorted(keys, reverse=descending)
+        self.n = n_key_columns
+        self.descending = descending
+        self.queries = 0
+
+    def query(self, sql, parameters=None):
+        self.queries += 1
+        limit = re.search(r'LIMIT (\d+)$', sql)
+        if limit is None:
+            # KeyLookup: all rows, in any order
+            return iter(reversed(self.rows))
+        chunk_size = int(limit.group(1))
+        rows = self.rows
+        if parameters:
+            last = tuple(parameters[-self.n:])
+            rows = [r for r in rows if (r[:self.n] < last if self.descending else r[:self.n] > last)]
+        return iter(rows[:chunk_size])
+
+
+def test_merge_join_ascending():
+    target = KeyTable([(k,) for k in [1, 2, 4, 5, 7, 9, 10]])
+    merge = MergeJoin(target, 'T', 'ID', chunk_size=3, collect_obsolete=True)
+    assert [merge.exists(k) for k in [2, 3, 4, 8, 9]] == [True, False, True, False, True]
+    assert merge.finish() == [(1,), (5,), (7,), (10,)]
+    assert (merge.existing_count, merge.obsolete_count) == (3, 4)
+    assert target.queries == 3
+
+
+def test_merge_join_descending():
+    target = KeyTable([(k,) for k in [1, 2, 4, 5]], descending=True)
+    merge = MergeJoin(target, 'T', ['ID'], descending=True, chunk_size=2, collect_obsolete=True)
+    assert [merge.exists(k) for k in [6, 4, 3, 1]] == [False, True, False, True]
+    assert merge.finish() == [(5,), (2,)]
+
+
+def test_merge_join_composite_key():
+    target = KeyTable([(1, 'a'), (1, 'c'), (2, 'a'), (3, 'b')], n_key_columns=2)
+    merge = MergeJoin(target, 'T', ['ID', 'CODE'], chunk_size=2, collect_obsolete=True)
+    assert merge.exists((1, 'b')) is False
+    assert merge.exists((1, 'c')) is True
+    assert merge.exists((3, 'b')) is True
+    assert merge.finish() == [(1, 'a'), (2, 'a')]
+
+
+def test_merge_join_values():
+    target = KeyTable([(1, 'x', 10), (3, 'y', 30)])
+    merge = MergeJoin(target, 'T', 'ID', value_columns=['NAME', 'PRICE'])
+    assert merge.exists(1) and (merge.values == ('x', 10))
+    assert (not merge.exists(2)) and (merge.values is None)
+    assert merge.exists(3) and (merge.values == ('y', 30))
+
+
+def test_merge_join_key_order():
+    merge = MergeJoin(KeyTable([(1,), (2,)]), 'T', 'ID')
+    merge.exists(2)
+    with pytest.raises(KeyOrderError):
+        merge.exists(1)
+    # a case-insensitive collation may return the target keys out of order
+    target = KeyTable([('B',), ('a',)])
+    target.rows = [('b',), ('A',)]
+    with pytest.raises(KeyOrderError):
+        MergeJoin(target, 'T', 'ID').exists('c')
+
+
+def test_merge_join_obsolete_stream():
+    chunks = []
+    target = KeyTable([(k,) for k in range(20)])
+    merge = MergeJoin(target, 'T', 'ID', chunk_size=7, collect_obsolete=True, on_obsolete=chunks.append,
+                      obsolete_chunk_size=4)
+    for k in [5, 15]:
+        merge.exists(k)
+    assert merge.finish() == []
+    assert [len(c) for c in chunks] == [4, 4, 4, 4, 2]
+    assert merge.obsolete_count == 18
+    # only counted if not collected
+    merge = MergeJoin(KeyTable([(k,) for k in range(20)]), 'T', 'ID')
+    merge.exists(10)
+    assert (merge.finish(), merge.obsolete_count) == ([], 19)
+
+
+def test_key_lookup():
+    chunks = []
+    target = KeyTable([('b', 1), ('A', 2), ('c', 3), ('D', 4), ('e', 5)])
+    lookup = KeyLookup(target, 'T', 'ID', value_columns=['V'], collect_obsolete=True, on_obsolete=chunks.append,
+                       obsolete_chunk_size=2)
+    # any order of the source keys
+    assert lookup.exists('c') and (lookup.values == (3,))
+    assert (not lookup.exists('a')) and (lookup.values is None)
+    assert lookup.exists('A') and lookup.exists('b')
+    assert lookup.finish() == []
+    assert sorted([k for c in chunks for k in c]) == [('D',), ('e',)]
+    assert (lookup.existing_count, lookup.obsolete_count, lookup.queries) == (3, 2, 1)
+
+
+class HashTable:
+    """
+    Source or target table stand-in for the ChecksumSync: rows are hashed with the python hash of the values,
+    and keys with the CRC32 of their text
+    """
+
+    def __init__(self, rows: dict):
+        self.type = 'postgresql'
+        self.rows = rows
+        self.queries = []
+
+    def _select(self, sql: str, parameters: list) -> list:
+        parameters = list(parameters or [])
+        low = parameters.pop(0) if '> ?' in sql else None
+        high = parameters.pop(0) if '<= ?' in sql else None
+        keys = [k for k in sorted(self.rows) if ((low is None) or (k > low)) and ((high is None) or (k <= high))]
+        bucket = re.search(r'ABS\(MOD\(hashtext\(CAST\(ID AS text\)\), (\d+)\)\) = \?', sql)
+        if bucket is not None:
+            n, remainder = int(bucket.group(1)), parameters.pop(0)
+            keys = [k for k in keys if zlib.crc32(str(k).encode()) % n == remainder]
+        return keys
+
+    def query(self, sql: str, parameters: list = None):
+        self.queries.append(sql)
+        if 'NTILE' in sql:
+            raise SQLExecuteException('NTILE not supported.')
+        return [(k, hash(self.rows[k])) for k in self._select(sql, parameters)]
+
+    def query_single(self, sql: str, parameters: list = None):
+        keys = self._select(sql, parameters)
+        if sql.startswith('SELECT MIN'):
+            return (keys[0], keys[-1]) if keys else (None, None)
+        return len(keys), hash(tuple([(k, self.rows[k]) for k in keys]))
+
+    def rollback(self):
+        pass
+
+
+def test_row_hash_null_safe():
+    # the columns are prefixed with their length: NULL, '' and separators in values give different hashes
+    assert row_hash('mysql', ['A', 'B']) == \
+        "CRC32(CONCAT(COALESCE(CONCAT(CHAR_LENGTH(CAST(A AS CHAR)), ':', CAST(A AS CHAR)), '-'), " \
+        "COALESCE(CONCAT(CHAR_LENGTH(CAST(B AS CHAR)), ':', CAST(B AS CHAR)), '-')))"
+    assert row_hash('oracle', ['A']) == "ORA_HASH(NVL2(A, LENGTH(TO_CHAR(A)) || ':' || TO_CHAR(A), '-'))"
+    assert row_hash('postgresql', ['A', 'B']) == 'md5(CAST(ROW(A, B) AS text))'
+
+
+def test_checksum_equal():
+    rows = dict([(k, 'v{}'.format(k)) for k in range(1, 101)])
+    sync = ChecksumSync(HashTable(rows), HashTable(dict(rows)), 'T', 'ID', ['ID', 'V'], fanout=4, leaf_size=10)
+    assert list(sync.compare()) == []
+    assert sync.ranges_compared == 1
+    assert sync.rows_compared == 0
+
+
+def test_checksum_recursion():
+    rows = dict([(k, 'v{}'.format(k)) for k in range(1, 101)])
+    target_rows = dict(rows)
+    target_rows[17] = 'changed'
+    del target_rows[55]
+    target_rows[200] = 'obsolete'
+    source, target = HashTable(rows), HashTable(target_rows)
+    sync = ChecksumSync(source, target, 'T', 'ID', ['ID', 'V'], fanout=4, leaf_size=10)
+    differences = list(sync.compare())
+    assert sorted([k for _, missing, _, _ in differences for k in missing]) == [55]
+    assert sorted([k for _, _, changed, _ in differences for k in changed]) == [17]
+    assert sorted([k for _, _, _, obsolete in differences for k in obsolete]) == [200]
+    # only the leaf ranges with differences compare the rows
+    assert sync.rows_compared < len(rows)
+    assert sync.ranges_differing < sync.ranges_compared
+    # keys beyond the last boundary are in the open-ended range
+    assert differences[-1][0][1] is None
+
+
+def test_checksum_buckets():
+    # keys, which are not numeric, without NTILE: no key boundaries
+    rows = dict([('K{:03}'.format(k), 'v{}'.format(k)) for k in range(1, 101)])
+    target_rows = dict(rows)
+    target_rows['K017'] = 'changed'
+    del target_rows['K055']
+    target_rows['K200'] = 'obsolete'
+    source, target = HashTable(rows), HashTable(target_rows)
+    sync = ChecksumSync(source, target, 'T', 'ID', ['ID', 'V'], fanout=4, leaf_size=10)
+    differences = list(sync.compare())
+    assert sorted([k for _, missing, _, _ in differences for k in missing]) == ['K055']
+    assert sorted([k for _, _, changed, _ in differences for k in changed]) == ['K017']
+    assert sorted([k for _, _, _, obsolete in differences for k in obsolete]) == ['K200']
+    # the buckets are compared in the database: not all rows are loaded
+    assert sync.rows_compared < len(rows)
+    assert any(['hashtext' in sql for sql in source.queries])
+
+
+class StatementJdbc:
+    """
+    Target database stand-in, which records the executed statements
+    """
+
+    def __init__(self, db_type: str = 'oracle'):
+        self.type = db_type
+        self.always_escape = False
+        self.statements = []
+        self.commits = 0
+
+    def execute(self, sql: str, parameters: list = None, cursor=None):
+        self.statements.append(sql)
+        return Namespace(rowcount=1)
+
+    def close(self, cursor):
+        pass
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+def test_staging_index():
+    jdbc = StatementJdbc()
+    staging = StagingTable(jdbc, 'A_TABLE_WITH_A_VERY_LONG_NAME', 'ID')
+    assert staging.name == 'LWS_A_TABLE_WITH_A_VERY_LONG_N'
+    staging.create_index()
+    assert jdbc.statements == ['CREATE INDEX LWS_A_TABLE_WITH_A_VERY_LON_IX ON LWS_A_TABLE_WITH_A_VERY_LONG_N (ID)']
+    assert jdbc.commits == 1
+
+
+def test_source_table_reconcile():
+    jdbc = StatementJdbc('postgresql')
+    source = SourceTable(jdbc, 'T', 'ID', 'SRC.T')
+    assert not hasattr(source, 'create') and not hasattr(source, 'drop')
+    counts = source.reconcile(['ID', 'V'], update=True, delete=True)
+    assert list(counts.items()) == [('delete', 1), ('update', 1), ('insert', 1)]
+    assert jdbc.statements == [
+        'DELETE FROM T WHERE NOT EXISTS (SELECT 1 FROM SRC.T s WHERE s.ID = T.ID)',
+        'UPDATE T trg SET V = s.V FROM SRC.T s WHERE trg.ID = s.ID',
+        'INSERT INTO T (ID, V) SELECT ID, V FROM SRC.T s WHERE NOT EXISTS (SELECT 1 FROM T trg WHERE trg.ID = s.ID)']
@@ -0,0 +1,84 @@
+"""
+    Tests of the incremental extraction without a database connection
+"""
+import json
+import os
+
+from collections import OrderedDict
+
+from lwetl import Jdbc, IncrementalExtractor
+
+
+class RowsJdbc(Jdbc):
+    """
+    Connection stand-in, which returns the rows of a table with a watermark above the parameter
+    """
+
+    # noinspection PyMissingConstructor
+    def __init__(self, rows: list):
+        self.connection = None
+        self.rows = rows
+        self.executed = []
+
+    def execute(self, sql: str, parameters=None, cursor=None):
+        self.executed.append((sql, parameters))
+        low = parameters[0] if parameters else None
+        return [r for r in self.rows if (low is None) or (r[0] > low)]
+
+    def get_data(self, cursor, return_type=tuple, include_none=False, array_size=1):
+        for row in cursor:
+            yield OrderedDict(zip(['ID', 'SEQ', 'V'], [row[1], row[0], row[2]]))
+
+
+def extract(jdbc: Jdbc, state_file: str, overlap: int = 0, save: bool = True) -> (IncrementalExtractor, list):
+    extractor = IncrementalExtractor(jdbc, 'T', 'SEQ', state_file=state_file, overlap=overlap)
+    rows = list(extractor.get_data(extractor.execute()))
+    if save:
+        extractor.save()
+    return extractor, rows
+
+
+def test_incremental_watermark(tmp_path):
+    state_file = str(tmp_path / 'state.json')
+    jdbc = RowsJdbc([(1, 'a', 'x'), (2, 'b', 'x'), (3, 'c', 'x')])
+    extractor, rows = extract(jdbc, state_file)
+    assert [r[0] for r in rows] == ['a', 'b', 'c']
+    assert jdbc.executed[-1] == ('SELECT * FROM T ORDER BY SEQ', None)
+    with open(state_file) as f:
+        assert json.load(f)['t.seq']['table'] == 'T'
+
+    jdbc.rows.append((4, 'd', 'x'))
+    extractor, rows = extract(jdbc, state_file)
+    assert jdbc.executed[-1] == ('SELECT * FROM T WHERE SEQ > ? ORDER BY SEQ', [3])
+    assert [r[0] for r in rows] == ['d']
+    assert extractor.watermark == 4
+
+
+def test_incremental_overlap(tmp_path):
+    state_file = str(tmp_path / 'state.json')
+    jdbc = RowsJdbc([(1, 'a', 'x'), (2, 'b', 'x'), (3, 'c', 'x')])
+    extract(jdbc, state_file, overlap=2)
+
+    # a late commit below the watermark, and a new row: the unchanged rows of the window are skipped
+    jdbc.rows = [(1, 'a', 'x'), (2, 'b', 'x'), (2, 'e', 'x'), (3, 'c', 'x'), (4, 'd', 'x')]
+    extractor, rows = extract(jdbc, state_file, overlap=2)
+    assert jdbc.executed[-1][1] == [1]
+    assert [r[0] for r in rows] == ['e', 'd']
+    assert extractor.skip_count == 2
+    assert extractor.row_count == 2
+
+    # a changed row of the window has a new fingerprint
+    jdbc.rows = [(3, 'c', 'y'), (4, 'd', 'x')]
+    extractor, rows = extract(jdbc, state_file, overlap=2)
+    assert [tuple(r) for r in rows] == [('c', 3, 'y')]
+
+
+def test_incremental_not_saved(tmp_path):
+    state_file = str(tmp_path / 'state.json')
+    jdbc = RowsJdbc([(1, 'a', 'x'), (2, 'b', 'x')])
+    extract(jdbc, state_file, save=False)
+    assert not os.path.isfile(state_file)
+    # a run without save() is repeated in full
+    extractor, rows = extract(jdbc, state_file)
+    assert len(rows) == 2
+    assert extractor.watermark == 2
@@ -0,0 +1,57 @@
+"""
+    Tests of the checkpoint journal of db-copy
+"""
+import os
+import pytest
+
+from datetime import datetime
+
+from lwetl.programs.db_copy.journal import CopyJournal, login_identity
+
+
+def test_login_identity():
+    assert login_identity('scott/tiger@orcl') == 'scott@orcl'
+    assert login_identity('scott@orcl') == 'scott@orcl'
+    assert login_identity('scott_ora') == 'scott_ora'
+
+
+def test_journal_resume(tmp_path):
+    file_name = str(tmp_path / 'journal.json')
+    journal = CopyJournal(file_name, 'scott/tiger@orcl', 'scott_pg')
+    journal.finish('CUSTOMER', (10, 0))
+    journal.checkpoint('ORDERS', 500, 500)
+    journal.checkpoint('HISTORY', datetime(2024, 2, 29, 13, 45), 100)
+
+    # the password is not part of the identity
+    resumed = CopyJournal(file_name, 'scott/other@orcl', 'scott_pg', resume=True)
+    assert resumed.is_done('CUSTOMER')
+    assert resumed.counts('CUSTOMER') == (10, 0)
+    assert resumed.last_key('CUSTOMER') is None
+    assert not resumed.is_done('ORDERS')
+    assert resumed.last_key('ORDERS') == 500
+    assert resumed.counts('ORDERS') is None
+    assert resumed.last_key('HISTORY') == datetime(2024, 2, 29, 13, 45)
+    assert resumed.last_key('ITEM') is None
+
+    resumed.finish('ORDERS', (1000, 0))
+    assert resumed.last_key('ORDERS') is None
+    resumed.remove()
+    assert not os.path.isfile(file_name)
+
+
+def test_journal_without_resume(tmp_path):
+    file_name = str(tmp_path / 'journal.json')
+    CopyJournal(file_name, 'scott_ora', 'scott_pg').finish('CUSTOMER', (10, 0))
+    # a new journal starts empty
+    assert not CopyJournal(file_name, 'scott_ora', 'scott_pg').is_done('CUSTOMER')
+    # resume without a journal file
+    assert not CopyJournal(str(tmp_path / 'other.json'), 'scott_ora', 'scott_pg', resume=True).is_done('CUSTOMER')
+
+
+def test_journal_login_mismatch(tmp_path):
+    file_name = str(tmp_path / 'journal.json')
+    CopyJournal(file_name, 'scott_ora', 'scott_pg').finish('CUSTOMER', (10, 0))
+    with pytest.raises(ValueError):
+        CopyJournal(file_name, 'scott_ora', 'scott_mysql', resume=True)
+    with pytest.raises(ValueError):
+        CopyJournal(file_name, 'scott_mysql', 'scott_pg', resume=True)
@@ -0,0 +1,85 @@
+"""
+    Tests of the key allocators without a database connection
+"""
+import itertools
+import pytest
+import re
+
+from lwetl.key_allocator import KeyAllocator, MaxKeyAllocator, SequenceAllocator, sequence_query
+from lwetl.uploader import get_pk_counter, PK_COUNTERS
+
+
+class MaxJdbc:
+    """
+    Connection stand-in, which returns a fixed maximum key, and a range of sequence values
+    """
+
+    def __init__(self, db_type: str = 'sqlserver', max_key: int = 41):
+        self.type = db_type
+        self.login = 'nobody@' + db_type
+        self.max_key = max_key
+        self.next_value = 1
+        self.queries = []
+
+    def get_int(self, sql, parameters=None):
+        self.queries.append(sql)
+        return self.max_key
+
+    def query(self, sql, parameters=None):
+        self.queries.append(sql)
+        n = int(re.search(r'<=? *(\d+)\)?$', sql).group(1))
+        values = [(v,) for v in range(self.next_value, self.next_value + n)]
+        self.next_value += n
+        return iter(values)
+
+
+def test_abstract_allocator():
+    with pytest.raises(TypeError):
+        KeyAllocator()
+
+
+def test_max_key_allocator():
+    allocator = MaxKeyAllocator(MaxJdbc(), 'LWETL_TEST', 'ID', block_size=3)
+    assert [allocator.next_key() for _ in range(5)] == [42, 43, 44, 45, 46]
+    assert allocator.round_trips == 2
+
+
+@pytest.mark.parametrize('n', [1, 9, 10, 11, 100, 250, 1000])
+def test_sequence_query_sqlserver(n):
+    sql = sequence_query('sqlserver', 'LWETL_SEQ', n)
+    assert ('TOP' not in sql) and ('ORDER BY' not in sql)
+    # evaluate the row generator: one row for each number below n
+    digits = len(re.findall(r'D\d\(N\)', sql))
+    assert len([d for d in itertools.product(range(10), repeat=digits)
+                if sum([v * 10 ** x for x, v in enumerate(d)]) < n]) == n
+
+
+def test_sequence_allocator():
+    jdbc = MaxJdbc()
+    allocator = SequenceAllocator(jdbc, 'LWETL_SEQ', block_size=4)
+    assert [allocator.next_key() for _ in range(6)] == [1, 2, 3, 4, 5, 6]
+    assert len(jdbc.queries) == 2
+
+
+def test_pk_counter_shim():
+    jdbc = MaxJdbc(max_key=10)
+    jdbc.login = 'pk_counter_shim'
+    with pytest.deprecated_call():
+        assert get_pk_counter(jdbc, 'LWETL_TEST', 'ID') == 11
+    with pytest.deprecated_call():
+        assert get_pk_counter(jdbc, 'LWETL_TEST', 'ID', increment=2) == 13
+    assert PK_COUNTERS['pk_counter_shim']['LWETL_TEST']['ID'] == 13
+    # no increment: the current value, no key is consumed
+    with pytest.deprecated_call():
+        assert get_pk_counter(jdbc, 'LWETL_TEST', 'ID', increment=0) == 13
+    with pytest.deprecated_call():
+        assert get_pk_counter(jdbc, 'LWETL_TEST', 'ID') == 14
+
+
+def test_max_key_allocator_current():
+    allocator = MaxKeyAllocator(MaxJdbc(), 'LWETL_TEST', 'ID', block_size=3)
+    # before the first key: the maximum of the column
+    assert allocator.current() == 41
+    assert allocator.next_key() == 42
+    assert allocator.current() == 42
+    assert allocator.round_trips == 1
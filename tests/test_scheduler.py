@@ -0,0 +1,77 @@
+"""
+    Tests of the scheduling of parallel table copies in db-copy
+"""
+import threading
+
+from lwetl.programs.db_copy.scheduler import TableScheduler, dependency_graph
+
+# ORDERS -> CUSTOMER, ITEM -> ORDERS, ITEM -> PRODUCT, CUSTOMER -> CUSTOMER, ITEM -> ARCHIVE (not copied)
+TABLE_INFO = {
+    'CUSTOMER': {'PARENT_ID': ('CUSTOMER', 'FK_CUSTOMER_PARENT', 'ID')},
+    'ORDERS': {'CUSTOMER_ID': ('CUSTOMER', 'FK_ORDERS_CUSTOMER', 'ID')},
+    'ITEM': {'ORDER_ID': ('ORDERS', 'FK_ITEM_ORDERS', 'ID'), 'PRODUCT_ID': ('PRODUCT', 'FK_ITEM_PRODUCT', 'ID'),
+             'ARCHIVE_ID': ('ARCHIVE', 'FK_ITEM_ARCHIVE', 'ID')}
+}
+
+TABLES = ['CUSTOMER', 'ITEM', 'ORDERS', 'PRODUCT']
+
+
+def test_dependency_graph():
+    # self references and tables outside the list are ignored
+    assert dependency_graph(TABLES, TABLE_INFO) == {
+        'CUSTOMER': set(),
+        'ITEM': {'ORDERS', 'PRODUCT'},
+        'ORDERS': {'CUSTOMER'},
+        'PRODUCT': set()
+    }
+
+
+def drain(scheduler: TableScheduler) -> list:
+    order = []
+    while True:
+        table = scheduler.next_table()
+        if table is None:
+            return order
+        order.append(table)
+        scheduler.done(table)
+
+
+def test_scheduler_order():
+    weights = {'CUSTOMER': 10, 'ITEM': 1000, 'ORDERS': 100, 'PRODUCT': 50}
+    scheduler = TableScheduler(TABLES, dependency_graph(TABLES, TABLE_INFO), weights)
+    # of the ready tables, the heaviest goes first
+    assert drain(scheduler) == ['PRODUCT', 'CUSTOMER', 'ORDERS', 'ITEM']
+    assert scheduler.finished == set(TABLES)
+
+
+def test_scheduler_cycle():
+    parents = {'A': {'B'}, 'B': {'A'}, 'C': {'A', 'B'}}
+    scheduler = TableScheduler(['A', 'B', 'C'], parents, {'A': 1, 'B': 2})
+    # the tables with the fewest unfinished parents are released
+    assert drain(scheduler) == ['B', 'A', 'C']
+
+
+def test_scheduler_waits_for_parents():
+    scheduler = TableScheduler(['PARENT', 'CHILD'], {'CHILD': {'PARENT'}})
+    assert scheduler.next_table() == 'PARENT'
+    handed_out = []
+    worker = threading.Thread(target=lambda: handed_out.append(scheduler.next_table()))
+    worker.start()
+    worker.join(0.2)
+    # the child waits until its parent is finished
+    assert worker.is_alive() and handed_out == []
+    scheduler.done('PARENT')
+    worker.join(5)
+    assert handed_out == ['CHILD']
+
+
+def test_scheduler_stop():
+    scheduler = TableScheduler(['PARENT', 'CHILD'], {'CHILD': {'PARENT'}})
+    assert scheduler.next_table() == 'PARENT'
+    worker = threading.Thread(target=scheduler.next_table)
+    worker.start()
+    scheduler.stop()
+    worker.join(5)
+    assert not worker.is_alive()
+    assert scheduler.next_table() is None
+    assert scheduler.pending == ['CHILD']
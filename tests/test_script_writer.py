@@ -0,0 +1,90 @@
+"""
+    Tests of the streaming script output
+"""
+import csv
+import gzip
+import io
+import os
+import pytest
+
+from lwetl.script_writer import ScriptWriter, split_script_name
+
+
+@pytest.mark.parametrize('filename, expected', [
+    ('dump.sql', ('dump', '.sql', None)),
+    ('dump.sql.gz', ('dump', '.sql', 'gzip')),
+    ('out/dump.SQL.ZST', ('out/dump', '.SQL', 'zstd')),
+])
+def test_split_script_name(filename, expected):
+    assert split_script_name(filename) == expected
+
+
+def read_index(stem: str) -> list:
+    with open(stem + '.index.csv', newline='') as f:
+        return list(csv.reader(f, delimiter=';'))
+
+
+def test_rotation_by_statements(tmp_path):
+    stem = str(tmp_path / 'dump')
+    with ScriptWriter(stem + '.sql', max_statements=3) as writer:
+        writer.write_statements(['INSERT INTO A VALUES ({})'.format(x) for x in range(4)], 'A')
+        writer.write_statements(['INSERT INTO B VALUES ({})'.format(x) for x in range(3)], 'B')
+    assert [os.path.basename(f) for f in writer.files] == ['dump.0001.sql', 'dump.0002.sql', 'dump.0003.sql']
+    with open(writer.files[1]) as f:
+        assert f.read() == 'INSERT INTO A VALUES (3);\nINSERT INTO B VALUES (0);\nINSERT INTO B VALUES (1);\n'
+    assert read_index(stem) == [
+        ['file', 'table', 'first_statement', 'last_statement', 'statements'],
+        ['dump.0001.sql', 'A', '1', '3', '3'],
+        ['dump.0002.sql', 'A', '4', '4', '1'],
+        ['dump.0002.sql', 'B', '5', '6', '2'],
+        ['dump.0003.sql', 'B', '7', '7', '1']
+    ]
+
+
+def test_rotation_by_bytes(tmp_path):
+    stem = str(tmp_path / 'dump')
+    with ScriptWriter(stem + '.sql.gz', max_bytes=20, index=False) as writer:
+        for x in range(3):
+            writer.write_statement('DELETE FROM A WHERE ID = {}'.format(x), 'A')
+    # each statement exceeds the limit: one file per statement
+    assert writer.file_count == 3
+    assert all([f.endswith('.sql.gz') for f in writer.files])
+    with gzip.open(writer.files[2], 'rt') as f:
+        assert f.read() == 'DELETE FROM A WHERE ID = 2;\n'
+    assert not os.path.isfile(stem + '.index.csv')
+
+
+def test_rotation_by_utf8_bytes(tmp_path):
+    stem = str(tmp_path / 'dump')
+    statement = "SELECT '{}'".format('\u00e9' * 10)
+    with ScriptWriter(stem + '.sql', max_bytes=30, index=False) as writer:
+        for _ in range(3):
+            writer.write_statement(statement, 'T')
+    # 21 characters, but 31 bytes per line: each line exceeds the limit
+    assert writer.file_count == 3
+    assert os.path.getsize(writer.files[0]) == len((statement + ';\n').encode('utf-8'))
+
+
+def test_rotation_append(tmp_path):
+    stem = str(tmp_path / 'dump')
+    for run in range(2):
+        with ScriptWriter(stem + '.sql', max_statements=2, append=run > 0) as writer:
+            writer.write_statements(['SELECT {}'.format(x) for x in range(3)], 'T')
+    # the second run continues after the existing files, and appends to the index
+    assert os.path.basename(writer.files[0]) == 'dump.0003.sql'
+    index = read_index(stem)
+    assert index.count(['file', 'table', 'first_statement', 'last_statement', 'statements']) == 1
+    assert [row[0] for row in index[1:]] == ['dump.0001.sql', 'dump.0002.sql', 'dump.0003.sql', 'dump.0004.sql']
+
+
+def test_stream():
+    stream = io.StringIO()
+    writer = ScriptWriter(stream, max_statements=1, terminator='\nGO')
+    print('-- header', file=writer)
+    writer.write_statement('SELECT 1', 'T')
+    writer.write_statement('SELECT 2', 'T')
+    writer.close()
+    # no rotation and no index on streams
+    assert stream.getvalue() == '-- header\nSELECT 1\nGO\nSELECT 2\nGO\n'
+    assert writer.statement_count == 2
+    assert writer.files == []
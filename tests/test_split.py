@@ -0,0 +1,95 @@
+"""
+    Tests of the key-range partitions of db-copy without a database connection
+"""
+import os
+
+from lwetl import SQLExecuteException
+from lwetl.programs.db_copy.split import SplitCheckpoint, checkpoint_directory, key_boundaries, key_ranges, \
+    range_condition, remove_checkpoints
+
+
+class BoundaryJdbc:
+    """
+    Connection stand-in: returns the NTILE boundaries, or the minimum and maximum of the key without NTILE
+    """
+
+    def __init__(self, tiles: list = None, low=None, high=None):
+        self.tiles = tiles
+        self.low = low
+        self.high = high
+        self.queries = []
+
+    def query(self, sql: str, parameters: list = None):
+        self.queries.append((sql, parameters))
+        if self.tiles is None:
+            raise SQLExecuteException('NTILE not supported.')
+        return [(k,) for k in self.tiles]
+
+    def query_single(self, sql: str, parameters: list = None):
+        self.queries.append((sql, parameters))
+        return self.low, self.high
+
+    def rollback(self):
+        pass
+
+
+def test_key_boundaries_ntile():
+    jdbc = BoundaryJdbc(tiles=[25, 50, 75, 100])
+    # the maximum of the last tile is not a boundary
+    assert key_boundaries(jdbc, 'T', 'ID', 4, 'ID > ?', [0]) == [25, 50, 75]
+    sql, parameters = jdbc.queries[0]
+    assert 'NTILE(4)' in sql and sql.count('WHERE ID > ?') == 1
+    assert parameters == [0]
+
+
+def test_key_boundaries_min_max():
+    assert key_boundaries(BoundaryJdbc(low=0, high=100), 'T', 'ID', 4) == [25, 50, 75]
+    # small ranges: no duplicate boundaries
+    assert key_boundaries(BoundaryJdbc(low=1, high=3), 'T', 'ID', 4) == [1, 2]
+    assert key_boundaries(BoundaryJdbc(low=0.0, high=1.0), 'T', 'ID', 2) == [0.5]
+    # not numeric, or an empty table
+    assert key_boundaries(BoundaryJdbc(low='A', high='Z'), 'T', 'ID', 4) == []
+    assert key_boundaries(BoundaryJdbc(), 'T', 'ID', 4) == []
+
+
+def test_key_ranges():
+    assert key_ranges([]) == [(None, None)]
+    assert key_ranges([10, 20]) == [(None, 10), (10, 20), (20, None)]
+
+
+def test_range_condition():
+    assert range_condition('ID', (None, None)) == ('', None)
+    assert range_condition('ID', (None, 10)) == ('ID <= ?', [10])
+    assert range_condition('ID', (10, None)) == ('ID > ?', [10])
+    assert range_condition('ID', (10, 20)) == ('ID > ? AND ID <= ?', [10, 20])
+
+
+def test_split_checkpoint(tmp_path):
+    directory = str(tmp_path / 'split')
+    checkpoint = SplitCheckpoint('T', 3, directory=directory)
+    assert not checkpoint.is_done(1, (None, 10))
+    checkpoint.mark_done(1, (None, 10), {'new': 10})
+    checkpoint.mark_done(2, (10, 20), {'new': 10})
+    assert checkpoint.is_done(1, (None, 10))
+    # different bounds (e.g., the table changed): not done
+    assert not checkpoint.is_done(2, (10, 25))
+    # other number of ranges
+    assert not SplitCheckpoint('T', 4, directory=directory).is_done(1, (None, 10))
+
+    # unreadable checkpoint
+    with open(os.path.join(directory, 'T.3-of-3.json'), 'w') as f:
+        f.write('{')
+    assert not checkpoint.is_done(3, (20, None))
+    checkpoint.clear()
+    assert not os.path.isdir(directory)
+
+
+def test_remove_checkpoints(tmp_path):
+    directory = checkpoint_directory(str(tmp_path / 'journal.json'))
+    assert directory == str(tmp_path / 'journal.split')
+    SplitCheckpoint('T', 2, directory=directory).mark_done(1, (None, 10), {'new': 10})
+    SplitCheckpoint('U', 2, directory=directory).mark_done(2, (10, None), {'new': 10})
+    remove_checkpoints(directory)
+    assert not os.path.isdir(directory)
+    # nothing to remove
+    remove_checkpoints(directory)
@@ -0,0 +1,126 @@
+"""
+    Tests of the subset conditions of db-copy without a database connection
+"""
+import pytest
+
+from argparse import Namespace
+
+from lwetl import SQLExecuteException
+from lwetl.programs.db_copy.subset import KeySets, parse_conditions, subset_conditions
+
+TABLES = ['CUSTOMER', 'ITEM', 'ORDERS', 'PRODUCT']
+
+# ORDERS -> CUSTOMER, ITEM -> ORDERS, ITEM -> PRODUCT
+TABLE_INFO = {
+    'ORDERS': {'CUSTOMER_ID': ('CUSTOMER', 'FK_ORDERS_CUSTOMER', 'ID')},
+    'ITEM': {'ORDER_ID': ('ORDERS', 'FK_ITEM_ORDERS', 'ID'), 'PRODUCT_ID': ('PRODUCT', 'FK_ITEM_PRODUCT', 'ID')}
+}
+
+PK_INFO = dict([(t, 'ID') for t in TABLES])
+
+
+def key_table(table: str, condition: str) -> str:
+    return 'ID IN (SELECT ID FROM LWK_{})'.format(table)
+
+
+def test_parse_conditions():
+    assert parse_conditions(['item: ID < 10', 'ITEM:V = 1'], TABLES) == {'ITEM': '(ID < 10) AND (V = 1)'}
+    with pytest.raises(ValueError):
+        parse_conditions(['ITEM'], TABLES)
+    with pytest.raises(ValueError):
+        parse_conditions(['UNKNOWN:ID < 10'], TABLES)
+
+
+def test_subset_parents():
+    conditions, skipped = subset_conditions(TABLES, TABLE_INFO, PK_INFO, {'ITEM': 'ID < 10'})
+    assert skipped == []
+    assert conditions == {
+        'ITEM': 'ID < 10',
+        'ORDERS': 'ID IN (SELECT ORDER_ID FROM ITEM WHERE ID < 10)',
+        'PRODUCT': 'ID IN (SELECT PRODUCT_ID FROM ITEM WHERE ID < 10)',
+        'CUSTOMER': 'ID IN (SELECT CUSTOMER_ID FROM ORDERS WHERE ID IN (SELECT ORDER_ID FROM ITEM WHERE ID < 10))'
+    }
+
+
+def test_subset_children():
+    conditions, _ = subset_conditions(TABLES, TABLE_INFO, PK_INFO, {'CUSTOMER': 'ID = 1'}, children=True)
+    assert conditions['ORDERS'] == 'CUSTOMER_ID IN (SELECT ID FROM CUSTOMER WHERE ID = 1)'
+    assert conditions['ITEM'] == 'ORDER_ID IN (SELECT ID FROM ORDERS WHERE {})'.format(conditions['ORDERS'])
+    # the parents of the selected children
+    assert conditions['PRODUCT'] == 'ID IN (SELECT PRODUCT_ID FROM ITEM WHERE {})'.format(conditions['ITEM'])
+    # without children, the root has no parents
+    conditions, _ = subset_conditions(TABLES, TABLE_INFO, PK_INFO, {'CUSTOMER': 'ID = 1'})
+    assert conditions == {'CUSTOMER': 'ID = 1'}
+
+
+def test_subset_materialize():
+    # each derived condition refers to the key table of its own table only
+    resolved = []
+    conditions, _ = subset_conditions(TABLES, TABLE_INFO, PK_INFO, {'CUSTOMER': 'ID = 1'}, children=True,
+                                      materialize=lambda t, c: resolved.append((t, c)) or key_table(t, c))
+    assert conditions == {
+        'CUSTOMER': 'ID = 1',
+        'ORDERS': key_table('ORDERS', ''),
+        'ITEM': key_table('ITEM', ''),
+        'PRODUCT': key_table('PRODUCT', '')
+    }
+    # in dependency order
+    assert resolved == [
+        ('ORDERS', 'CUSTOMER_ID IN (SELECT ID FROM CUSTOMER WHERE ID = 1)'),
+        ('ITEM', 'ORDER_ID IN (SELECT ID FROM ORDERS WHERE ID IN (SELECT ID FROM LWK_ORDERS))'),
+        ('PRODUCT', 'ID IN (SELECT PRODUCT_ID FROM ITEM WHERE ID IN (SELECT ID FROM LWK_ITEM))')
+    ]
+
+
+def test_subset_cycle():
+    table_info = {'A': {'B_ID': ('B', 'FK_A_B', 'ID')}, 'B': {'A_ID': ('A', 'FK_B_A', 'ID')}}
+    conditions, skipped = subset_conditions(['A', 'B'], table_info, {'A': 'ID', 'B': 'ID'}, {'A': 'ID = 1'})
+    assert conditions == {'A': 'ID = 1', 'B': 'ID IN (SELECT B_ID FROM A WHERE ID = 1)'}
+    assert skipped == [('B', 'A_ID')]
+
+
+class KeyTableJdbc:
+    """
+    Source database stand-in, which records the executed statements
+    """
+
+    def __init__(self, read_only: bool = False):
+        self.type = 'postgresql'
+        self.read_only = read_only
+        self.statements = []
+
+    def execute(self, sql: str, parameters: list = None, cursor=None):
+        if self.read_only and not sql.startswith('DROP'):
+            raise SQLExecuteException('Read-only connection.')
+        self.statements.append(sql)
+        return Namespace(rowcount=1)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def test_key_sets():
+    jdbc = KeyTableJdbc()
+    key_sets = KeySets(jdbc, PK_INFO)
+    assert key_sets.materialize('ORDERS', 'CUSTOMER_ID = 1') == 'ID IN (SELECT ID FROM LWK_ORDERS)'
+    assert key_sets.materialize('ORDERS', 'CUSTOMER_ID = 2') == 'ID IN (SELECT ID FROM LWK_ORDERS)'
+    assert jdbc.statements == [
+        'DROP TABLE LWK_ORDERS',
+        'CREATE TABLE LWK_ORDERS AS SELECT ID FROM ORDERS WHERE CUSTOMER_ID = 1',
+        'INSERT INTO LWK_ORDERS (ID) SELECT ID FROM ORDERS WHERE (CUSTOMER_ID = 2) '
+        'AND ID NOT IN (SELECT ID FROM LWK_ORDERS)'
+    ]
+    # tables without a primary key keep the condition
+    assert key_sets.materialize('HISTORY', 'ORDER_ID = 1') == 'ORDER_ID = 1'
+    key_sets.drop()
+    assert jdbc.statements[-1] == 'DROP TABLE LWK_ORDERS'
+    assert key_sets.tables == dict()
+
+
+def test_key_sets_read_only():
+    key_sets = KeySets(KeyTableJdbc(read_only=True), PK_INFO)
+    assert key_sets.materialize('ORDERS', 'CUSTOMER_ID = 1') == 'CUSTOMER_ID = 1'
+    assert key_sets.tables == dict()
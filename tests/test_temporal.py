@@ -0,0 +1,63 @@
+"""
+    Tests of the date and time conversions without a JVM
+"""
+import pytest
+
+from datetime import datetime, timedelta, timezone
+
+from lwetl.temporal import ZONE_UTC, parse_datetime, check_zone, to_epoch_seconds, to_epoch_millis, \
+    to_epoch_nanos, from_epoch_millis, from_epoch_nanos, to_naive
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2024-02-29', datetime(2024, 2, 29)),
+    ('2024-02-29 13:45', datetime(2024, 2, 29, 13, 45)),
+    ('2024-02-29T13:45:07', datetime(2024, 2, 29, 13, 45, 7)),
+    ('2024-02-29 13:45:07.5', datetime(2024, 2, 29, 13, 45, 7, 500000)),
+    ('2024-02-29 13:45:07,123456789', datetime(2024, 2, 29, 13, 45, 7, 123456)),
+    ('  2024-02-29 13:45:07  ', datetime(2024, 2, 29, 13, 45, 7)),
+    ('2024-02-29T13:45:07Z', datetime(2024, 2, 29, 13, 45, 7, tzinfo=timezone.utc)),
+    ('2024-02-29T13:45:07+02:00', datetime(2024, 2, 29, 13, 45, 7, tzinfo=timezone(timedelta(hours=2)))),
+    ('2024-02-29T13:45:07-0530', datetime(2024, 2, 29, 13, 45, 7, tzinfo=timezone(-timedelta(hours=5, minutes=30)))),
+    ('2024-02-29 13:45:07 +01', datetime(2024, 2, 29, 13, 45, 7, tzinfo=timezone(timedelta(hours=1)))),
+    # not ISO 8601: parsed by dateutil
+    ('29 Feb 2024 13:45', datetime(2024, 2, 29, 13, 45)),
+])
+def test_parse_datetime(value, expected):
+    parsed = parse_datetime(value)
+    assert parsed == expected
+    assert parsed.tzinfo == expected.tzinfo
+
+
+@pytest.mark.parametrize('value', ['2024-02-30', '2024-13-01 00:00', 'not a date'])
+def test_parse_datetime_invalid(value):
+    with pytest.raises(ValueError):
+        parse_datetime(value)
+
+
+def test_check_zone():
+    assert check_zone(ZONE_UTC) == ZONE_UTC
+    with pytest.raises(ValueError):
+        check_zone('cet')
+
+
+def test_epoch_utc():
+    value = datetime(2024, 2, 29, 13, 45, 7, 123456)
+    assert to_epoch_seconds(value, ZONE_UTC) == 1709214307
+    assert to_epoch_seconds(value.replace(tzinfo=timezone.utc)) == 1709214307
+    assert to_epoch_seconds(value.replace(tzinfo=timezone(timedelta(hours=1)))) == 1709214307 - 3600
+    assert from_epoch_millis(to_epoch_millis(value, ZONE_UTC), ZONE_UTC) == value.replace(microsecond=123000)
+    assert from_epoch_nanos(to_epoch_nanos(value, ZONE_UTC), ZONE_UTC) == value
+
+
+def test_epoch_local():
+    value = datetime(2024, 2, 29, 13, 45, 7, 250000)
+    assert from_epoch_nanos(to_epoch_nanos(value)) == value
+
+
+def test_to_naive():
+    value = datetime(2024, 2, 29, 13, 45, 7)
+    assert to_naive(value, ZONE_UTC) is value
+    assert to_naive(value.replace(tzinfo=timezone(timedelta(hours=2))), ZONE_UTC) == datetime(2024, 2, 29, 11, 45, 7)
+    aware = value.replace(tzinfo=timezone.utc)
+    assert to_naive(aware) == datetime.fromtimestamp(to_epoch_seconds(aware))
@@ -0,0 +1,278 @@
+"""
+    Tests of the uploaders without a database connection
+"""
+import lwetl
+import pytest
+
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from lwetl.runtime_statistics import RuntimeStatistics
+
+
+class OfflineJdbc:
+    """
+    Stand-in for a Jdbc connection: records the commits and rollbacks, no SQL is executed
+    """
+
+    def __init__(self, db_type: str, auto_commit: bool = False):
+        self.type = db_type
+        self.auto_commit = auto_commit
+        self.login = 'nobody'
+        self.upper_case = True
+        self.always_escape = False
+        self.statistics = RuntimeStatistics()
+        self.loaded = []
+        self.transactions = []
+
+    def commit(self):
+        self.transactions.append('commit')
+
+    def rollback(self, savepoint=None):
+        if savepoint is None:
+            self.transactions.append('rollback')
+
+    def set_savepoint(self):
+        return None if self.auto_commit else object()
+
+    def release_savepoint(self, savepoint):
+        pass
+
+
+def fake_bulk_loader(uploader: lwetl.BulkUploader, jdbc: OfflineJdbc):
+    """
+    Bulk loader, which fails on the value 'BAD'
+    """
+
+    def load(keys: list) -> int:
+        data = b''.join(uploader._serialize_buffer(uploader._csv_value, ',')).decode('utf-8')
+        if '"BAD"' in data:
+            raise ValueError('invalid value in: ' + ','.join(keys))
+        lines = [line for line in data.split('\n') if line]
+        jdbc.loaded += lines
+        return len(lines)
+
+    return load
+
+
+def test_bulk_bisect():
+    jdbc = OfflineJdbc('postgresql')
+    columns = OrderedDict([('ID', lwetl.jdbc.COLUMN_TYPE_NUMBER), ('NAME', lwetl.jdbc.COLUMN_TYPE_STRING)])
+    with lwetl.BulkUploader(jdbc, 'LWETL_TEST', commit_mode=lwetl.UPLOAD_MODE_COMMIT, columns=columns,
+                            bisect=True, batch_size=10) as upl:
+        upl.bulk_loader = fake_bulk_loader(upl, jdbc)
+        for x in range(7):
+            upl.insert_row(('ID', 'NAME'), (x, 'BAD' if x == 4 else 'name {}'.format(x)))
+        upl.commit()
+        rejected = upl.pop_rejected_rows()
+    assert len(jdbc.loaded) == 6
+    assert [r[1]['ID'] for r in rejected] == [4]
+    assert upl.total_row_count == 6
+
+
+def test_bulk_failure_without_exit_on_fail():
+    jdbc = OfflineJdbc('postgresql')
+    columns = OrderedDict([('ID', lwetl.jdbc.COLUMN_TYPE_NUMBER), ('NAME', lwetl.jdbc.COLUMN_TYPE_STRING)])
+    with lwetl.BulkUploader(jdbc, 'LWETL_TEST', commit_mode=lwetl.UPLOAD_MODE_COMMIT, columns=columns,
+                            exit_on_fail=False, batch_size=2) as upl:
+        upl.bulk_loader = fake_bulk_loader(upl, jdbc)
+        upl.insert_row(('ID', 'NAME'), (1, 'name 1'))
+        upl.insert_row(('ID', 'NAME'), (2, 'name 2'))
+        upl.insert_row(('ID', 'NAME'), (3, 'BAD'))
+        upl.insert_row(('ID', 'NAME'), (4, 'name 4'))
+        upl.commit()
+    # the failed batch is logged, the other batches are committed
+    assert len(jdbc.loaded) == 2
+    assert jdbc.transactions == ['commit']
+
+
+class RecordingUploader:
+    """
+    Uploader stand-in, which records the operations. Fails on the value 'BAD'
+    """
+
+    def __init__(self):
+        self.jdbc = OfflineJdbc('sqlite')
+        self.commit_mode = lwetl.UPLOAD_MODE_COMMIT
+        self.table = 'LWETL_TEST'
+        self.has_sql_errors = False
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.commit()
+
+    def insert(self, data: dict):
+        if data.get('NAME') == 'BAD':
+            raise ValueError('invalid name')
+        self.rows.append(data)
+
+    def commit(self):
+        if self.has_sql_errors:
+            self.jdbc.rollback()
+        else:
+            self.jdbc.commit()
+
+
+def test_write_behind_failure():
+    uploader = RecordingUploader()
+    error = None
+    try:
+        with lwetl.WriteBehindUploader(uploader, chunk_size=2) as wbu:
+            for x in range(4):
+                wbu.insert({'ID': x, 'NAME': 'BAD' if x == 1 else 'name {}'.format(x)})
+            try:
+                wbu.join()
+            except ValueError:
+                pass
+            # operations after the failure are skipped, including the commit
+            wbu.insert({'ID': 10, 'NAME': 'name 10'})
+            wbu.commit()
+    except ValueError as exit_error:
+        error = exit_error
+    assert error is None
+    assert [r['ID'] for r in uploader.rows] == [0]
+    assert 'commit' not in uploader.jdbc.transactions
+    assert uploader.jdbc.transactions[-1] == 'rollback'
+
+
+def test_multi_row_dry_run_count():
+    jdbc = OfflineJdbc('postgresql')
+    columns = OrderedDict([('ID', lwetl.jdbc.COLUMN_TYPE_NUMBER), ('NAME', lwetl.jdbc.COLUMN_TYPE_STRING)])
+    with lwetl.MultiRowUploader(jdbc, 'LWETL_TEST', columns=columns, max_statement_rows=3, batch_size=0,
+                                batch_bytes=0) as upl:
+        for x in range(7):
+            upl.insert_row(('ID', 'NAME'), (x, 'name {}'.format(x)))
+        upl.flush()
+        # three statements of 3, 3 and 1 rows
+        assert upl.total_row_count == 7
+        assert upl.row_count == 7
+        upl.commit()
+
+
+def test_multi_row_separate_byte_budgets():
+    jdbc = OfflineJdbc('mysql')
+    columns = OrderedDict([('ID', lwetl.jdbc.COLUMN_TYPE_NUMBER), ('NAME', lwetl.jdbc.COLUMN_TYPE_STRING)])
+    with lwetl.MultiRowUploader(jdbc, 'LWETL_TEST', columns=columns, batch_size=0, batch_bytes=0) as upl:
+        upl.max_packet_size = 4000
+        # large updates do not count in the estimate of the insert rows
+        upl.update({'NAME': 'x' * 1000}, {'ID': 2})
+        assert upl.buffer_size == 0
+        assert upl.statement_bytes > 1000
+        # the insert flushes the update
+        upl.insert_row(('ID', 'NAME'), (1, 'a'))
+        assert upl.statement_bytes == 0
+        assert upl.rows_per_statement(2) == (3 * 4000 // 4) // (32 + upl.buffer_size)
+        upl.flush()
+        assert upl.buffer_size == upl.statement_bytes == 0
+        upl.commit()
+
+
+def test_upsert_column_signatures():
+    jdbc = OfflineJdbc('postgresql')
+    columns = OrderedDict([('ID', lwetl.jdbc.COLUMN_TYPE_NUMBER), ('NAME', lwetl.jdbc.COLUMN_TYPE_STRING),
+                           ('REMARK', lwetl.jdbc.COLUMN_TYPE_STRING)])
+    with lwetl.UpsertUploader(jdbc, 'LWETL_TEST', columns=columns, key_columns='ID', batch_size=0) as upl:
+        statements = []
+        upl._insert_or_update = lambda sql, parameters, **kwargs: statements.append((sql, parameters))
+        upl.insert({'ID': 1, 'NAME': 'name 1', 'REMARK': 'remark 1'})
+        upl.insert({'ID': 2, 'NAME': 'name 2'})
+        upl.insert({'ID': 3, 'NAME': 'name 3'})
+        upl.flush()
+    # the rows without a REMARK do not set it to NULL
+    assert statements == [
+        ('INSERT INTO LWETL_TEST (ID,NAME,REMARK) VALUES (?,?,?) ON CONFLICT (ID) DO UPDATE SET '
+         'NAME = EXCLUDED.NAME, REMARK = EXCLUDED.REMARK', [[1, 'name 1', 'remark 1']]),
+        ('INSERT INTO LWETL_TEST (ID,NAME) VALUES (?,?) ON CONFLICT (ID) DO UPDATE SET NAME = EXCLUDED.NAME',
+         [[2, 'name 2'], [3, 'name 3']])
+    ]
+
+
+def test_bulk_serialize_chunks(monkeypatch):
+    monkeypatch.setattr(lwetl.uploader, 'BULK_STREAM_CHUNK_ROWS', 2)
+    columns = OrderedDict([('ID', lwetl.jdbc.COLUMN_TYPE_NUMBER), ('NAME', lwetl.jdbc.COLUMN_TYPE_STRING)])
+    upl = lwetl.BulkUploader(OfflineJdbc('postgresql'), 'LWETL_TEST', columns=columns)
+    for x in range(5):
+        upl.insert_row(('ID', 'NAME'), (x, 'name {}'.format(x)))
+    chunks = list(upl._serialize_buffer(upl._csv_value, ','))
+    assert len(chunks) == 3
+    assert chunks[2] == b'"4","name 4"\n'
+
+
+def test_bulk_direct_path_commit():
+    jdbc = OfflineJdbc('oracle')
+    columns = OrderedDict([('ID', lwetl.jdbc.COLUMN_TYPE_NUMBER), ('NAME', lwetl.jdbc.COLUMN_TYPE_STRING)])
+    upl = lwetl.BulkUploader(jdbc, 'LWETL_TEST', commit_mode=lwetl.UPLOAD_MODE_COMMIT, columns=columns,
+                             direct_path=True)
+    statements = []
+    upl._insert_or_update = lambda sql, parameters, **kwargs: statements.append(sql)
+    upl.insert_row(('ID', 'NAME'), (1, 'name 1'))
+    upl.flush()
+    # the flush does not commit
+    assert jdbc.transactions == []
+    upl.insert_row(('ID', 'NAME'), (2, 'name 2'))
+    with pytest.raises(lwetl.SQLExecuteException):
+        upl.flush()
+    upl.commit()
+    assert jdbc.transactions == ['commit']
+    upl.insert_row(('ID', 'NAME'), (3, 'name 3'))
+    upl.flush()
+    assert len(statements) == 2 and 'APPEND_VALUES' in statements[1]
+
+
+def test_insert_row_omits_none():
+    columns = OrderedDict([('ID', lwetl.jdbc.COLUMN_TYPE_NUMBER), ('NAME', lwetl.jdbc.COLUMN_TYPE_STRING),
+                           ('CREATED', lwetl.jdbc.COLUMN_TYPE_DATE)])
+    upl = lwetl.ParameterUploader(OfflineJdbc('postgresql'), 'LWETL_TEST', columns=columns)
+    statements = []
+    upl._insert_or_update = lambda sql, parameters, **kwargs: statements.append((sql, parameters))
+    upl.insert_row(('ID', 'NAME', 'CREATED'), (1, 'name 1', None))
+    upl.insert({'ID': 2, 'NAME': 'name 2', 'CREATED': None})
+    # the default of CREATED applies
+    assert statements == [
+        ('INSERT INTO LWETL_TEST (ID,NAME) VALUES (?,?)', [1, 'name 1']),
+        ('INSERT INTO LWETL_TEST (ID,NAME) VALUES (?,?)', [2, 'name 2'])
+    ]
+
+
+def test_bulk_bisect_auto_commit():
+    jdbc = OfflineJdbc('postgresql', auto_commit=True)
+    columns = OrderedDict([('ID', lwetl.jdbc.COLUMN_TYPE_NUMBER), ('NAME', lwetl.jdbc.COLUMN_TYPE_STRING)])
+    upl = lwetl.BulkUploader(jdbc, 'LWETL_TEST', commit_mode=lwetl.UPLOAD_MODE_COMMIT, columns=columns,
+                             bisect=True, batch_size=10)
+    upl.bulk_loader = fake_bulk_loader(upl, jdbc)
+    attempts = []
+    load = upl.bulk_loader
+    upl.bulk_loader = lambda keys: attempts.append(len(upl.data_buffer)) or load(keys)
+    for x in range(4):
+        upl.insert_row(('ID', 'NAME'), (x, 'BAD' if x == 2 else 'name {}'.format(x)))
+    # without a savepoint, the failed batch is not split and sent again
+    with pytest.raises(lwetl.SQLExecuteException):
+        upl.flush()
+    assert attempts == [4]
+    assert not upl.bisect
+
+
+def test_multi_parameter_operation_order():
+    columns = OrderedDict([('ID', lwetl.jdbc.COLUMN_TYPE_NUMBER), ('NAME', lwetl.jdbc.COLUMN_TYPE_STRING)])
+    upl = lwetl.MultiParameterUploader(OfflineJdbc('postgresql'), 'LWETL_TEST', columns=columns, batch_size=0)
+    statements = []
+    upl._insert_or_update = lambda sql, parameters, **kwargs: statements.append(sql.split()[0])
+    upl.delete({'ID': 1})
+    upl.insert({'ID': 1, 'NAME': 'name 1'})
+    upl.insert({'ID': 2, 'NAME': 'name 2'})
+    upl.update({'NAME': 'other'}, {'ID': 2})
+    upl.flush()
+    # the buffer is flushed on each change of the operation: the order is kept
+    assert statements == ['DELETE', 'INSERT', 'UPDATE']
+
+
+def test_native_date_with_offset():
+    columns = OrderedDict([('ID', lwetl.jdbc.COLUMN_TYPE_NUMBER), ('CREATED', lwetl.jdbc.COLUMN_TYPE_DATE)])
+    upl = lwetl.NativeUploader(OfflineJdbc('postgresql'), 'LWETL_TEST', columns=columns, zone='utc')
+    created = datetime(2024, 2, 29, 13, 45, 7, tzinfo=timezone(timedelta(hours=2)))
+    # the UTC offset is applied, not dropped
+    assert upl._convert_date(created) == "'2024-02-29 11:45:07.000000000'"
+    assert upl._convert_date(0.0) == "'1970-01-01 00:00:00.000000000'"